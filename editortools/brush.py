@@ -1158,8 +1158,4 @@ def createTileEntities(block, box, chunk):
     tileEntity = TileEntity.stringNames[block.stringID]
     for (x, y, z) in box.positions:
         if chunk.world.blockAt(x, y, z) == block.ID:
-            if chunk.tileEntityAt(x, y, z):
-                chunk.removeTileEntitiesInBox(BoundingBox((x, y, z), (1, 1, 1)))
-            tileEntityObject = TileEntity.Create(tileEntity, (x, y, z))
-            chunk.TileEntities.append(tileEntityObject)
-            chunk._fakeEntities = None
+            chunk.addTileEntity(TileEntity.Create(tileEntity, (x, y, z)))
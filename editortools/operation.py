@@ -3,14 +3,13 @@ import atexit
 import os
 import shutil
 import tempfile
-import albow
-from albow.translate import _
 from pymclevel import BoundingBox
 import numpy
 from albow.root import Cancel
 import pymclevel
 from albow import showProgress
 from pymclevel.mclevelbase import exhaust
+from pymclevel.undo import UndoChangeset
 
 undo_folder = os.path.join(tempfile.gettempdir(), "mcedit_undo", str(os.getpid()))
 
@@ -49,30 +48,12 @@ class Operation(object):
 
             return self.extractUndoSchematic(level, box)
 
-        undoLevel = pymclevel.MCInfdevOldLevel(mkundotemp(), create=True)
-        if not chunkCount:
-            try:
-                chunkCount = len(chunks)
-            except TypeError:
-                chunkCount = -1
-
-        def _extractUndo():
-            yield 0, 0, "Recording undo..."
-            for i, (cx, cz) in enumerate(chunks):
-                undoLevel.copyChunkFrom(level, cx, cz)
-                yield i, chunkCount, _("Copying chunk %s...") % ((cx, cz),)
-            undoLevel.saveInPlace()
-
-        if chunkCount > 25 or chunkCount < 1:
-            if "Canceled" == showProgress("Recording undo...", _extractUndo(), cancel=True):
-                if albow.ask("Continue with undo disabled?", ["Continue", "Cancel"]) == "Cancel":
-                    raise Cancel
-                else:
-                    return None
-        else:
-            exhaust(_extractUndo())
-
-        return undoLevel
+        # The level's undo journal records each chunk as the operation first touches it, and keeps only the
+        # sections that changed once commitUndo() is called.
+        journal = level.undoJournal
+        if journal.folder is None:
+            journal.folder = mkundotemp()
+        return journal.begin()
 
     @staticmethod
     def extractUndoSchematic(level, box):
@@ -91,11 +72,21 @@ class Operation(object):
     def perform(self, recordUndo=True):
         " Perform the operation. Record undo information if recordUndo"
 
+    def commitUndo(self):
+        """ Called once perform() has returned. Stops recording changes into the level's undo journal. """
+        if isinstance(self.undoLevel, UndoChangeset):
+            self.undoLevel.commit()
+
     def undo(self):
         """ Undo the operation. Ought to leave the Operation in a state where it can be performed again.
             Default implementation copies all chunks in undoLevel back into level. Non-chunk-based operations
             should override this."""
 
+        if isinstance(self.undoLevel, UndoChangeset):
+            self.redoLevel = self.undoLevel
+            self._applyChangeset(self.undoLevel.undoIter(), "Undoing...")
+            return
+
         if self.undoLevel:
             self.redoLevel = self.extractUndo(self.level, self.dirtyBox())
 
@@ -118,6 +109,10 @@ class Operation(object):
             self.editor.invalidateChunks(self.undoLevel.allChunks)
 
     def redo(self):
+        if isinstance(self.redoLevel, UndoChangeset):
+            self._applyChangeset(self.redoLevel.redoIter(), "Redoing...")
+            return
+
         if self.redoLevel:
             def _redo():
                 yield 0, 0, "Redoing..."
@@ -135,6 +130,15 @@ class Operation(object):
             else:
                 exhaust(_redo())
 
+    def _applyChangeset(self, applyIter, status):
+        changeset = self.undoLevel
+        if changeset.chunkCount > 25:
+            showProgress(status, applyIter)
+        else:
+            exhaust(applyIter)
+
+        self.editor.invalidateChunks(changeset.chunkPositions)
+
     def dirtyBox(self):
         """ The region modified by the operation.
         Return None to indicate no blocks were changed.
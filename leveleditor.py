@@ -95,6 +95,7 @@ from mcplatform import askSaveFile
 from pymclevel.minecraft_server import alphanum_key  # ?????
 from renderer import MCRenderer
 from pymclevel.entity import Entity
+from pymclevel.level import getSectionSlices
 from pymclevel.infiniteworld import AnvilWorldFolder, SessionLockLost, MCAlphaDimension,\
     MCInfdevOldLevel
 # Block and item translation
@@ -698,10 +699,17 @@ class LevelEditor(GLViewport):
             for (chunk, slices, point) in level.getChunkSlices(box):
                 i += 1
                 yield i, box.chunkCount
-                blocks = numpy.array(chunk.Blocks[slices], dtype='uint16')
-                blocks |= (numpy.array(chunk.Data[slices], dtype='uint16') << 12)
-                b = numpy.bincount(blocks.ravel())
-                types[:b.shape[0]] = types[:b.shape[0]].astype(int) + b
+                # sections holding only air are counted as air without reading them
+                sx, sz, sy = slices
+                airCount = len(xrange(*sx.indices(16))) * len(xrange(*sz.indices(16))) * \
+                    len(xrange(*sy.indices(chunk.Height)))
+                for sectionSlices, _ in getSectionSlices(chunk, slices, point):
+                    blocks = numpy.array(chunk.Blocks[sectionSlices], dtype='uint16')
+                    blocks |= (numpy.array(chunk.Data[sectionSlices], dtype='uint16') << 12)
+                    b = numpy.bincount(blocks.ravel())
+                    types[:b.shape[0]] = types[:b.shape[0]].astype(int) + b
+                    airCount -= blocks.size
+                types[0] += airCount
 
                 for ent in chunk.getEntitiesInBox(box):
                     entID = level.__class__.entityClass.getId(ent["id"].value)
@@ -1392,7 +1400,11 @@ class LevelEditor(GLViewport):
             count = [0]
 
             def copyChunks():
-                for _ in self.level.saveInPlaceGen():
+                for progress in self.level.saveInPlaceGen():
+                    # levels that can tell how much is left to save report it themselves
+                    if progress is not None:
+                        yield progress
+                        continue
                     count[0] += 1
                     yield count[0], chunks
 
@@ -3130,6 +3142,8 @@ class LevelEditor(GLViewport):
         except MemoryError:
             self.invalidateAllChunks()
             op.perform(self.recordUndo)
+        finally:
+            op.commitUndo()
 
     def quit(self):
         if config.settings.savePositionOnClose.get():
@@ -3,17 +3,19 @@ import pymclevel.mclevelbase
 import pymclevel.mclevel
 import pymclevel.materials
 import pymclevel.infiniteworld
+from pymclevel.scan import countBlocks, scanChunks
 import sys
 import os
 from pymclevel.box import BoundingBox, Vector
 import numpy
-from numpy import zeros, bincount
+from numpy import zeros
 import logging
 import itertools
 import traceback
 import shlex
 import operator
 import codecs
+import functools
 
 from math import floor
 
@@ -40,6 +42,39 @@ class PlayerNotFound(RuntimeError):
     pass
 
 
+# Chunk scanners for mce.scanChunks. They run in worker processes, so they live at module level and return plain data.
+
+def signsInChunk(chunk):
+    return [(map(lambda x: tileEntity[x].value, "xyz"), [tileEntity["Text{0}".format(i + 1)].value for i in range(4)])
+            for tileEntity in chunk.TileEntities if tileEntity["id"].value == "Sign"]
+
+
+def chestsInChunk(chunk):
+    return [(map(lambda x: tileEntity[x].value, "xyz"),
+             [(itemTag["Count"].value, itemTag["id"].value, itemTag["Damage"].value) for itemTag in tileEntity["Items"]])
+            for tileEntity in chunk.TileEntities if tileEntity["id"].value == "Chest"]
+
+
+ENT_MATCHTYPE_ANY = 0
+ENT_MATCHTYPE_EXCEPT = 1
+ENT_MATCHTYPE_NONPAINTING = 2
+
+
+def entityMatches(entityID, matchType, matchWords):
+    if ENT_MATCHTYPE_ANY == matchType:
+        return entityID.lower() in matchWords
+    elif ENT_MATCHTYPE_EXCEPT == matchType:
+        return not (entityID.lower() in matchWords)
+    else:
+        # ENT_MATCHTYPE_NONPAINTING == matchType
+        return entityID != "Painting"
+
+
+def matchingEntitiesInChunk(matchType, matchWords, chunk):
+    return [(chunk.chunkPosition, entity["id"].value) for entity in chunk.Entities
+            if entityMatches(entity["id"].value, matchType, matchWords)]
+
+
 class mce(object):
     """
     Block commands:
@@ -78,6 +113,12 @@ class mce(object):
        {commandPrefix}randomseed [ <seed> ]
        {commandPrefix}gametype [ <player> [ <gametype> ] ]
 
+    Options:
+       mce.py --jobs <N> <world> ...
+
+       analyze, dumpSigns, dumpChests and removeEntities scan the world
+       with N worker processes, one per CPU by default.
+
     Editor commands:
        {commandPrefix}save
        {commandPrefix}reload
@@ -279,6 +320,7 @@ class mce(object):
 
     @staticmethod
     def readBlocksToCopy(command):
+        """ Returns the block IDs to copy, or None to copy every block. """
         blocksToCopy = range(materials.id_limit)
         while len(command):
             word = command.pop()
@@ -288,6 +330,8 @@ class mce(object):
                 blocksToCopy.remove(8)
                 blocksToCopy.remove(9)
 
+        if len(blocksToCopy) == materials.id_limit:
+            return None
         return blocksToCopy
 
     @staticmethod
@@ -454,22 +498,9 @@ class mce(object):
 
         Counts all of the block types in every chunk of the world.
         """
-        blockCounts = zeros((65536,), 'uint64')
-
         print "Analyzing {0} chunks...".format(self.level.chunkCount)
-        # for input to bincount, create an array of uint16s by
-        # shifting the data left and adding the blocks
-
-        for i, cPos in enumerate(self.level.allChunks, 1):
-            ch = self.level.getChunk(*cPos)
-            btypes = numpy.array(ch.Data.ravel(), dtype='uint16')
-            btypes <<= 12
-            btypes += ch.Blocks.ravel()
-            counts = bincount(btypes)
-
-            blockCounts[:counts.shape[0]] += counts
-            if i % 100 == 0:
-                logging.info("Chunk {0}...".format(i))
+        # blocks are counted by data << 12 | ID
+        blockCounts = self.scanChunks(countBlocks, initial=zeros((65536,), 'uint64'))
 
         for blockID in range(materials.id_limit):
             for data in range(16):
@@ -527,7 +558,7 @@ class mce(object):
 
         importLevel = mclevel.fromFile(filename)
 
-        self.level.copyBlocksFrom(importLevel, importLevel.bounds, destPoint, blocksToCopy, create=True)
+        self.level.copyBlocksFrom(importLevel, importLevel.bounds, destPoint, blocksToCopy, create=True, biomes=True)
 
         self.needsSave = True
         print "Imported {0} blocks.".format(importLevel.bounds.volume)
@@ -610,27 +641,14 @@ class mce(object):
         outFile = codecs.open(filename, "w", encoding='utf-8-sig')
 
         print "Dumping signs..."
-        signCount = 0
-
-        for i, cPos in enumerate(self.level.allChunks):
-            try:
-                chunk = self.level.getChunk(*cPos)
-            except mclevelbase.ChunkMalformed:
-                continue
-
-            for tileEntity in chunk.TileEntities:
-                if tileEntity["id"].value == "Sign":
-                    signCount += 1
-
-                    outFile.write(str(map(lambda x: tileEntity[x].value, "xyz")) + "\n")
-                    for i in range(4):
-                        signText = tileEntity["Text{0}".format(i + 1)].value
-                        outFile.write(signText + u"\n")
+        signs = self.scanChunks(signsInChunk, initial=[])
 
-            if i % 100 == 0:
-                print "Chunk {0}...".format(i)
+        for pos, signTexts in signs:
+            outFile.write(str(pos) + "\n")
+            for signText in signTexts:
+                outFile.write(signText + u"\n")
 
-        print "Dumped {0} signs to {1}".format(signCount, filename)
+        print "Dumped {0} signs to {1}".format(len(signs), filename)
 
         outFile.close()
 
@@ -769,39 +787,24 @@ class mce(object):
         outFile = file(filename, "w")
 
         print "Dumping chests..."
-        chestCount = 0
+        chests = self.scanChunks(chestsInChunk, initial=[])
 
-        for i, cPos in enumerate(self.level.allChunks):
-            try:
-                chunk = self.level.getChunk(*cPos)
-            except mclevelbase.ChunkMalformed:
-                continue
-
-            for tileEntity in chunk.TileEntities:
-                if tileEntity["id"].value == "Chest":
-                    chestCount += 1
-
-                    outFile.write(str(map(lambda x: tileEntity[x].value, "xyz")) + "\n")
-                    itemsTag = tileEntity["Items"]
-                    if len(itemsTag):
-                        for itemTag in itemsTag:
-                            try:
-                                id = itemTag["id"].value
-                                damage = itemTag["Damage"].value
-                                item = items.findItem(id, damage)
-                                itemname = item.name
-                            except KeyError:
-                                itemname = "Unknown Item {0}".format(itemTag)
-                            except Exception, e:
-                                itemname = repr(e)
-                            outFile.write("{0} {1}:{2}\n".format(itemTag["Count"].value, itemname, itemTag["Damage"].value))
-                    else:
-                        outFile.write("Empty Chest\n")
-
-            if i % 100 == 0:
-                print "Chunk {0}...".format(i)
+        for pos, chestItems in chests:
+            outFile.write(str(pos) + "\n")
+            if len(chestItems):
+                for count, id, damage in chestItems:
+                    try:
+                        item = items.findItem(id, damage)
+                        itemname = item.name
+                    except KeyError:
+                        itemname = "Unknown Item {0}:{1}".format(id, damage)
+                    except Exception, e:
+                        itemname = repr(e)
+                    outFile.write("{0} {1}:{2}\n".format(count, itemname, damage))
+            else:
+                outFile.write("Empty Chest\n")
 
-        print "Dumped {0} chests to {1}".format(chestCount, filename)
+        print "Dumped {0} chests to {1}".format(len(chests), filename)
 
         outFile.close()
 
@@ -826,19 +829,6 @@ class mce(object):
 
     Known Dynamic Tile Entity IDs: PrimedTnt FallingSand
     """
-        ENT_MATCHTYPE_ANY = 0
-        ENT_MATCHTYPE_EXCEPT = 1
-        ENT_MATCHTYPE_NONPAINTING = 2
-
-        def match(entityID, matchType, matchWords):
-            if ENT_MATCHTYPE_ANY == matchType:
-                return entityID.lower() in matchWords
-            elif ENT_MATCHTYPE_EXCEPT == matchType:
-                return not (entityID.lower() in matchWords)
-            else:
-                # ENT_MATCHTYPE_EXCEPT == matchType
-                return entityID != "Painting"
-
         removedEntities = {}
         match_words = []
 
@@ -857,14 +847,17 @@ class mce(object):
             print "Removing all entities except Painting..."
             match_type = ENT_MATCHTYPE_NONPAINTING
 
-        for cx, cz in self.level.allChunks:
+        # find the chunks holding matching entities first, then only load those to remove them
+        matches = self.scanChunks(functools.partial(matchingEntitiesInChunk, match_type, match_words), initial=[])
+
+        for cx, cz in set(cPos for cPos, entityID in matches):
             chunk = self.level.getChunk(cx, cz)
             entitiesRemoved = 0
 
             for entity in list(chunk.Entities):
                 entityID = entity["id"].value
 
-                if match(entityID, match_type, match_words):
+                if entityMatches(entityID, match_type, match_words):
                     removedEntities[entityID] = removedEntities.get(entityID, 0) + 1
 
                     chunk.Entities.remove(entity)
@@ -1354,6 +1347,19 @@ class mce(object):
 
             print "{idstring:9} : {name} {aka}".format(idstring=idstring, name=b.name, aka=aka)
 
+    jobs = None
+
+    def scanChunks(self, mapChunk, initial=None):
+        """
+        Runs mapChunk over every chunk in the level with self.jobs worker processes and returns the combined results.
+        See pymclevel.scan.
+        """
+
+        def progress(done, total):
+            print "Chunk {0} of {1}...".format(done, total)
+
+        return scanChunks(self.level, mapChunk, initial=initial, jobs=self.jobs, progress=progress)
+
     def printUsage(self, command=""):
         if command.lower() in self.commands:
             print "Usage: ", self.commandUsage(command.lower())
@@ -1382,6 +1388,10 @@ class mce(object):
 
         sys.argv.pop(0)
 
+        if len(sys.argv) > 1 and sys.argv[0] in ("-j", "--jobs"):
+            sys.argv.pop(0)
+            self.jobs = max(1, int(sys.argv.pop(0)))
+
         if len(sys.argv):
             world = sys.argv.pop(0)
 
@@ -1,20 +1,75 @@
-from box import BoundingBox, FloatBox
-from entity import Entity, TileEntity
-from faces import faceDirections, FaceXDecreasing, FaceXIncreasing, FaceYDecreasing, FaceYIncreasing, FaceZDecreasing, \
-    FaceZIncreasing, MaxDirections
-from indev import MCIndevLevel
-from infiniteworld import ChunkedLevelMixin, AnvilChunk, MCAlphaDimension, MCInfdevOldLevel, ZeroChunk
-from tall_worlds import TWLevel, TWColumn, TWCube
-import items
-from javalevel import MCJavaLevel
-from level import ChunkBase, computeChunkHeightMap, EntityLevel, FakeChunk, LightedChunk, MCLevel
-from materials import alphaMaterials, classicMaterials, indevMaterials, MCMaterials, namedMaterials, pocketMaterials
-from mclevelbase import ChunkNotPresent, PlayerNotFound
-from leveldbpocket import PocketLeveldbWorld
-from directories import minecraftSaveFileDir, getMinecraftProfileDirectory, getSelectedProfile
-from mclevel import fromFile, loadWorld, loadWorldNumber
-from nbt import load, gunzip, TAG_Byte, TAG_Byte_Array, TAG_Compound, TAG_Double, TAG_Float, TAG_Int, TAG_Int_Array, \
-    TAG_List, TAG_Long, TAG_Short, TAG_String
-import pocket
-from schematic import INVEditChest, MCSchematic, ZipSchematic
-saveFileDir = minecraftSaveFileDir
+"""
+pymclevel imports the module behind each of the names below the first time that name is looked up, so a tool that
+only wants pymclevel.nbt or pymclevel.box doesn't pay for the block materials, the level formats and the item tables.
+
+    from pymclevel import BoundingBox  # imports pymclevel.box only
+    import pymclevel.nbt  # imports nothing else from pymclevel
+
+Submodules that have no names here, like pymclevel.scan, are imported the first time they are looked up too.
+"""
+import imp
+import importlib
+import sys
+import types
+
+# name: (module, attribute in that module, or None for the module itself)
+_lazyNames = {}
+
+
+def _lazy(module, *names):
+    for name in names:
+        _lazyNames[name] = (module, name)
+
+
+_lazy("box", "BoundingBox", "FloatBox")
+_lazy("entity", "Entity", "TileEntity")
+_lazy("faces", "faceDirections", "FaceXDecreasing", "FaceXIncreasing", "FaceYDecreasing", "FaceYIncreasing",
+      "FaceZDecreasing", "FaceZIncreasing", "MaxDirections")
+_lazy("indev", "MCIndevLevel")
+_lazy("infiniteworld", "ChunkedLevelMixin", "AnvilChunk", "MCAlphaDimension", "MCInfdevOldLevel", "ZeroChunk")
+_lazy("tall_worlds", "TWLevel", "TWColumn", "TWCube")
+_lazy("javalevel", "MCJavaLevel")
+_lazy("level", "ChunkBase", "computeChunkHeightMap", "EntityLevel", "FakeChunk", "LightedChunk", "MCLevel")
+_lazy("materials", "alphaMaterials", "classicMaterials", "indevMaterials", "MCMaterials", "namedMaterials",
+      "pocketMaterials")
+_lazy("mclevelbase", "ChunkNotPresent", "PlayerNotFound")
+_lazy("leveldbpocket", "PocketLeveldbWorld")
+_lazy("directories", "minecraftSaveFileDir", "getMinecraftProfileDirectory", "getSelectedProfile")
+_lazy("mclevel", "fromFile", "loadWorld", "loadWorldNumber")
+_lazy("nbt", "load", "gunzip", "TAG_Byte", "TAG_Byte_Array", "TAG_Compound", "TAG_Double", "TAG_Float", "TAG_Int",
+      "TAG_Int_Array", "TAG_List", "TAG_Long", "TAG_Short", "TAG_String")
+_lazy("schematic", "INVEditChest", "MCSchematic", "ZipSchematic")
+_lazyNames["items"] = ("items", None)
+_lazyNames["pocket"] = ("pocket", None)
+_lazyNames["saveFileDir"] = ("directories", "minecraftSaveFileDir")
+
+__all__ = sorted(_lazyNames)
+
+
+class _LazyPackage(types.ModuleType):
+    def __getattr__(self, name):
+        try:
+            module, attr = _lazyNames[name]
+        except KeyError:
+            try:
+                imp.find_module(name, __path__)
+            except ImportError:
+                raise AttributeError("'module' object has no attribute '{0}'".format(name))
+            return importlib.import_module(__name__ + "." + name)
+
+        # level -1 tries pymclevel.<module> before the top-level module, as the eager imports here used to
+        value = __import__(module, globals(), {}, [attr or "__name__"], -1)
+        if attr is not None:
+            value = getattr(value, attr)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(self.__dict__) | set(_lazyNames))
+
+
+_package = _LazyPackage(__name__, __doc__)
+_package.__dict__.update((k, v) for k, v in globals().iteritems() if k.startswith("__"))
+# keep this module alive: its globals are cleared when it is collected, and __getattr__ still needs them
+_package._module = sys.modules[__name__]
+sys.modules[__name__] = _package
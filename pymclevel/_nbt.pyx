@@ -339,8 +339,29 @@ cdef class TAG_String(TAG_Value):
 
 
 cdef class _TAG_List(TAG_Value):
-    cdef public list value
+    cdef list _value
     cdef public char list_type
+    cdef _LazyPayload _raw
+    # counts the changes made through the tag: setting its value, and setting, deleting or inserting items.
+    # Changes made directly to the list in value are not counted.
+    cdef readonly unsigned long version
+
+    property value:
+        def __get__(self):
+            if self._raw is not None:
+                self._value = load_lazy_list_items(self._raw)
+                self._raw = None
+            return self._value
+
+        def __set__(self, list value):
+            self._raw = None
+            self._value = value
+            self.version += 1
+
+    property isLoaded:
+        def __get__(self):
+            """False until a list read by load(lazy=True) has read its items from the buffer."""
+            return self._raw is None
 
     def __init__(self, value=None, name="", list_type=_ID_BYTE):
         self.value = []
@@ -378,6 +399,7 @@ cdef class _TAG_List(TAG_Value):
         else:
             self.check_tag(value)
         self.value[index] = value
+        self.version += 1
 
     def __iter__(self):
         return iter(self.value)
@@ -392,11 +414,17 @@ cdef class _TAG_List(TAG_Value):
             self.check_tag(tag)
 
         self.value.insert(index, tag)
+        self.version += 1
 
     def __delitem__(self, key):
         del self.value[key]
+        self.version += 1
 
     cdef void save_value(self, buf):
+        if self._raw is not None and self._raw.big_endian == _BIG_ENDIAN:
+            self._raw.save(buf)
+            return
+
         cdef char list_type = self.list_type
         cdef TAG_Value tag
 
@@ -423,7 +451,24 @@ class TAG_List(_TAG_List, collections.MutableSequence):
 
 
 cdef class _TAG_Compound(TAG_Value):
-    cdef public object value
+    cdef object _value
+    cdef _LazyPayload _raw
+
+    property value:
+        def __get__(self):
+            if self._raw is not None:
+                self._value = load_lazy_compound_items(self._raw)
+                self._raw = None
+            return self._value
+
+        def __set__(self, value):
+            self._raw = None
+            self._value = value
+
+    property isLoaded:
+        def __get__(self):
+            """False until a compound read by load(lazy=True) has read its children from the buffer."""
+            return self._raw is None
 
     def __init__(self, value=None, name=None):
         if name is None:
@@ -484,6 +529,10 @@ cdef class _TAG_Compound(TAG_Value):
         return [v for v in self.value if v.name == key]
 
     cdef void save_value(self, buf):
+        if self._raw is not None and self._raw.big_endian == _BIG_ENDIAN:
+            self._raw.save(buf)
+            return
+
         cdef TAG_Value subtag
         for subtag in self.value:
             save_tag_id(subtag.tagID, buf)
@@ -558,15 +607,19 @@ cdef void swab(void * vbuf, int nbytes):
 # --- NBT Loading ---
 #
 
-def load(filename="", buf=None):
+def load(filename="", buf=None, lazy=False):
     """
     Load an NBT tree from a file and return the root TAG_Compound. The root tag is the only tag that can have a name
     itself without being inside a TAG_Compound.
     If filename is given, loads NBT data from that file. If buf is given, loads NBT data from the bytes or filehandle.
+    If lazy is True, compounds and lists of compounds or lists below the root are not read until they are first
+    used, and any that are never used are saved back as their original bytes.
     :param filename: Filename to load data from
     :type filename: basestring
     :param buf: File-like object to load data from
     :type buf: file-like object | bytes
+    :param lazy: Defer reading nested compounds and lists until they are used
+    :type lazy: bool
     :return: Structured NBT data
     :rtype: TAG_Compound
     """
@@ -580,8 +633,10 @@ def load(filename="", buf=None):
 
     cdef load_ctx ctx = load_ctx()
     ctx.offset = 1
+    ctx.owner = buf
     ctx.buffer = buf
     ctx.size = len(buf)
+    ctx.lazy = lazy
 
     if len(buf) < 1:
         raise NBTFormatError("NBT Stream too short!")
@@ -604,6 +659,32 @@ cdef class load_ctx:
     cdef size_t offset
     cdef char * buffer
     cdef size_t size
+    cdef object owner  # the bytes object buffer points into
+    cdef bint lazy
+
+
+cdef class _LazyPayload:
+    """
+    Location of the payload of a TAG_Compound or TAG_List read by load(lazy=True), and the byte order it was
+    written in.
+    """
+    cdef bytes owner
+    cdef size_t start
+    cdef size_t end
+    cdef int big_endian
+
+    cdef load_ctx context(self):
+        cdef load_ctx ctx = load_ctx()
+        ctx.owner = self.owner
+        ctx.buffer = self.owner
+        ctx.offset = self.start
+        ctx.size = self.end
+        ctx.lazy = True
+        return ctx
+
+    cdef void save(self, buf):
+        cdef char * s = self.owner
+        cwrite(buf, s + self.start, self.end - self.start)
 
 IF UNICODE_CACHE:
     cdef dict u_cache = dict()
@@ -678,17 +759,22 @@ cdef TAG_Double load_double(load_ctx ctx):
 
 
 cdef load_compound(load_ctx ctx):
-    cdef char tagID
     cdef _TAG_Compound root_tag = TAG_Compound()
-    cdef TAG_Value tag
+    root_tag._value = load_compound_items(ctx)
+    return root_tag
+
+
+cdef list load_compound_items(load_ctx ctx):
+    cdef char tagID
+    cdef list items = []
     while True:
         tagID = read(ctx, 1)[0]
         if tagID == _ID_END:
             break
         else:
-            root_tag.value.append(load_named(ctx, tagID))
+            PyList_Append(items, load_named(ctx, tagID))
 
-    return root_tag
+    return items
 
 
 cdef load_named(load_ctx ctx, char tagID):
@@ -699,19 +785,136 @@ cdef load_named(load_ctx ctx, char tagID):
 
 
 cdef load_list(load_ctx ctx):
+    cdef char list_type = ctx.buffer[ctx.offset]
+    cdef _TAG_List tag = TAG_List(list_type=list_type)
+    tag._value = load_list_items(ctx)
+    return tag
+
+
+cdef list load_list_items(load_ctx ctx):
     cdef char list_type = read(ctx, 1)[0]
     cdef int * ptr = <int *> read(ctx, 4)
     cdef int length = ptr[0]
     swab(&length, 4)
 
-    cdef _TAG_List tag = TAG_List(list_type=list_type)
-    cdef list val = tag.value
+    cdef list val = []
     cdef int i
     for i in range(length):
         PyList_Append(val, load_tag(list_type, ctx))
 
+    return val
+
+
+# --- Lazy loading ---
+
+cdef _LazyPayload skip_payload(load_ctx ctx, char tagID):
+    cdef _LazyPayload raw = _LazyPayload()
+    raw.owner = ctx.owner
+    raw.start = ctx.offset
+    skip_tag(tagID, ctx)
+    raw.end = ctx.offset
+    raw.big_endian = _BIG_ENDIAN
+    return raw
+
+
+cdef load_lazy_compound(load_ctx ctx):
+    cdef _TAG_Compound tag = TAG_Compound()
+    tag._raw = skip_payload(ctx, _ID_COMPOUND)
+    return tag
+
+
+cdef load_lazy_list(load_ctx ctx):
+    cdef _TAG_List tag = TAG_List(list_type=ctx.buffer[ctx.offset])
+    tag._raw = skip_payload(ctx, _ID_LIST)
     return tag
 
+
+cdef list load_lazy_compound_items(_LazyPayload raw):
+    global _BIG_ENDIAN
+    cdef int big_endian = _BIG_ENDIAN
+    _BIG_ENDIAN = raw.big_endian
+    try:
+        return load_compound_items(raw.context())
+    finally:
+        _BIG_ENDIAN = big_endian
+
+
+cdef list load_lazy_list_items(_LazyPayload raw):
+    global _BIG_ENDIAN
+    cdef int big_endian = _BIG_ENDIAN
+    _BIG_ENDIAN = raw.big_endian
+    try:
+        return load_list_items(raw.context())
+    finally:
+        _BIG_ENDIAN = big_endian
+
+
+cdef inline size_t fixed_size(char tagID):
+    """
+    Size of the payload of a numeric tag, or 0 for tags whose payload has a length prefix.
+    """
+    if tagID == _ID_BYTE:
+        return 1
+    if tagID == _ID_SHORT:
+        return 2
+    if tagID == _ID_INT or tagID == _ID_FLOAT:
+        return 4
+    if tagID == _ID_LONG or tagID == _ID_DOUBLE:
+        return 8
+    return 0
+
+cdef void skip_tag(char tagID, load_ctx ctx) except *:
+    """
+    Step over the payload of a tag without creating any objects for it.
+    """
+    cdef char subtagID
+    cdef int length
+    cdef unsigned short name_length
+    cdef size_t size = fixed_size(tagID)
+    cdef int i
+
+    if size:
+        read(ctx, size)
+
+    elif tagID == _ID_COMPOUND:
+        while True:
+            subtagID = read(ctx, 1)[0]
+            if subtagID == _ID_END:
+                break
+            name_length = (<unsigned short *> read(ctx, 2))[0]
+            swab(&name_length, 2)
+            read(ctx, name_length)
+            skip_tag(subtagID, ctx)
+
+    elif tagID == _ID_LIST:
+        subtagID = read(ctx, 1)[0]
+        length = (<int *> read(ctx, 4))[0]
+        swab(&length, 4)
+        size = fixed_size(subtagID)
+        if size:
+            read(ctx, size * length)
+        else:
+            for i in range(length):
+                skip_tag(subtagID, ctx)
+
+    elif tagID == _ID_STRING:
+        name_length = (<unsigned short *> read(ctx, 2))[0]
+        swab(&name_length, 2)
+        read(ctx, name_length)
+
+    elif tagID == _ID_BYTE_ARRAY or tagID == _ID_SHORT_ARRAY or tagID == _ID_INT_ARRAY:
+        length = (<int *> read(ctx, 4))[0]
+        swab(&length, 4)
+        if tagID == _ID_BYTE_ARRAY:
+            read(ctx, length)
+        elif tagID == _ID_SHORT_ARRAY:
+            read(ctx, length * 2)
+        else:
+            read(ctx, length * 4)
+
+    else:
+        raise NBTFormatError("Unknown tag type %d" % tagID)
+
 cdef unicode load_string(load_ctx ctx):
     cdef unsigned short * ptr = <unsigned short *> read(ctx, 2)
     cdef unsigned short length = ptr[0]
@@ -809,9 +1012,14 @@ cdef load_tag(char tagID, load_ctx ctx):
         return TAG_String(load_string(ctx))
 
     if tagID == _ID_LIST:
+        # Lists of numbers are cheaper to decode than to defer
+        if ctx.lazy and (ctx.buffer[ctx.offset] == _ID_COMPOUND or ctx.buffer[ctx.offset] == _ID_LIST):
+            return load_lazy_list(ctx)
         return load_list(ctx)
 
     if tagID == _ID_COMPOUND:
+        if ctx.lazy:
+            return load_lazy_compound(ctx)
         return load_compound(ctx)
 
     if tagID == _ID_INT_ARRAY:
@@ -0,0 +1,199 @@
+"""
+Block accessors that take arrays of coordinates.
+
+blockAt(), setBlockAt() and friends look up the chunk for every call, which dominates filters that visit millions
+of blocks in Python loops. These variants accept NumPy arrays (or anything that broadcasts to a common shape) for
+x, y and z, sort the points by chunk once, and then read or write each chunk's points with a single fancy-indexing
+operation.
+
+    x, z = numpy.mgrid[0:64, 0:64]
+    blocks = level.blocksAt(x, 64, z)
+    level.setBlocksAt(x, 64, z, numpy.where(blocks == 0, level.materials.Glass.ID, blocks))
+
+getBlockArray() and setBlockArray() do the same for every block in a BoundingBox, assembling one contiguous array
+indexed [x, z, y] from the chunks that intersect the box, or spreading one back over them.
+
+Points outside the level, or in chunks that are not present, read as the fill value and are ignored when writing.
+They work on column-based levels (MCInfdevOldLevel, schematics) and on levels made of cubes (TWLevel), which set
+cubicChunks.
+"""
+
+import tempfile
+
+from numpy import arange, asarray, broadcast_arrays, broadcast_to, concatenate, diff, empty, flatnonzero, lexsort, \
+    memmap
+
+from mclevelbase import ChunkNotPresent
+
+_dtypes = {
+    "Blocks": 'uint16',
+    "Data": 'uint8',
+    "BlockLight": 'uint8',
+    "SkyLight": 'uint8',
+}
+
+
+def _flatten(*arrays):
+    arrays = broadcast_arrays(*[asarray(a) for a in arrays])
+    return arrays[0].shape, [a.ravel() for a in arrays]
+
+
+def _chunkRuns(level, x, y, z):
+    """
+    Groups the points by the chunk containing them. Yields (chunk, index, lx, ly, lz) for each chunk, where index
+    selects that chunk's points from x, y and z and lx, ly, lz are their coordinates within the chunk. chunk is None
+    if the chunk is not present.
+    """
+    x = x.astype('int64')
+    y = y.astype('int64')
+    z = z.astype('int64')
+
+    if level.cubicChunks:
+        index = arange(len(x))
+    else:
+        inside = (y >= 0) & (y < level.Height)
+        if not level.isInfinite:
+            inside &= (x >= 0) & (x < level.Width) & (z >= 0) & (z < level.Length)
+        index = flatnonzero(inside)
+
+    if not len(index):
+        return
+
+    cx = x[index] >> 4
+    cz = z[index] >> 4
+    if level.cubicChunks:
+        cy = y[index] >> 4
+        order = lexsort((cy, cz, cx))
+        keys = (cx[order], cy[order], cz[order])
+    else:
+        order = lexsort((cz, cx))
+        keys = (cx[order], cz[order])
+    index = index[order]
+
+    changed = diff(keys[0]) != 0
+    for k in keys[1:]:
+        changed |= diff(k) != 0
+    starts = concatenate(([0], flatnonzero(changed) + 1, [len(index)]))
+
+    for start, end in zip(starts[:-1], starts[1:]):
+        chunkIndex = index[start:end]
+        cPos = tuple(int(k[start]) for k in keys)
+        try:
+            if level.cubicChunks:
+                chunk = level.getChunk_cc(*cPos) if level.containsChunk_cc(*cPos) else None
+            else:
+                chunk = level.getChunk(*cPos)
+        except ChunkNotPresent:
+            chunk = None
+
+        ly = y[chunkIndex]
+        if level.cubicChunks:
+            ly = ly & 0xf
+        yield chunk, chunkIndex, x[chunkIndex] & 0xf, ly, z[chunkIndex] & 0xf
+
+
+def _gather(level, name, x, y, z, fill):
+    shape, (x, y, z) = _flatten(x, y, z)
+    result = empty(x.size, _dtypes[name])
+    result[:] = fill
+    for chunk, index, lx, ly, lz in _chunkRuns(level, x, y, z):
+        if chunk is not None:
+            result[index] = getattr(chunk, name)[lx, lz, ly]
+    return result.reshape(shape)
+
+
+def _scatter(level, name, x, y, z, values, changesLighting):
+    shape, (x, y, z, values) = _flatten(x, y, z, values)
+    for chunk, index, lx, ly, lz in _chunkRuns(level, x, y, z):
+        if chunk is None:
+            continue
+        getattr(chunk, name)[lx, lz, ly] = values[index]
+        chunk.markDirtyBlocks((lx, lz, ly), pending=False, names=(name,))
+        chunk.dirty = True
+        if changesLighting:
+            chunk.needsLighting = True
+
+
+def blocksAt(self, x, y, z, fill=0):
+    """ Returns an array of the block IDs at the given points, shaped like the broadcast coordinates. """
+    return _gather(self, "Blocks", x, y, z, fill)
+
+
+def setBlocksAt(self, x, y, z, blockIDs):
+    """ Sets the block IDs at the given points. blockIDs may be a single ID or an array broadcastable to the
+    coordinates. Where a point appears more than once, the last value given for it wins. """
+    _scatter(self, "Blocks", x, y, z, blockIDs, True)
+
+
+def blocksDataAt(self, x, y, z, fill=0):
+    return _gather(self, "Data", x, y, z, fill)
+
+
+def setBlocksDataAt(self, x, y, z, newdata):
+    _scatter(self, "Data", x, y, z, newdata, True)
+
+
+def blocksLightAt(self, x, y, z, fill=0):
+    return _gather(self, "BlockLight", x, y, z, fill)
+
+
+def setBlocksLightAt(self, x, y, z, newLight):
+    _scatter(self, "BlockLight", x, y, z, newLight, False)
+
+
+def skylightsAt(self, x, y, z, fill=0):
+    return _gather(self, "SkyLight", x, y, z, fill)
+
+
+def setSkylightsAt(self, x, y, z, lightValue):
+    _scatter(self, "SkyLight", x, y, z, lightValue, False)
+
+
+def _boxChunkSlices(level, box):
+    if level.cubicChunks:
+        return level.getChunkSlices_cc(box)
+    return level.getChunkSlices(box)
+
+
+def getBlockArray(self, box, name="Blocks", fill=0, mmap=False):
+    """
+    Returns the named array (Blocks, Data, BlockLight or SkyLight) for every block in box as one array of shape
+    (box.width, box.length, box.height), indexed [x, z, y]. Blocks in chunks that are not present, or outside the
+    level, are set to fill.
+
+    If mmap is True, the array is assembled in a temporary file rather than in memory, and returned as a read-only
+    numpy.memmap. The file is removed when the array is garbage collected.
+    """
+    shape = (box.width, box.length, box.height)
+    if mmap:
+        result = memmap(tempfile.TemporaryFile(prefix="mceditblocks"), _dtypes[name], "w+", shape=shape)
+    else:
+        result = empty(shape, _dtypes[name])
+    result[:] = fill
+
+    for chunk, slices, (x, y, z) in _boxChunkSlices(self, box):
+        src = getattr(chunk, name)[slices]
+        w, l, h = src.shape
+        result[x:x + w, z:z + l, y:y + h] = src
+
+    if mmap:
+        result.flush()
+        result.flags.writeable = False
+    return result
+
+
+def setBlockArray(self, box, arr, name="Blocks"):
+    """
+    Writes arr into the named array (Blocks, Data, BlockLight or SkyLight) for every block in box. arr is indexed
+    [x, z, y] and must have shape (box.width, box.length, box.height), or broadcast to it. Parts of the box in
+    chunks that are not present are skipped.
+    """
+    arr = broadcast_to(asarray(arr), (box.width, box.length, box.height))
+    changesLighting = name in ("Blocks", "Data")
+
+    for chunk, slices, (x, y, z) in _boxChunkSlices(self, box):
+        dest = getattr(chunk, name)[slices]
+        w, l, h = dest.shape
+        dest[:] = arr[x:x + w, z:z + l, y:y + h]
+        chunk.markDirtyBlocks(slices, names=(name,))
+        chunk.chunkChanged(changesLighting)
@@ -8,6 +8,7 @@ from box import BoundingBox, Vector
 from mclevelbase import exhaust
 import materials
 from entity import Entity, TileEntity
+import nbt
 from copy import deepcopy
 
 
@@ -46,12 +47,56 @@ def adjustCopyParameters(destLevel, sourceLevel, sourceBox, destinationPoint):
     return actualSourceBox, actualDestPoint
 
 
+def canCopyChunksRaw(destLevel, sourceLevel, copyOffset, blocksToCopy, entities, biomes):
+    """ Whole chunks can be copied as they are stored, without decoding their blocks, when both levels are
+    chunked worlds using the same materials, every block, entity and biome is copied, and the copy moves chunks
+    onto chunks. """
+    return (hasattr(destLevel, "copyChunkFromOffset") and isinstance(sourceLevel, type(destLevel))
+            and sourceLevel is not destLevel
+            and destLevel.materials is sourceLevel.materials
+            and blocksToCopy is None and entities and biomes
+            and copyOffset[0] & 0xf == 0 and copyOffset[1] == 0 and copyOffset[2] & 0xf == 0)
+
+
+def chunkTagRewriter(copyOffset, staticCommands=False, moveSpawnerPos=False, regenerateUUID=False, first=False,
+                     cancelCommandBlockOffset=False):
+    """ Returns a function that moves the entities, tile entities and tile ticks in a chunk's Level tag by
+    copyOffset, the same way copyBlocksFromIter does for the ones it copies. """
+
+    def moveTileTick(tileTick):
+        eTag = deepcopy(tileTick)
+        for a, o in zip('xyz', copyOffset):
+            eTag[a].value += o
+        return eTag
+
+    movers = (
+        ("Entities", lambda tag: Entity.copyWithOffset(tag, copyOffset, regenerateUUID)),
+        ("TileEntities", lambda tag: TileEntity.copyWithOffset(tag, copyOffset, staticCommands, moveSpawnerPos, first,
+                                                               cancelCommandBlockOffset)),
+        ("TileTicks", moveTileTick),
+    )
+
+    def rewriteLevelTag(levelTag):
+        for name, move in movers:
+            if name in levelTag and len(levelTag[name]):
+                levelTag[name] = nbt.TAG_List([move(tag) for tag in levelTag[name]])
+
+    return rewriteLevelTag
+
+
 def copyBlocksFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, blocksToCopy=None, entities=True,
                        create=False, biomes=False, tileTicks=True, staticCommands=False, moveSpawnerPos=False, regenerateUUID=False, first=False, cancelCommandBlockOffset=False):
     """ copy blocks between two infinite levels by looping through the
     destination's chunks. make a sub-box of the source level for each chunk
     and copy block and entities in the sub box to the dest chunk."""
 
+    if destLevel.cubicChunks or sourceLevel.cubicChunks:
+        for progress in copyCubesFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, blocksToCopy, entities,
+                                          create, biomes, tileTicks, staticCommands, moveSpawnerPos, regenerateUUID,
+                                          first, cancelCommandBlockOffset):
+            yield progress
+        return
+
     (lx, ly, lz) = sourceBox.size
 
     sourceBox, destinationPoint = adjustCopyParameters(destLevel, sourceLevel, sourceBox, destinationPoint)
@@ -69,6 +114,11 @@ def copyBlocksFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, bloc
 
     copyOffset = [d - s for s, d in zip(sourceBox.origin, destinationPoint)]
 
+    rawCopy = canCopyChunksRaw(destLevel, sourceLevel, copyOffset, blocksToCopy, entities, biomes)
+    if rawCopy:
+        rewriteLevelTag = chunkTagRewriter(copyOffset, staticCommands, moveSpawnerPos, regenerateUUID, first,
+                                           cancelCommandBlockOffset)
+
     # Visit each chunk in the destination area.
     # Get the region of the source area corresponding to that chunk
     #   Visit each chunk of the region of the source area
@@ -83,6 +133,22 @@ def copyBlocksFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, bloc
         destChunkBoxInSourceLevel = BoundingBox([d - o for o, d in zip(copyOffset, destChunkBox.origin)],
                                                 destChunkBox.size)
 
+        if rawCopy and destChunkBox.size == (16, destLevel.Height, 16):
+            srcCpos = (cx - (copyOffset[0] >> 4), cz - (copyOffset[2] >> 4))
+            if not sourceLevel.containsChunk(*srcCpos):
+                continue
+            if create or destLevel.containsChunk(*destCpos):
+                if copyOffset == [0, 0, 0]:
+                    destLevel.copyChunkFrom(sourceLevel, *destCpos)
+                    copied = True
+                else:
+                    copied = destLevel.copyChunkFromOffset(sourceLevel, srcCpos[0], srcCpos[1], cx, cz,
+                                                           rewriteLevelTag)
+                if copied:
+                    i += 1
+                    yield (i, chunkCount)
+                    continue
+
         if not destLevel.containsChunk(*destCpos):
             if create and any(sourceLevel.containsChunk(*c) for c in destChunkBoxInSourceLevel.chunkPositions):
                 # Only create chunks in the destination level if the source level has chunks covering them.
@@ -121,6 +187,7 @@ def copyBlocksFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, bloc
             destChunk.Blocks[destSlices][mask] = convertedSourceBlocks[mask]
             if convertedSourceData is not None:
                 destChunk.Data[destSlices][mask] = convertedSourceData[mask]
+            destChunk.markDirtyBlocks(destSlices)
 
             def copy(p):
                 return p in sourceChunkBoxInDestLevel and (blocksToCopy is None or mask[
@@ -166,6 +233,155 @@ def copyBlocksFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, bloc
     log.info("Copied {0} entities and {1} tile entities and {2} tile ticks".format(e, t, tt))
 
 
+def _chunkPositions(level, box):
+    if level.cubicChunks:
+        return box.chunkPositions_cc
+    return box.chunkPositions
+
+
+def _containsChunk(level, cPos):
+    if level.cubicChunks:
+        return level.containsChunk_cc(*cPos)
+    return level.containsChunk(*cPos)
+
+
+def _getChunk(level, cPos):
+    if level.cubicChunks:
+        return level.getChunk_cc(*cPos)
+    return level.getChunk(*cPos)
+
+
+def _chunkBox(level, cPos):
+    if level.cubicChunks:
+        cx, cy, cz = cPos
+        return BoundingBox((cx << 4, cy << 4, cz << 4), (16, 16, 16))
+    cx, cz = cPos
+    return BoundingBox((cx << 4, 0, cz << 4), (16, level.Height, 16))
+
+
+def copyCubesFromIter(destLevel, sourceLevel, sourceBox, destinationPoint, blocksToCopy=None, entities=True,
+                      create=False, biomes=False, tileTicks=True, staticCommands=False, moveSpawnerPos=False,
+                      regenerateUUID=False, first=False, cancelCommandBlockOffset=False):
+    """ copy blocks when either level is made of 16x16x16 cubes (levels with cubicChunks set). Cube levels are
+    visited cube by cube, other levels column by column, so only the cubes intersecting the box are loaded.
+
+    Source chunks with nothing to copy - no blocks selected by blocksToCopy and no entities - are skipped without
+    loading the destination chunk. Entities, tile entities and tile ticks go straight into the destination cube that
+    holds them. create is ignored for cube destinations; cubes missing from the destination are skipped."""
+
+    sourceBox, destinationPoint = adjustCopyParameters(destLevel, sourceLevel, sourceBox, destinationPoint)
+    log.info(u"Copying {0} blocks from {1} to {2} by cube".format(sourceBox.volume, sourceBox, destinationPoint))
+    startTime = datetime.now()
+
+    destBox = BoundingBox(destinationPoint, sourceBox.size)
+    destPositions = list(_chunkPositions(destLevel, destBox))
+    chunkCount = len(destPositions)
+    e = t = tt = 0
+    sourceMask = sourceMaskFunc(blocksToCopy)
+
+    copyOffset = [d - s for s, d in zip(sourceBox.origin, destinationPoint)]
+
+    for i, destCpos in enumerate(destPositions):
+        yield (i + 1, chunkCount)
+        if i % 100 == 99:
+            log.info("Chunk {0}...".format(i + 1))
+
+        destChunkBox = _chunkBox(destLevel, destCpos).intersect(destBox)
+        destChunkBoxInSourceLevel = BoundingBox([d - o for o, d in zip(copyOffset, destChunkBox.origin)],
+                                                destChunkBox.size)
+
+        sourcePositions = [c for c in _chunkPositions(sourceLevel, destChunkBoxInSourceLevel)
+                           if _containsChunk(sourceLevel, c)]
+        if not sourcePositions:
+            continue
+
+        if not _containsChunk(destLevel, destCpos):
+            if create and not destLevel.cubicChunks:
+                destLevel.createChunk(*destCpos)
+            else:
+                continue
+
+        destChunk = None
+        # entities added to a cube must go into the cube itself; other levels find the right chunk
+        entityDest = destLevel
+
+        for srcCpos in sourcePositions:
+            sourceChunk = _getChunk(sourceLevel, srcCpos)
+
+            sourceChunkBox, sourceSlices = sourceChunk.getChunkSlicesForBox(destChunkBoxInSourceLevel)
+            if sourceChunkBox.volume == 0:
+                continue
+
+            sourceBlocks = sourceChunk.Blocks[sourceSlices]
+            mask = sourceMask(sourceBlocks)
+            copiesBlocks = isinstance(mask, slice) or mask.any()
+
+            ents = sourceChunk.getEntitiesInBox(sourceChunkBox) if entities else []
+            if not (copiesBlocks or ents):
+                continue
+
+            if destChunk is None:
+                destChunk = _getChunk(destLevel, destCpos)
+                if destLevel.cubicChunks:
+                    entityDest = destChunk
+
+            sourceChunkBoxInDestLevel = BoundingBox([d + o for o, d in zip(copyOffset, sourceChunkBox.origin)],
+                                                    sourceChunkBox.size)
+            _, destSlices = destChunk.getChunkSlicesForBox(sourceChunkBoxInDestLevel)
+
+            def copy(p):
+                return p in sourceChunkBoxInDestLevel and (blocksToCopy is None or mask[
+                    p[0] - sourceChunkBoxInDestLevel.minx,
+                    p[2] - sourceChunkBoxInDestLevel.minz,
+                    p[1] - sourceChunkBoxInDestLevel.miny,
+                ])
+
+            if entities:
+                destChunk.removeEntities(copy)
+                e += len(ents)
+                for entityTag in ents:
+                    entityDest.addEntity(Entity.copyWithOffset(entityTag, copyOffset, regenerateUUID))
+
+            if not copiesBlocks:
+                continue
+
+            sourceData = sourceChunk.Data[sourceSlices]
+            convertedSourceBlocks, convertedSourceData = convertBlocks(destLevel, sourceLevel, sourceBlocks, sourceData)
+
+            destChunk.Blocks[destSlices][mask] = convertedSourceBlocks[mask]
+            if convertedSourceData is not None:
+                destChunk.Data[destSlices][mask] = convertedSourceData[mask]
+            destChunk.markDirtyBlocks(destSlices)
+
+            destChunk.removeTileEntities(copy)
+
+            tileEntities = sourceChunk.getTileEntitiesInBox(sourceChunkBox)
+            t += len(tileEntities)
+            for tileEntityTag in tileEntities:
+                entityDest.addTileEntity(TileEntity.copyWithOffset(tileEntityTag, copyOffset, staticCommands,
+                                                                   moveSpawnerPos, first, cancelCommandBlockOffset))
+
+            destChunk.removeTileTicks(copy)
+
+            tileTicksList = sourceChunk.getTileTicksInBox(sourceChunkBox)
+            tt += len(tileTicksList)
+            for tileTick in tileTicksList:
+                eTag = deepcopy(tileTick)
+                eTag['x'].value = tileTick['x'].value + copyOffset[0]
+                eTag['y'].value = tileTick['y'].value + copyOffset[1]
+                eTag['z'].value = tileTick['z'].value + copyOffset[2]
+                entityDest.addTileTick(eTag)
+
+            if biomes and hasattr(destChunk, 'Biomes') and hasattr(sourceChunk, 'Biomes'):
+                destChunk.Biomes[destSlices[:2]] = sourceChunk.Biomes[sourceSlices[:2]]
+
+        if destChunk is not None:
+            destChunk.chunkChanged()
+
+    log.info("Duration: {0}".format(datetime.now() - startTime))
+    log.info("Copied {0} entities and {1} tile entities and {2} tile ticks".format(e, t, tt))
+
+
 def copyBlocksFrom(destLevel, sourceLevel, sourceBox, destinationPoint, blocksToCopy=None, entities=True, create=False,
                    biomes=False, tileTicks=True, staticCommands=False, moveSpawnerPos=False, first=False, cancelCommandBlockOffset=False):
     return exhaust(
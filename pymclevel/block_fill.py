@@ -7,8 +7,8 @@ import numpy
 
 from mclevelbase import exhaust
 import blockrotation
-from box import BoundingBox
 from entity import TileEntity
+from level import getSectionSlices
 
 
 def blockReplaceTable(blocksToReplace):
@@ -49,19 +49,10 @@ def fillBlocksIter(level, box, blockInfo, blocksToReplace=(), noData=False):
             if a != newEmission:
                 changesLighting = True
 
-    tileEntity = None
-    if blockInfo.stringID in TileEntity.stringNames.keys():
-        tileEntity = TileEntity.stringNames[blockInfo.stringID]
+    tileEntity = TileEntity.stringNames.get(blockInfo.stringID)
 
-    blocksIdToReplace = [block.ID for block in blocksToReplace]
-
-    blocksList = []
-    if tileEntity and box is not None:
-        for (boxX, boxY, boxZ) in box.positions:
-            if blocktable is None or level.blockAt(boxX, boxY, boxZ) in blocksIdToReplace:
-                tileEntityObject = TileEntity.Create(tileEntity)
-                TileEntity.setpos(tileEntityObject, (boxX, boxY, boxZ))
-                blocksList.append(tileEntityObject)
+    # unless air is being replaced, sections holding only air have nothing to replace and can be skipped
+    skipEmptySections = blocktable is not None and not blocktable[0].any()
 
     i = 0
     skipped = 0
@@ -73,49 +64,90 @@ def fillBlocksIter(level, box, blockInfo, blocksToReplace=(), noData=False):
             log.info(u"Chunk {0}...".format(i))
         yield i, box.chunkCount
 
-        blocks = chunk.Blocks[slices]
-        data = chunk.Data[slices]
-        mask = slice(None)
-
         needsLighting = changesLighting
 
         if blocktable is not None:
-            mask = blocktable[blocks, data]
-
-            blockCount = mask.sum()
+            if skipEmptySections:
+                sections = getSectionSlices(chunk, slices, point)
+            else:
+                sections = [(slices, point)]
+
+            blockCount = 0
+            for sectionSlices, sectionPoint in sections:
+                origin = [a + b for a, b in zip(box.origin, sectionPoint)]
+                count = replaceBlocks(chunk, sectionSlices, origin, blocktable, blockInfo, noData, tileEntity)
+                if count:
+                    chunk.markDirtyBlocks(sectionSlices)
+                blockCount += count
             replaced += blockCount
 
-            # don't waste time relighting and copying if the mask is empty
-            if blockCount:
-                blocks[:][mask] = blockInfo.ID
-                if not noData:
-                    data[mask] = blockInfo.blockData
-            else:
+            # don't waste time relighting, or saving, if nothing was replaced
+            if not blockCount:
                 skipped += 1
-                needsLighting = False
-
-            def include(tileEntity):
-                p = TileEntity.pos(tileEntity)
-                x, y, z = map(lambda a, b, c: (a - b) - c, p, point, box.origin)
-                return not ((p in box) and mask[x, z, y])
-
-            chunk.TileEntities[:] = filter(include, chunk.TileEntities)
+                continue
 
         else:
+            blocks = chunk.Blocks[slices]
             blocks[:] = blockInfo.ID
             if not noData:
-                data[:] = blockInfo.blockData
+                chunk.Data[slices] = blockInfo.blockData
             chunk.removeTileEntitiesInBox(box)
 
-        chunkBounds = chunk.bounds
-        smallBoxSize = (1, 1, 1)
-        tileEntitiesToEdit = [t for t in blocksList if chunkBounds.intersect(BoundingBox(TileEntity.pos(t), smallBoxSize)).volume > 0]
+            if tileEntity:
+                origin = [a + b for a, b in zip(box.origin, point)]
+                createTileEntities(chunk, tileEntity, slice(None), blocks.shape, origin)
+            chunk.markDirtyBlocks(slices)
 
-        for tileEntityObject in tileEntitiesToEdit:
-            chunk.addTileEntity(tileEntityObject)
-            blocksList.remove(tileEntityObject)
-        
         chunk.chunkChanged(needsLighting)
 
     if len(blocksToReplace):
         log.info(u"Replace: Skipped {0} chunks, replaced {1} blocks".format(skipped, replaced))
+
+
+def replaceBlocks(chunk, slices, origin, blocktable, blockInfo, noData=False, tileEntityID=None):
+    """
+    Replaces the blocks of the part of chunk selected by slices that are set in blocktable with blockInfo, and
+    swaps the tile entities of the replaced blocks for new tileEntityID tile entities, if given. origin is the world
+    position of the part's first block. Returns the number of blocks replaced.
+    """
+    blocks = chunk.Blocks[slices]
+    data = chunk.Data[slices]
+    mask = blocktable[blocks, data]
+
+    blockCount = mask.sum()
+    if not blockCount:
+        return 0
+
+    blocks[mask] = blockInfo.ID
+    if not noData:
+        data[mask] = blockInfo.blockData
+
+    w, l, h = mask.shape
+    ox, oy, oz = origin
+
+    def include(tileEntity):
+        x, y, z = TileEntity.pos(tileEntity)
+        x, y, z = x - ox, y - oy, z - oz
+        return not (0 <= x < w and 0 <= y < h and 0 <= z < l and mask[x, z, y])
+
+    chunk.TileEntities[:] = filter(include, chunk.TileEntities)
+
+    if tileEntityID:
+        createTileEntities(chunk, tileEntityID, mask, mask.shape, origin)
+
+    return blockCount
+
+
+def createTileEntities(chunk, tileEntityID, mask, shape, origin):
+    """
+    Adds a new tileEntityID tile entity to chunk for each block of the filled part of the chunk that is set in mask.
+    The part is indexed [x, z, y] and has the given shape; origin is the world position of its first block. mask may
+    also be a slice selecting the whole part.
+    """
+    if isinstance(mask, slice):
+        xs, zs, ys = numpy.indices(shape).reshape(3, -1)
+    else:
+        xs, zs, ys = numpy.nonzero(mask)
+    ox, oy, oz = origin
+    for x, y, z in zip((xs + ox).tolist(), (ys + oy).tolist(), (zs + oz).tolist()):
+        chunk.addTileEntity(TileEntity.Create(tileEntityID, (x, y, z)))
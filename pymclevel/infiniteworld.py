@@ -28,6 +28,7 @@ from mclevelbase import ChunkMalformed, ChunkNotPresent, ChunkAccessDenied,Chunk
 import nbt
 from numpy import array, clip, maximum, zeros
 from regionfile import MCRegionFile
+from undo import UndoJournal
 from pc_metadata import PCMetadata, SessionLockLost
 import logging
 from uuid import UUID
@@ -102,19 +103,24 @@ class AnvilChunkData(object):
     AnvilChunks are stored in a WeakValueDictionary so we can find out when they are no longer used by clients. The
     AnvilChunkData for an unused chunk may safely be discarded or written out to disk. The client should probably
      not keep references to a whole lot of chunks or else it will run out of memory.
+
+    The Blocks, Data, SkyLight and BlockLight arrays are only decoded from the chunk's sections the first time they
+    are accessed. Arrays that were never accessed are written back from the original section tags when saving, so
+    scanning tools that only read Blocks and Data never pay for unpacking and repacking the light arrays.
     """
 
+    arrayNames = ("Blocks", "Data", "SkyLight", "BlockLight")
+
     def __init__(self, world, chunkPosition, root_tag=None, create=False):
         self.chunkPosition = chunkPosition
         self.world = world
         self.root_tag = root_tag
         self.dirty = False
 
-        self.Blocks = zeros((16, 16, world.Height), 'uint16')
-        self.Data = zeros((16, 16, world.Height), 'uint8')
-        self.BlockLight = zeros((16, 16, world.Height), 'uint8')
-        self.SkyLight = zeros((16, 16, world.Height), 'uint8')
-        self.SkyLight[:] = 15
+        # maps section Y to the section's TAG_Compound, for arrays which have not been decoded yet
+        self._sections = {}
+        # maps array name to the decoded 16x16xH array
+        self._arrays = {}
 
         if create:
             self._create()
@@ -153,57 +159,150 @@ class AnvilChunkData(object):
         self.root_tag = root_tag
 
         for sec in self.root_tag["Level"].pop("Sections", []):
-            y = sec["Y"].value * 16
+            self._sections[sec["Y"].value] = sec
+
+    # --- Lazily decoded arrays ---
+
+    def _getArray(self, name):
+        arr = self._arrays.get(name)
+        if arr is None:
+            arr = self._arrays[name] = self._decodeArray(name)
+            journal = getattr(self.world, "undoJournal", None)
+            if journal is not None:
+                journal.recordArray(self, name, arr)
+            if len(self._arrays) == len(self.arrayNames):
+                # every array is decoded, the section tags are no longer needed
+                self._sections = {}
+        return arr
+
+    def _decodeArray(self, name):
+        if name == "Blocks":
+            arr = zeros((16, 16, self.world.Height), 'uint16')
+        else:
+            arr = zeros((16, 16, self.world.Height), 'uint8')
+            if name == "SkyLight":
+                arr[:] = 15
+
+        for secY, sec in self._sections.iteritems():
+            y = secY * 16
+            secarray = sec[name].value
+            if name == "Blocks":
+                secarray = secarray.reshape((16, 16, 16))
+            else:
+                secarray = unpackNibbleArray(secarray.reshape((16, 16, 8)))
 
-            for name in "Blocks", "Data", "SkyLight", "BlockLight":
-                arr = getattr(self, name)
-                secarray = sec[name].value
-                if name == "Blocks":
-                    secarray.shape = (16, 16, 16)
-                else:
-                    secarray.shape = (16, 16, 8)
-                    secarray = unpackNibbleArray(secarray)
+            arr[..., y:y + 16] = secarray.swapaxes(0, 2)
 
-                arr[..., y:y + 16] = secarray.swapaxes(0, 2)
+            if name == "Blocks":
+                tag = sec.get("Add")
+                if tag is not None:
+                    add = unpackNibbleArray(tag.value.reshape((16, 16, 8)))
+                    arr[..., y:y + 16] |= (array(add, 'uint16') << 8).swapaxes(0, 2)
 
-            tag = sec.get("Add")
-            if tag is not None:
-                tag.value.shape = (16, 16, 8)
-                add = unpackNibbleArray(tag.value)
-                self.Blocks[..., y:y + 16] |= (array(add, 'uint16') << 8).swapaxes(0, 2)
+        return arr
+
+    def isDecoded(self, name):
+        """Returns True if the named array has been decoded from the chunk's section tags."""
+        return name in self._arrays
+
+    @property
+    def Blocks(self):
+        return self._getArray("Blocks")
+
+    @Blocks.setter
+    def Blocks(self, value):
+        if getattr(self.world, "undoJournal", None) is not None:
+            # let the journal see the old blocks before they are replaced
+            self._getArray("Blocks")
+        self._arrays["Blocks"] = value
+
+    @property
+    def Data(self):
+        return self._getArray("Data")
+
+    @property
+    def SkyLight(self):
+        return self._getArray("SkyLight")
+
+    @property
+    def BlockLight(self):
+        return self._getArray("BlockLight")
+
+    def sectionHasBlocks(self, secY):
+        """ False if the section secY is absent or all air. Reads the section tag rather than decoding Blocks. """
+        if "Blocks" in self._arrays:
+            return bool(self._arrays["Blocks"][..., secY << 4:(secY + 1) << 4].any())
+        sec = self._sections.get(secY)
+        return sec is not None and ("Add" in sec or bool(sec["Blocks"].value.any()))
+
+    def _sectionIsEmpty(self, y, sec):
+        """ True if the section at y has no blocks, no block light and full sky light, looking at the decoded arrays
+        where they exist and at the original section tag otherwise. """
+        if "Blocks" in self._arrays:
+            if self._arrays["Blocks"][..., y:y + 16].any():
+                return False
+        elif sec is not None and (sec["Blocks"].value.any() or "Add" in sec):
+            return False
+
+        if "BlockLight" in self._arrays:
+            if self._arrays["BlockLight"][..., y:y + 16].any():
+                return False
+        elif sec is not None and sec["BlockLight"].value.any():
+            return False
+
+        if "SkyLight" in self._arrays:
+            if not (self._arrays["SkyLight"][..., y:y + 16] == 15).all():
+                return False
+        elif sec is not None and not (sec["SkyLight"].value == 0xff).all():
+            return False
+
+        return True
 
     def savedTagData(self):
         """ does not recalculate any data or light """
 
         log.debug(u"Saving chunk: {0}".format(self))
-        sanitizeBlocks(self)
+        if "Blocks" in self._arrays:
+            sanitizeBlocks(self)
 
         sections = nbt.TAG_List()
         for y in range(0, self.world.Height, 16):
-            section = nbt.TAG_Compound()
+            sec = self._sections.get(y / 16)
 
-            Blocks = self.Blocks[..., y:y + 16].swapaxes(0, 2)
-            Data = self.Data[..., y:y + 16].swapaxes(0, 2)
-            BlockLight = self.BlockLight[..., y:y + 16].swapaxes(0, 2)
-            SkyLight = self.SkyLight[..., y:y + 16].swapaxes(0, 2)
-
-            if (not Blocks.any() and
-                    not BlockLight.any() and
-                    (SkyLight == 15).all()):
+            if self._sectionIsEmpty(y, sec):
                 continue
 
-            Data = packNibbleArray(Data)
-            BlockLight = packNibbleArray(BlockLight)
-            SkyLight = packNibbleArray(SkyLight)
+            if sec is not None and not self._arrays:
+                # nothing was decoded, the original section is still accurate
+                sections.append(sec)
+                continue
 
-            add = Blocks >> 8
-            if add.any():
-                section["Add"] = nbt.TAG_Byte_Array(packNibbleArray(add).astype('uint8'))
+            section = nbt.TAG_Compound()
 
-            section['Blocks'] = nbt.TAG_Byte_Array(array(Blocks, 'uint8'))
-            section['Data'] = nbt.TAG_Byte_Array(array(Data))
-            section['BlockLight'] = nbt.TAG_Byte_Array(array(BlockLight))
-            section['SkyLight'] = nbt.TAG_Byte_Array(array(SkyLight))
+            if "Blocks" in self._arrays:
+                Blocks = self._arrays["Blocks"][..., y:y + 16].swapaxes(0, 2)
+                add = Blocks >> 8
+                if add.any():
+                    section["Add"] = nbt.TAG_Byte_Array(packNibbleArray(add).astype('uint8'))
+                section['Blocks'] = nbt.TAG_Byte_Array(array(Blocks, 'uint8'))
+            elif sec is not None:
+                if "Add" in sec:
+                    section["Add"] = sec["Add"]
+                section['Blocks'] = sec["Blocks"]
+            else:
+                section['Blocks'] = nbt.TAG_Byte_Array(zeros(4096, 'uint8'))
+
+            for name in "Data", "BlockLight", "SkyLight":
+                if name in self._arrays:
+                    packed = packNibbleArray(self._arrays[name][..., y:y + 16].swapaxes(0, 2))
+                    section[name] = nbt.TAG_Byte_Array(array(packed))
+                elif sec is not None:
+                    section[name] = sec[name]
+                else:
+                    packed = zeros(2048, 'uint8')
+                    if name == "SkyLight":
+                        packed[:] = 0xff
+                    section[name] = nbt.TAG_Byte_Array(packed)
 
             section["Y"] = nbt.TAG_Byte(y / 16)
             sections.append(section)
@@ -255,6 +354,9 @@ class AnvilChunk(LightedChunk):
     def generateHeightMap(self):
         computeChunkHeightMap(self.materials, self.Blocks, self.HeightMap)
 
+    def sectionHasBlocks(self, secY):
+        return self.chunkData.sectionHasBlocks(secY)
+
     def addEntity(self, entityTag):
 
         def doubleize(name):
@@ -457,6 +559,7 @@ class ChunkedLevelMixin(MCLevel):
             return 0
 
         ch.Data[xInChunk, zInChunk, y] = newdata
+        ch.markDirtyBlocks((xInChunk, zInChunk, y), pending=False, names=("Data",))
         ch.dirty = True
         ch.needsLighting = True
 
@@ -493,6 +596,7 @@ class ChunkedLevelMixin(MCLevel):
             return 0
 
         ch.Blocks[xInChunk, zInChunk, y] = blockID
+        ch.markDirtyBlocks((xInChunk, zInChunk, y), pending=False, names=("Blocks",))
         ch.dirty = True
         ch.needsLighting = True
 
@@ -1053,6 +1157,7 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel, PCMetadata):
 
         # maps (cx, cz) pairs to AnvilChunkData
         self._loadedChunkData = {}
+        self.undoJournal = None if readonly else UndoJournal(self)
         self.recentChunks = collections.deque(maxlen=20)
 
         self.chunksNeedingLighting = set()
@@ -1111,6 +1216,16 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel, PCMetadata):
         self.saving = False
         log.info(u"Saved {0} chunks (dim {1})".format(dirtyChunkCount, self.dimNo))
 
+    @property
+    def hasUnsavedChanges(self):
+        """
+        True if any chunk has changes that have not been saved to the world folder.
+        """
+        if self.readonly:
+            return False
+        return (any(chunkData.dirty for chunkData in self._loadedChunkData.itervalues())
+                or bool(self.unsavedWorkFolder.listChunks()))
+
     def unload(self):
         """
         Unload all chunks and close all open filehandles.
@@ -1321,6 +1436,8 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel, PCMetadata):
             raise ChunkAccessDenied
         self.checkSessionLock()
 
+        self._recordCopiedChunk(world, cx, cz, cx, cz)
+
         destChunk = self._loadedChunks.get((cx, cz))
         sourceChunk = world._loadedChunks.get((cx, cz))
 
@@ -1360,6 +1477,55 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel, PCMetadata):
 
                 self.unsavedWorkFolder.copyChunkFrom(sourceFolder, cx, cz)
 
+    def copyChunkFromOffset(self, world, cx, cz, dcx, dcz, rewriteLevelTag):
+        """
+        Copy the chunk at cx, cz in world to dcx, dcz in self without decoding its blocks. The chunk's tag is loaded
+        lazily and its xPos and zPos updated, then rewriteLevelTag(levelTag) is called to move the entities, tile
+        entities and tile ticks it holds. The sections are written back byte for byte.
+
+        Returns False without copying anything if the destination chunk is in use, in which case the caller should
+        copy its blocks instead.
+        """
+        assert isinstance(world, MCInfdevOldLevel)
+        if self.readonly:
+            raise IOError("World is opened read only.")
+        if world.saving | self.saving:
+            raise ChunkAccessDenied
+        self.checkSessionLock()
+
+        if (dcx, dcz) in self._loadedChunks:
+            return False
+
+        sourceData = world._loadedChunkData.get((cx, cz))
+        if sourceData is not None and sourceData.dirty:
+            data = sourceData.savedTagData()
+        else:
+            data = world._getChunkBytes(cx, cz)
+
+        self._recordCopiedChunk(world, cx, cz, dcx, dcz)
+
+        root_tag = nbt.load(buf=data, lazy=True)
+        levelTag = root_tag["Level"]
+        levelTag["xPos"].value = dcx
+        levelTag["zPos"].value = dcz
+        rewriteLevelTag(levelTag)
+
+        self._loadedChunkData.pop((dcx, dcz), None)
+        self.unsavedWorkFolder.saveChunk(dcx, dcz, root_tag.save(compressed=False))
+        return True
+
+    def _recordCopiedChunk(self, world, cx, cz, dcx, dcz):
+        if self.undoJournal.recording:
+            if self.containsChunk(dcx, dcz):
+                self.undoJournal.recordReplacedChunk(self._getChunkData(dcx, dcz))
+            else:
+                self.undoJournal.recordNewChunk(dcx, dcz)
+
+        if world.containsChunk(cx, cz) and not self.containsChunk(dcx, dcz):
+            if self._allChunks is not None:
+                self._allChunks.add((dcx, dcz))
+            self._bounds = None
+
     def _getChunkBytes(self, cx, cz):
         if not self.readonly and self.unsavedWorkFolder.containsChunk(cx, cz):
             return self.unsavedWorkFolder.readChunk(cx, cz)
@@ -1376,7 +1542,7 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel, PCMetadata):
 
         try:
             data = self._getChunkBytes(cx, cz)
-            root_tag = nbt.load(buf=data)
+            root_tag = nbt.load(buf=data, lazy=True)
             chunkData = AnvilChunkData(self, (cx, cz), root_tag)
         except (MemoryError, ChunkNotPresent):
             raise
@@ -1411,14 +1577,15 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel, PCMetadata):
         """ read the chunk from disk, load it, and return it."""
 
         chunk = self._loadedChunks.get((cx, cz))
-        if chunk is not None:
-            return chunk
+        if chunk is None:
+            chunkData = self._getChunkData(cx, cz)
+            chunk = AnvilChunk(chunkData)
 
-        chunkData = self._getChunkData(cx, cz)
-        chunk = AnvilChunk(chunkData)
+            self._loadedChunks[cx, cz] = chunk
+            self.recentChunks.append(chunk)
 
-        self._loadedChunks[cx, cz] = chunk
-        self.recentChunks.append(chunk)
+        if self.undoJournal is not None and self.undoJournal.recording:
+            self.undoJournal.recordChunk(chunk.chunkData)
         return chunk
 
     def markDirtyChunk(self, cx, cz):
@@ -1479,6 +1646,10 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel, PCMetadata):
         chunk = self.getChunk(x >> 4, z >> 4)
         return chunk.tileEntityAt(x, y, z)
 
+    def tileTickAt(self, x, y, z):
+        chunk = self.getChunk(x >> 4, z >> 4)
+        return chunk.tileTickAt(x, y, z)
+
     def addTileEntity(self, tileEntityTag):
         assert isinstance(tileEntityTag, nbt.TAG_Compound)
         if 'x' not in tileEntityTag:
@@ -1571,6 +1742,8 @@ class MCInfdevOldLevel(ChunkedLevelMixin, EntityLevel, PCMetadata):
             raise ValueError("{0}:Chunk {1} already present!".format(self, (cx, cz)))
         if self._allChunks is not None:
             self._allChunks.add((cx, cz))
+        if self.undoJournal is not None:
+            self.undoJournal.recordNewChunk(cx, cz)
 
         self._storeLoadedChunkData(AnvilChunkData(self, (cx, cz), create=True))
         self._bounds = None
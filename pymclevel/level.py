@@ -13,7 +13,7 @@ import materials
 from math import floor
 from mclevelbase import ChunkMalformed, ChunkNotPresent
 import nbt
-from numpy import argmax, swapaxes, zeros, zeros_like
+from numpy import argmax, array, flatnonzero, swapaxes, zeros, zeros_like
 import os.path
 
 log = getLogger(__name__)
@@ -62,6 +62,12 @@ def extractHeights(array):
     return heightMap
 
 
+def positionsInBox(positions, box):
+    """ Given an array of x, y, z positions of shape (n, 3), returns a boolean array that is True for the positions
+    within box. """
+    return ((positions >= box.origin) & (positions < box.maximum)).all(axis=1)
+
+
 def getSlices(box, height):
     """ call this method to iterate through a large slice of the world by
         visiting each chunk and indexing its data with a subslice.
@@ -136,6 +142,26 @@ def getSlices_cc(box):
                 )
                 yield (cx, cy, cz), slices, point
 
+
+def getSectionSlices(chunk, slices, point):
+    """ Splits the slices and point yielded with a chunk by getChunkSlices or getChunkSlices_cc at the chunk's
+    16-block-high section boundaries, and yields a (slices, point) pair for each section that holds anything but
+    air. Sections the chunk reports as absent or empty through sectionHasBlocks are skipped without touching their
+    arrays, so operations that only change or count existing blocks cost what the chunk stores rather than the
+    volume of the box.
+    """
+    sx, sz, sy = slices
+    miny, maxy, _ = sy.indices(chunk.Height)
+    px, py, pz = point
+
+    for y in range(miny & ~0xf, maxy, 16):
+        if not chunk.sectionHasBlocks(y >> 4):
+            continue
+        lo = max(y, miny)
+        hi = min(y + 16, maxy)
+        yield (sx, sz, slice(lo, hi)), (px, py + lo - miny, pz)
+
+
 class MCLevel(object):
     """ MCLevel is an abstract class providing many routines to the different level types,
     including a common copyEntitiesFrom built on class-specific routines, and
@@ -150,6 +176,8 @@ class MCLevel(object):
 
     materials = materials.classicMaterials
     isInfinite = False
+    # True for levels stored as 16x16x16 cubes, reached through getChunk_cc, instead of full-height columns
+    cubicChunks = False
 
     saving = False
 
@@ -221,6 +249,9 @@ class MCLevel(object):
     def tileEntityAt(self, x, y, z):
         return None
 
+    def tileTickAt(self, x, y, z):
+        return None
+
     def addTileEntity(self, entityTag):
         pass
 
@@ -233,6 +264,17 @@ class MCLevel(object):
     def getEntitiesInBox(self, box):
         return []
 
+    def queryEntities(self, box, ids=None):
+        """
+        Returns a list of references to the entities whose positions are within box and, if ids is given, whose id
+        is in ids. Levels made of chunks only look at the chunks that intersect box.
+        """
+        entities = self.getEntitiesInBox(box)
+        if ids is not None:
+            ids = set(ids)
+            entities = [ent for ent in entities if ent["id"].value in ids]
+        return entities
+
     def getTileEntitiesInBox(self, box):
         return []
 
@@ -454,6 +496,11 @@ class MCLevel(object):
             return 0
         self.Blocks[x, z, y] = blockID
 
+    # --- Block accessors for arrays of points and boxes ---
+
+    from block_access import (blocksAt, setBlocksAt, blocksDataAt, setBlocksDataAt, blocksLightAt, setBlocksLightAt,
+                              skylightsAt, setSkylightsAt, getBlockArray, setBlockArray)
+
     # --- Fill and Replace ---
 
     from block_fill import fillBlocks, fillBlocksIter
@@ -530,7 +577,23 @@ class EntityLevel(MCLevel):
 
     def getEntitiesInBox(self, box):
         """Returns a list of references to entities in this chunk, whose positions are within box"""
-        return [ent for ent in self.Entities if Entity.pos(ent) in box]
+        entities = self.Entities
+        return [entities[i] for i in flatnonzero(positionsInBox(self.entityPositions(), box))]
+
+    _entityPositions = None
+
+    def entityPositions(self):
+        """
+        Returns the positions of the tags in Entities as an array of shape (n, 3), in the order of the list. The
+        array is kept until Entities is replaced or its version shows it was changed through the tag. Entities moved
+        by changing their Pos tags are not noticed; call _entitiesMoved after moving them.
+        """
+        entities = self.Entities
+        cache = self._entityPositions
+        if cache is None or cache[0] is not entities or cache[1] != entities.version:
+            positions = array([Entity.pos(ent) for ent in entities], 'float64').reshape(-1, 3)
+            cache = self._entityPositions = (entities, entities.version, positions)
+        return cache[2]
 
     def getTileEntitiesInBox(self, box):
         """Returns a list of references to tile entities in this chunk, whose positions are within box"""
@@ -545,22 +608,29 @@ class EntityLevel(MCLevel):
     def removeEntities(self, func):
         if not hasattr(self, "Entities"):
             return
-        newEnts = []
-        for ent in self.Entities:
-            if func(Entity.pos(ent)):
-                continue
-            newEnts.append(ent)
+        keep = array([not func(p) for p in self.entityPositions().tolist()], bool)
+        return self._keepEntities(keep)
+
+    def removeEntitiesInBox(self, box):
+        if not hasattr(self, "Entities"):
+            return
+        return self._keepEntities(~positionsInBox(self.entityPositions(), box))
+
+    def _keepEntities(self, keep):
+        """ Removes the entities for which keep is False, keeping the position array up to date. """
+        entities = self.Entities
+        positions = self._entityPositions[2]
+        indexes = flatnonzero(keep)
 
-        entsRemoved = len(self.Entities) - len(newEnts)
+        entsRemoved = len(entities) - len(indexes)
         log.debug("Removed {0} entities".format(entsRemoved))
 
-        self.Entities.value[:] = newEnts
+        if entsRemoved:
+            entities[:] = [entities[i] for i in indexes]
+            self._entityPositions = (entities, entities.version, positions[indexes])
 
         return entsRemoved
 
-    def removeEntitiesInBox(self, box):
-        return self.removeEntities(lambda p: p in box)
-
     def removeTileEntities(self, func):
         if not hasattr(self, "TileEntities"):
             return
@@ -573,7 +643,8 @@ class EntityLevel(MCLevel):
         entsRemoved = len(self.TileEntities) - len(newEnts)
         log.debug("Removed {0} tile entities".format(entsRemoved))
 
-        self.TileEntities.value[:] = newEnts
+        self.TileEntities[:] = newEnts
+        self._tileEntityIndex = None
 
         return entsRemoved
 
@@ -592,7 +663,8 @@ class EntityLevel(MCLevel):
         entsRemoved = len(self.TileTicks) - len(newEnts)
         log.debug("Removed {0} tile tickss".format(entsRemoved))
 
-        self.TileTicks.value[:] = newEnts
+        self.TileTicks[:] = newEnts
+        self._tileTickIndex = None
 
         return entsRemoved
 
@@ -606,42 +678,55 @@ class EntityLevel(MCLevel):
     def addEntity(self, entityTag):
         assert isinstance(entityTag, nbt.TAG_Compound)
         self.Entities.append(entityTag)
+        self._entityPositions = None
         self._fakeEntities = None
 
+    _tileEntityIndex = None
+    _tileTickIndex = None
+
+    def _positionIndex(self, listTag, cls, attr):
+        index = getattr(self, attr)
+        if index is None or not index.matches(listTag):
+            index = _PositionIndex(listTag, cls.pos)
+            setattr(self, attr, index)
+        return index
+
     def tileEntityAt(self, x, y, z):
-        entities = []
-        for entityTag in self.TileEntities:
-            if TileEntity.pos(entityTag) == [x, y, z]:
-                entities.append(entityTag)
-
-        if len(entities) > 1:
-            log.info("Multiple tile entities found: {0}".format(entities))
-        if len(entities) == 0:
-            return None
+        index = self._positionIndex(self.TileEntities, TileEntity, "_tileEntityIndex")
+        pos = (x, y, z)
+        if pos in index.duplicates:
+            log.info("Multiple tile entities found at {0}".format(pos))
+        return index.get(pos)
 
-        return entities[0]
+    def tileTickAt(self, x, y, z):
+        if not hasattr(self, "TileTicks"):
+            return None
+        return self._positionIndex(self.TileTicks, TileTick, "_tileTickIndex").get((x, y, z))
 
     def addTileEntity(self, tileEntityTag):
         assert isinstance(tileEntityTag, nbt.TAG_Compound)
-
-        def differentPosition(a):
-            return not ((tileEntityTag is a) or TileEntity.pos(a) == TileEntity.pos(tileEntityTag))
-
-        self.TileEntities.value[:] = filter(differentPosition, self.TileEntities)
-
-        self.TileEntities.append(tileEntityTag)
+        self._addAtPosition(tileEntityTag, self.TileEntities, TileEntity, "_tileEntityIndex")
         self._fakeEntities = None
 
     def addTileTick(self, tickTag):
         assert isinstance(tickTag, nbt.TAG_Compound)
         if hasattr(self, "TileTicks"):
-            def differentPosition(a):
-                return not ((tickTag is a) or TileTick.pos(a) == TileTick.pos(tickTag))
+            self._addAtPosition(tickTag, self.TileTicks, TileTick, "_tileTickIndex")
+            self._fakeEntities = None
 
-            self.TileTicks.value[:] = filter(differentPosition, self.TileTicks)
+    def _addAtPosition(self, tag, listTag, cls, attr):
+        """
+        Adds tag to listTag, replacing any tag already at the same position.
+        """
+        index = self._positionIndex(listTag, cls, attr)
+        if not index.put(tag):
+            # the list holds several tags for this position, or tag itself at another position.
+            def differentPosition(a):
+                return not ((tag is a) or cls.pos(a) == cls.pos(tag))
 
-            self.TileTicks.append(tickTag)
-            self._fakeEntities = None
+            listTag[:] = filter(differentPosition, listTag)
+            listTag.append(tag)
+            setattr(self, attr, None)
 
     def addTileTicks(self, tileTicks):
         for e in tileTicks:
@@ -649,6 +734,13 @@ class EntityLevel(MCLevel):
 
     _fakeEntities = None
 
+    def _entitiesMoved(self):
+        """ Forgets the cached entity positions, for after entities or tile entities were moved in place. """
+        self._entityPositions = None
+        self._tileEntityIndex = None
+        self._tileTickIndex = None
+        self._fakeEntities = None
+
     def _getFakeChunkEntities(self, cx, cz):
         """distribute entities into sublists based on fake chunk position
         _fakeEntities keys are (cx, cz) and values are (Entities, TileEntities, TileTicks)"""
@@ -664,6 +756,75 @@ class EntityLevel(MCLevel):
         return self._fakeEntities[cx, cz]
 
 
+class _PositionIndex(object):
+    """
+    Maps the (x, y, z) positions of the tags in a TileEntities or TileTicks list to their indexes in the list, so
+    EntityLevel can find and replace the tag at a position without scanning the list.
+
+    EntityLevel rebuilds the index whenever the list is replaced or its version shows it was changed through the
+    tag since the index was built. Changes made directly to the list in its value are not noticed. A tag whose
+    position changed after it was indexed is caught when it is looked up, and also causes a rebuild.
+    """
+
+    def __init__(self, listTag, posFunc):
+        self.listTag = listTag
+        self.posFunc = posFunc
+        self.positions = {}
+        self.indexes = {}  # id(tag) -> index, to notice a tag being added again after it was moved
+        self.duplicates = set()
+        for i, tag in enumerate(listTag):
+            pos = self._pos(tag)
+            if pos in self.positions:
+                self.duplicates.add(pos)
+            else:
+                self.positions[pos] = i
+            self.indexes[id(tag)] = i
+        self.version = listTag.version
+
+    def _pos(self, tag):
+        return tuple(self.posFunc(tag))
+
+    def matches(self, listTag):
+        return listTag is self.listTag and listTag.version == self.version
+
+    def _rebuild(self):
+        self.__init__(self.listTag, self.posFunc)
+
+    def get(self, pos):
+        i = self.positions.get(pos)
+        if i is None:
+            return None
+        tag = self.listTag[i]
+        if self._pos(tag) != pos:
+            self._rebuild()
+            return self.get(pos)
+        return tag
+
+    def put(self, tag):
+        """
+        Stores tag at its position, replacing the tag already there. Returns False without changing anything if
+        that would leave other tags at the same position, or a copy of tag at another position, in the list.
+        """
+        pos = self._pos(tag)
+        if pos in self.duplicates:
+            return False
+        i = self.indexes.get(id(tag))
+        if i is not None and self.listTag[i] is tag and self.positions.get(pos) != i:
+            return False
+
+        if self.get(pos) is None:
+            i = len(self.listTag)
+            self.listTag.append(tag)
+            self.positions[pos] = i
+        else:
+            i = self.positions[pos]
+            self.indexes.pop(id(self.listTag[i]), None)
+            self.listTag[i] = tag
+        self.indexes[id(tag)] = i
+        self.version = self.listTag.version
+        return True
+
+
 class ChunkBase(EntityLevel):
     dirty = False
     needsLighting = False
@@ -699,6 +860,18 @@ class ChunkBase(EntityLevel):
         self.dirty = True
         self.needsLighting = needsLighting or self.needsLighting
 
+    def markDirtyBlocks(self, slices, pending=True, names=("Blocks", "Data")):
+        """ Records that the arrays in names (Blocks, Data, BlockLight or SkyLight) were changed at slices, an
+        [x, z, y] index into them made of slices or arrays. Call it before chunkChanged(), which then takes the marks
+        made since the last chunkChanged() to cover every change. Pass pending=False when no chunkChanged() call
+        follows, as the per-block setters do. Only chunks that track changes more finely than the whole chunk use
+        it. """
+        pass
+
+    def sectionHasBlocks(self, secY):
+        """ Returns False if the 16-block-high section secY of this chunk holds nothing but air. """
+        return bool(self.Blocks[..., secY << 4:(secY + 1) << 4].any())
+
     @property
     def materials(self):
         return self.world.materials
@@ -31,8 +31,7 @@ except Exception as e:
 
 def loadNBTCompoundList(data, littleEndian=True):
     """
-    Loads a list of NBT Compound tags from a bunch of data.
-    Uses sep to determine where the next Compound tag starts.
+    Loads a list of NBT Compound tags stored one after another, as Pocket Edition stores entities and tile entities.
     :param data: str, the NBT to load from
     :param littleEndian: bool. Determines endianness
     :return: list of TAG_Compounds
@@ -40,23 +39,26 @@ def loadNBTCompoundList(data, littleEndian=True):
     if type(data) is unicode:
         data = str(data)
 
-    def load(_data):
-        sep = "\x00\x00\x00\x00\n"
-        sep_data = _data.split(sep)
-        compounds = []
-        for d in sep_data:
-            if len(d) != 0:
-                if not d.startswith("\n"):
-                    d = "\n" + d
-                tag = (nbt.load(buf=(d + '\x00\x00\x00\x00')))
-                compounds.append(tag)
-        return compounds
+    if littleEndian:
+        with nbt.littleEndianNBT():
+            return nbt.load_root_compounds(data)
+    else:
+        return nbt.load_root_compounds(data)
 
+
+def saveNBTCompoundList(tags, littleEndian=True, replace=None):
+    """
+    Saves a list of NBT Compound tags one after another into a single string. The inverse of loadNBTCompoundList.
+    :param tags: list of TAG_Compounds
+    :param littleEndian: bool. Determines endianness
+    :param replace: function, see nbt.save_root_compounds
+    :return: str
+    """
     if littleEndian:
         with nbt.littleEndianNBT():
-            return load(data)
+            return nbt.save_root_compounds(tags, replace)
     else:
-        return load(data)
+        return nbt.save_root_compounds(tags, replace)
 
 
 def TagProperty(tagName, tagType, default_or_func=None):
@@ -83,6 +85,13 @@ def TagProperty(tagName, tagType, default_or_func=None):
     return property(getter, setter)
 
 
+# Chunk records are keyed by the chunk's coordinates followed by a tag byte. Keys sort bytewise, so all the records
+# of a chunk are next to each other, and so are all the chunks with the same x coordinate.
+_chunkKey = struct.Struct('<ii')
+# The tags of the terrain, tile entity and entity records, in the order they are read.
+_chunkRecordTags = "012"
+
+
 class PocketLeveldbDatabase(object):
     """
     Not to be confused with leveldb_mcpe.DB
@@ -160,38 +169,99 @@ class PocketLeveldbDatabase(object):
                 del self._world_db
                 self._world_db = None
 
+    @staticmethod
+    def _readChunkRecords(it, prefix):
+        """
+        Reads the records stored under the key prefix of a chunk, starting from an iterator positioned at the first
+        of them, and leaves the iterator at the first key after them.
+        :param it: Iterator
+        :param prefix: str, 8-byte key prefix of the chunk
+        :return: list, [terrain, tile entities, entities], None for each record that is not present
+        """
+        records = [None, None, None]
+        while it.Valid():
+            key = it.key()
+            if not key.startswith(prefix):
+                break
+            if len(key) == 9:  # Nether keys also start with the prefix, but have a dimension before the tag.
+                i = _chunkRecordTags.find(key[8])
+                if i != -1:
+                    records[i] = it.value()
+            it.Next()
+        return records
+
     def _readChunk(self, cx, cz, readOptions=None):
         """
+        Reads all the records of a chunk with a single seek.
         :param cx, cz: int Coordinates of the chunk
         :param readOptions: ReadOptions
-        :return: None
+        :return: (terrain, tile_entities, entities), or None if the chunk has no terrain
         """
-        key = struct.pack('<i', cx) + struct.pack('<i', cz)
+        prefix = _chunkKey.pack(cx, cz)
         with self.world_db() as db:
             rop = self.readOptions if readOptions is None else readOptions
+            it = db.NewIterator(rop)
+            it.Seek(prefix)
+            terrain, tile_entities, entities = self._readChunkRecords(it, prefix)
+            it.status()
+            del it
 
-            # Only way to see if value exists is by failing db.Get()
-            try:
-                terrain = db.Get(rop, key + "0")
-            except RuntimeError:
-                return None
-
-            try:
-                tile_entities = db.Get(rop, key + "1")
-            except RuntimeError:
-                tile_entities = None
-
-            try:
-                entities = db.Get(rop, key + "2")
-            except RuntimeError:
-                entities = None
-
+        if terrain is None:
+            return None
         if len(terrain) != 83200:
             raise ChunkMalformed(str(len(terrain)))
 
         logger.debug("CHUNK LOAD %s %s"%(cx, cz))
         return terrain, tile_entities, entities
 
+    def iterChunkData(self, box=None, readOptions=None):
+        """
+        Reads every chunk that has terrain data, or only those inside box, in the order they are stored in the
+        database. Each column of chunks with the same x coordinate is read sequentially, after a single seek, and
+        the records of chunks outside the box are stepped over without reading their values. Malformed chunks are
+        logged and skipped.
+        :param box: pymclevel.box.BoundingBox, or None for the whole world
+        :param readOptions: ReadOptions
+        :yield: (cx, cz, (terrain, tile_entities, entities))
+        """
+        if box is None:
+            xPrefixes = [""]
+        else:
+            xPrefixes = [struct.pack('<i', cx) for cx in xrange(box.mincx, box.maxcx)]
+
+        with self.world_db() as db:
+            rop = self.readOptions if readOptions is None else readOptions
+            it = db.NewIterator(rop)
+            for xPrefix in xPrefixes:
+                if xPrefix:
+                    it.Seek(xPrefix)
+                else:
+                    it.SeekToFirst()
+
+                while it.Valid():
+                    key = it.key()
+                    if not key.startswith(xPrefix):
+                        break
+                    if len(key) < 8:
+                        it.Next()
+                        continue
+                    prefix = key[:8]
+                    cx, cz = _chunkKey.unpack(prefix)
+                    if box is not None and not box.mincz <= cz < box.maxcz:
+                        while it.Valid() and it.key().startswith(prefix):
+                            it.Next()
+                        continue
+
+                    records = self._readChunkRecords(it, prefix)
+                    if records[0] is None:
+                        continue
+                    if len(records[0]) != 83200:
+                        logger.warning("Skipping malformed chunk %s %s (%d bytes of terrain)"%(cx, cz, len(records[0])))
+                        continue
+                    yield cx, cz, tuple(records)
+            it.status()
+            del it
+
     def saveChunk(self, chunk, batch=None, writeOptions=None):
         """
         :param chunk: PocketLeveldbChunk
@@ -260,18 +330,9 @@ class PocketLeveldbDatabase(object):
             it.SeekToFirst()
             while it.Valid():
                 key = it.key()
-
-                if len(key) != 9:  # Bad. Hardcode since nether has length 13. Someone go fix nether.
-                    it.Next()
-                    continue
-                    
-                raw_x = key[0:4]
-                raw_z = key[4:8]
-                t = key[8]
-
-                if t == "0":
-                    cx, cz = struct.unpack('<i', raw_x), struct.unpack('<i', raw_z)
-                    allChunks.append((cx[0], cz[0]))
+                # Only terrain keys are decoded. Nether keys have length 13 and are skipped.
+                if len(key) == 9 and key[8] == "0":
+                    allChunks.append(_chunkKey.unpack_from(key))
                 it.Next()
             it.status()  # All this does is cause an exception if something went wrong. Might be unneeded?
             del it
@@ -493,6 +554,32 @@ class PocketLeveldbWorld(ChunkedLevelMixin, MCLevel):
             self._loadedChunks[(cx, cz)] = c
         return c
 
+    def getChunksInBox(self, box=None):
+        """
+        Yields the chunks inside box, or all chunks if box is None. Chunks that are not loaded yet are read in the
+        order they are stored in the database, so scanning the whole world is a sequential read.
+        :param box: pymclevel.box.BoundingBox
+        :yield: PocketLeveldbChunk
+        """
+        seen = set()
+        for cx, cz, data in self.worldFile.iterChunkData(box):
+            seen.add((cx, cz))
+            c = self._loadedChunks.get((cx, cz))
+            if c is None:
+                c = PocketLeveldbChunk(cx, cz, self, data)
+                self._loadedChunks[(cx, cz)] = c
+            yield c
+
+        # Chunks created since the world was last saved are not in the database yet.
+        for (cx, cz), c in self._loadedChunks.items():
+            if (cx, cz) not in seen and (box is None or (box.mincx <= cx < box.maxcx and box.mincz <= cz < box.maxcz)):
+                yield c
+
+    def getChunks(self, chunks=None):
+        if chunks is None:
+            return self.getChunksInBox()
+        return super(PocketLeveldbWorld, self).getChunks(chunks)
+
     def unload(self):
         """
         Unload all chunks and close all open file-handlers.
@@ -603,8 +690,10 @@ class PocketLeveldbWorld(ChunkedLevelMixin, MCLevel):
         self.saving = True
         batch = leveldb_mcpe.WriteBatch()
         dirtyChunkCount = 0
-        for c in self.chunksNeedingLighting:
-            self.getChunk(*c).genFastLights()
+        for c in list(self.chunksNeedingLighting):
+            chunk = self.getChunk(*c)
+            chunk.genFastLights()
+            chunk.needsLighting = False
 
         for chunk in self._loadedChunks.itervalues():
             if chunk.dirty:
@@ -976,6 +1065,11 @@ class PocketLeveldbChunk(LightedChunk):
     _TileEntities = nbt.TAG_List()
     dirty = False
 
+    # [x, z, segment] array of the 16-block segments of each column changed since the chunk was last saved, or None
+    _dirtySegments = None
+    # True when markDirtyBlocks has been called with pending=True since the last chunkChanged
+    _blocksMarked = False
+
     def __init__(self, cx, cz, world, data=None, create=False):
         """
         :param cx, cz int, int Coordinates of the chunk
@@ -1006,15 +1100,16 @@ class PocketLeveldbChunk(LightedChunk):
                 Entities = loadNBTCompoundList(data[2])
                 # PE saves entities with their int ID instead of string name. We swap them to make it work in mcedit.
                 # Whenever we save an entity, we need to make sure to swap back.
-                invertEntities = {v: k for k, v in entity.PocketEntity.entityList.items()}
+                entityList = entity.PocketEntity.entityList
+                invertEntities = {v: k for k, v in entityList.iteritems()}
                 for ent in Entities:
                     # Get the string id, or a build one
                     v = ent["id"].value
                     id = invertEntities.get(v, "Entity %s"%v)
                     # Add the built one to the entities
-                    if id not in entity.PocketEntity.entityList.keys():
+                    if id not in entityList:
                         logger.warning("Found unknown entity '%s'"%v)
-                        entity.PocketEntity.entityList[id] = v
+                        entityList[id] = v
                     ent["id"] = nbt.TAG_String(id)
                 self.Entities = nbt.TAG_List(Entities, list_type=nbt.TAG_COMPOUND)
 
@@ -1059,6 +1154,63 @@ class PocketLeveldbChunk(LightedChunk):
         self.Data.shape = (chunkSize, chunkSize, self.world.Height)
         self.DirtyColumns.shape = chunkSize, chunkSize
 
+    def markDirtyBlocks(self, slices, pending=True, names=("Blocks", "Data")):
+        """
+        Records the 16-block segments of each column touched by slices, so that only they are relit and flagged in
+        DirtyColumns when the chunk is saved.
+        """
+        x, z, y = slices
+        if isinstance(y, slice):
+            start, stop, step = y.indices(self.world.Height)
+            if stop <= start:
+                return
+            y = slice(start >> 4, ((stop - 1) >> 4) + 1)
+        else:
+            y = numpy.asarray(y) >> 4
+
+        if self._dirtySegments is None:
+            self._dirtySegments = numpy.zeros((16, 16, self.world.Height >> 4), dtype=bool)
+        self._dirtySegments[x, z, y] = True
+        if pending:
+            self._blocksMarked = True
+
+    def chunkChanged(self, calcLighting=True):
+        # Blocks changed by code that doesn't call markDirtyBlocks could be anywhere in the chunk
+        if not self._blocksMarked:
+            self.markDirtyBlocks((slice(None), slice(None), slice(None)))
+        self._blocksMarked = False
+        super(PocketLeveldbChunk, self).chunkChanged(calcLighting)
+
+    def genFastLights(self):
+        """
+        Recomputes the skylight of the changed columns, from the top of their highest changed segment down. Light
+        above that is not affected by the changes.
+        """
+        if self._dirtySegments is None or self.world.dimNo in (-1, 1):
+            return super(PocketLeveldbChunk, self).genFastLights()
+
+        blocks = self.Blocks
+        la = self.world.materials.lightAbsorption
+        skylight = self.SkyLight
+        heightmap = self.HeightMap
+        segments = self._dirtySegments.shape[2]
+        # (index of the highest dirty segment + 1) * 16 for each column, 0 for clean columns
+        tops = (segments - numpy.argmax(self._dirtySegments[..., ::-1], axis=2)) << 4
+        tops[~self._dirtySegments.any(axis=2)] = 0
+
+        for x, z in zip(*tops.nonzero()):
+            top = tops[x, z]
+            height = min(heightmap[z, x], top)
+            skylight[x, z, :height] = 0
+            skylight[x, z, height:top] = 15
+            lv = 15 if height == heightmap[z, x] else int(skylight[x, z, top])
+            for y in reversed(range(height)):
+                lv -= (la[blocks[x, z, y]] or 1)
+
+                if lv <= 0:
+                    break
+                skylight[x, z, y] = lv
+
     def savedData(self):
         """
         Returns the data of the chunk to save to the database.
@@ -1076,32 +1228,21 @@ class PocketLeveldbChunk(LightedChunk):
             data[..., 1] |= data[..., 0]
             return numpy.array(data[:, :, :, 1])
 
-        if self.dirty:
-            # elements of DirtyColumns are bitfields. Each bit corresponds to a
-            # 16-block segment of the column. We set all of the bits because
-            # we only track modifications at the chunk level.
+        # elements of DirtyColumns are bitfields. Each bit corresponds to a
+        # 16-block segment of the column.
+        if self._dirtySegments is not None:
+            segmentBits = 1 << numpy.arange(self._dirtySegments.shape[2], dtype='uint8')
+            self.DirtyColumns |= numpy.dot(self._dirtySegments, segmentBits).astype('uint8')
+            self._dirtySegments = None
+        elif self.dirty:
+            # Changed without saying which blocks, so every segment has to be assumed changed.
             self.DirtyColumns[:] = 255
 
-        with nbt.littleEndianNBT():
-            entityData = ""
-            tileEntityData = ""
-
-            for ent in self.TileEntities:
-                tileEntityData += ent.save(compressed=False)
-
-            for ent in self.Entities:
-                v = ent["id"].value
-#                 ent["id"] = nbt.TAG_Int(entity.PocketEntity.entityList[v])
-                id = entity.PocketEntity.getNumId(v)
-#                 print id
-                if id >= 1000:
-                    print id
-                    print type(ent)
-                    print ent
-                ent['id'] = nbt.TAG_Int(id)
-                entityData += ent.save(compressed=False)
-                # We have to re-invert after saving otherwise the next save will fail.
-                ent["id"] = nbt.TAG_String(v)
+        tileEntityData = saveNBTCompoundList(self.TileEntities)
+        # PE saves entities with their int ID instead of string name, so the ID is swapped as each entity is written.
+        getNumId = entity.PocketEntity.getNumId
+        entityData = saveNBTCompoundList(self.Entities,
+                                         replace=lambda ent: {"id": nbt.TAG_Int(getNumId(ent["id"].value))})
 
         terrain = ''.join([self.Blocks.tostring(),
                            packData(self.Data).tostring(),
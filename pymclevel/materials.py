@@ -1,5 +1,6 @@
 from logging import getLogger
 from numpy import zeros, rollaxis, indices
+import numpy
 import traceback
 from os.path import join
 from collections import defaultdict
@@ -7,11 +8,14 @@ from pprint import pformat
 import mclangres
 import json
 import os
+import cPickle
+import hashlib
+import pkgutil
+import tempfile
+from directories import getCacheDir
 
 NOTEX = (0x1F0, 0x1F0)
 
-import yaml
-
 log = getLogger(__name__)
 
 
@@ -44,6 +48,9 @@ class Block(object):
     def __getattr__(self, attr):
         if attr in self.__dict__:
             return self.__dict__[attr]
+        if attr == "yaml" and self.materials._yamlCache is not None:
+            self.materials._loadCachedYaml()
+            return getattr(self, attr)
         if attr == "name":
             r = self.materials.names[self.ID]
         else:
@@ -57,6 +64,14 @@ id_limit = 4096
 
 
 class MCMaterials(object):
+    # Folder for the compiled block tables of each yaml file, see addYamlBlocksFromFile. None turns the cache off.
+    cacheDir = join(getCacheDir(), u"MaterialsCache")
+    cacheVersion = 1
+    cacheArrays = ("blockTextures", "lightEmission", "lightAbsorption", "flatColors")
+    cacheLists = ("type", "idStr")
+    # lists of 16 names for each ID, mostly left at their default
+    cacheRows = ("names", "aka", "search")
+
     defaultColor = (0xc9, 0x77, 0xf0, 0xff)
     defaultBrightness = 0
     defaultOpacity = 15
@@ -65,7 +80,11 @@ class MCMaterials(object):
 
     def __init__(self, defaultName="Unused Block"):
         object.__init__(self)
-        self.yamlDatas = []
+        self._yamlDatas = []
+        # SHA-1 of each yaml file loaded, which identifies the cached tables built from them
+        self.yamlHashes = []
+        # (cache path, blocks) while the parsed yaml of blocks loaded by _loadCache has not been read
+        self._yamlCache = None
 
         self.defaultName = defaultName
 
@@ -184,31 +203,171 @@ class MCMaterials(object):
 
     def addYamlBlocksFromFile(self, filename):
         try:
-            import pkg_resources
-
-            f = pkg_resources.resource_stream(__name__, filename)
+            # pkgutil rather than pkg_resources, which takes longer to import than the cached tables take to load
+            text = pkgutil.get_data(__name__, filename)
+            if text is None:
+                raise IOError("loader can not read data files")
         except (ImportError, IOError), e:
-            log.debug("Cannot get resource_stream for %s %s"%(filename, e))
+            log.debug("Cannot get data for %s %s"%(filename, e))
             root = os.environ.get("PYMCLEVEL_YAML_ROOT", "pymclevel")  # fall back to cwd as last resort
             path = join(root, filename)
 
-            log.debug("Failed to read %s using pkg_resources. Trying %s instead." % (filename, path))
+            log.debug("Failed to read %s using pkgutil. Trying %s instead." % (filename, path))
 
-            f = file(path)
+            with file(path) as f:
+                text = f.read()
         try:
-            log.info(u"Loading block info from %s", f)
+            log.info(u"Loading block info from %s", filename)
+            textHash = hashlib.sha1(text).hexdigest()
+            self.yamlHashes.append(textHash)
+
+            # the cached tables replace everything, so they can only be used before any blocks are added
+            cachePath = None
+            if self.cacheDir and not self._yamlDatas and self._yamlCache is None and len(self.blocksByID) == 1:
+                cachePath = self._cachePath(filename, textHash)
+                if self._loadCache(cachePath):
+                    return
+
+            import yaml
+
             try:
                 log.debug("Trying YAML CLoader")
-                blockyaml = yaml.load(f, Loader=yaml.CLoader)
+                blockyaml = yaml.load(text, Loader=yaml.CLoader)
             except:
                 log.debug("CLoader not preset, falling back to Python YAML")
-                blockyaml = yaml.load(f)
+                blockyaml = yaml.load(text)
             self.addYamlBlocks(blockyaml)
 
+            if cachePath:
+                self._saveCache(cachePath)
+
         except Exception, e:
-            log.warn(u"Exception while loading block info from %s: %s", f, e)
+            log.warn(u"Exception while loading block info from %s: %s", filename, e)
             traceback.print_exc()
 
+    # --- Compiled block table cache ---
+
+    def _cachePath(self, filename, textHash):
+        key = hashlib.sha1(repr((textHash, self.cacheVersion, id_limit, self.defaultName)))
+        name = os.path.splitext(os.path.basename(filename))[0]
+        return join(self.cacheDir, "{0}-{1}".format(name, key.hexdigest()))
+
+    def _loadCache(self, cachePath):
+        """
+        Fills this MCMaterials from the tables saved by _saveCache. Returns False if there are none, or they can't
+        be read. The parsed yaml is left on disk until yamlDatas or a Block's yaml is asked for.
+        """
+        try:
+            with open(cachePath + ".pickle", "rb") as f:
+                tables = cPickle.loads(f.read())
+            npz = numpy.load(cachePath + ".npz")
+            try:
+                arrays = dict((name, npz[name]) for name in self.cacheArrays)
+            finally:
+                npz.close()
+        except Exception, e:
+            if not isinstance(e, IOError):
+                log.warn(u"Ignoring unreadable block table cache %s: %s", cachePath, e)
+            return False
+
+        for name, arr in arrays.iteritems():
+            # assign in place, color, brightness and opacity are the same arrays
+            getattr(self, name)[:] = arr
+        for name in self.cacheLists:
+            setattr(self, name, tables[name])
+        for name in self.cacheRows:
+            default, rows = tables[name]
+            setattr(self, name, [list(rows[i]) if i in rows else [default] * 16 for i in range(id_limit)])
+
+        blocks = []
+        for i, attrs in enumerate(tables["blocks"]):
+            block = self.Air if i == tables["Air"] else Block(self, attrs["ID"])
+            block.__dict__.update(attrs)
+            blocks.append(block)
+
+        self.allBlocks = [blocks[i] for i in tables["allBlocks"]]
+        self.blocksByType = defaultdict(list)
+        for type, indexes in tables["blocksByType"]:
+            self.blocksByType[type] = [blocks[i] for i in indexes]
+        self.blocksByID = dict((key, blocks[i]) for key, i in tables["blocksByID"])
+
+        self._yamlCache = (cachePath, blocks)
+        log.debug(u"Loaded block tables from %s", cachePath)
+        return True
+
+    def _loadCachedYaml(self):
+        cachePath, blocks = self._yamlCache
+        self._yamlCache = None
+        try:
+            with open(cachePath + ".yaml.pickle", "rb") as f:
+                yamlDatas, blockYamls = cPickle.loads(f.read())
+        except Exception, e:
+            log.warn(u"Could not read the block yaml cached in %s: %s", cachePath, e)
+            return
+        self._yamlDatas.extend(yamlDatas)
+        for i, blockYaml in blockYamls:
+            blocks[i].yaml = blockYaml
+
+    def _saveCache(self, cachePath):
+        """
+        Saves the block tables built from a yaml file, so _loadCache can restore them without parsing the yaml. The
+        arrays go to an .npz file, the names and Block attributes to a pickle, and the parsed yaml to another.
+        """
+        blocks = []
+        blockYamls = []
+        indexes = {}
+
+        def index(block):
+            if id(block) not in indexes:
+                indexes[id(block)] = len(blocks)
+                attrs = dict(block.__dict__)
+                del attrs["materials"]
+                if "yaml" in attrs:
+                    blockYamls.append((len(blocks), attrs.pop("yaml")))
+                blocks.append(attrs)
+            return indexes[id(block)]
+
+        tables = dict((name, getattr(self, name)) for name in self.cacheLists)
+        for name, default in zip(self.cacheRows, (self.defaultName, "", "")):
+            tables[name] = (default, dict((i, row) for i, row in enumerate(getattr(self, name))
+                                          if row != [default] * 16))
+        tables["Air"] = index(self.Air)
+        tables["allBlocks"] = [index(b) for b in self.allBlocks]
+        tables["blocksByType"] = [(type, [index(b) for b in bs]) for type, bs in self.blocksByType.iteritems()]
+        tables["blocksByID"] = [(key, index(b)) for key, b in self.blocksByID.iteritems()]
+        tables["blocks"] = blocks
+
+        def saveArrays(f):
+            numpy.savez(f, **dict((name, getattr(self, name)) for name in self.cacheArrays))
+
+        def savePickle(obj):
+            return lambda f: cPickle.dump(obj, f, cPickle.HIGHEST_PROTOCOL)
+
+        try:
+            if not os.path.exists(self.cacheDir):
+                os.makedirs(self.cacheDir)
+            # several processes may start at once, so write to temporary files and rename them into place. The
+            # tables are written last, since _loadCache looks for them first.
+            for ext, save in ((".npz", saveArrays),
+                              (".yaml.pickle", savePickle((self._yamlDatas, blockYamls))),
+                              (".pickle", savePickle(tables))):
+                fd, tempPath = tempfile.mkstemp(ext, dir=self.cacheDir)
+                with os.fdopen(fd, "wb") as f:
+                    save(f)
+                try:
+                    os.rename(tempPath, cachePath + ext)
+                except OSError:
+                    # another process got there first
+                    os.remove(tempPath)
+        except (IOError, OSError), e:
+            log.warn(u"Could not save block table cache %s: %s", cachePath, e)
+
+    @property
+    def yamlDatas(self):
+        if self._yamlCache is not None:
+            self._loadCachedYaml()
+        return self._yamlDatas
+
     def addYamlBlocks(self, blockyaml):
         self.yamlDatas.append(blockyaml)
         for block in blockyaml['blocks']:
@@ -969,7 +1128,7 @@ _indices = rollaxis(indices((id_limit, 16)), 0, 3)
 
 def _filterTable(filters, unavailable, default=(0, 0)):
     # a filter table is a id_limit table of (ID, data) pairs.
-    table = zeros((id_limit, 16, 2), dtype='uint8')
+    table = zeros((id_limit, 16, 2), dtype='uint16')
     table[:] = _indices
     for u in unavailable:
         try:
@@ -1011,21 +1170,24 @@ def guessFilterTable(matsFrom, matsTo):
     filters = []
     unavailable = []
     toByName = dict(((b.name, b) for b in sorted(matsTo.allBlocks, reverse=True)))
+    # Block looks its names up in the materials tables every time, so do it once here
+    toNames = [(b, b.name, b.aka, b.search) for b in matsTo.allBlocks]
     for fromBlock in matsFrom.allBlocks:
-        block = toByName.get(fromBlock.name)
+        fromName = fromBlock.name
+        block = toByName.get(fromName)
         if block is None:
-            for b in matsTo.allBlocks:
-                if b.name.startswith(fromBlock.name):
+            for b, name, aka, search in toNames:
+                if name.startswith(fromName):
                     block = b
                     break
         if block is None:
-            for b in matsTo.allBlocks:
-                if fromBlock.name in b.name:
+            for b, name, aka, search in toNames:
+                if fromName in name:
                     block = b
                     break
         if block is None:
-            for b in matsTo.allBlocks:
-                if fromBlock.name in b.aka or fromBlock.name in b.search:
+            for b, name, aka, search in toNames:
+                if fromName in aka or fromName in search:
                     block = b
                     break
         if block is None:
@@ -1046,15 +1208,10 @@ def guessFilterTable(matsFrom, matsTo):
 allMaterials = (alphaMaterials, classicMaterials, pocketMaterials, indevMaterials)
 
 _conversionFuncs = {}
+_conversionTables = {}
 
 
-def conversionFunc(destMats, sourceMats):
-    if destMats is sourceMats:
-        return nullConversion
-    func = _conversionFuncs.get((destMats, sourceMats))
-    if func:
-        return func
-
+def _guessConversionTable(destMats, sourceMats):
     filters, unavailable = guessFilterTable(sourceMats, destMats)
     log.debug("")
     log.debug("%s %s %s", sourceMats.name, "=>", destMats.name)
@@ -1064,9 +1221,84 @@ def conversionFunc(destMats, sourceMats):
     log.debug("")
     log.debug("Missing blocks: %s", [sourceMats.blockWithID(*a).name for a in unavailable])
 
-    table = _filterTable(filters, unavailable, (35, 0))
-    func = filterConversion(table)
-    _conversionFuncs[(destMats, sourceMats)] = func
+    return _filterTable(filters, unavailable, (35, 0))
+
+
+def _conversionTableName(destMats, sourceMats):
+    return "{0}_to_{1}".format(sourceMats.name, destMats.name)
+
+
+def _conversionCachePath():
+    key = hashlib.sha1(repr((MCMaterials.cacheVersion, [(m.name, m.yamlHashes) for m in allMaterials])))
+    return join(MCMaterials.cacheDir, "conversions-{0}.npz".format(key.hexdigest()))
+
+
+def _loadConversionTable(destMats, sourceMats):
+    """
+    Reads the table converting sourceMats to destMats from the conversion cache. If there is no cache yet, the
+    tables between every pair of allMaterials are guessed from the block names and saved to it, so the name search
+    only ever runs once.
+    """
+    name = _conversionTableName(destMats, sourceMats)
+    path = _conversionCachePath() if MCMaterials.cacheDir else None
+    if path:
+        try:
+            npz = numpy.load(path)
+            try:
+                return npz[name]
+            finally:
+                npz.close()
+        except Exception, e:
+            if not isinstance(e, IOError):
+                log.warn(u"Ignoring unreadable block conversion cache %s: %s", path, e)
+
+    tables = {}
+    for dest in allMaterials:
+        for source in allMaterials:
+            if dest is not source:
+                table = _conversionTables[dest, source] = _guessConversionTable(dest, source)
+                tables[_conversionTableName(dest, source)] = table
+
+    if path:
+        try:
+            if not os.path.exists(MCMaterials.cacheDir):
+                os.makedirs(MCMaterials.cacheDir)
+            fd, tempPath = tempfile.mkstemp(".npz", dir=MCMaterials.cacheDir)
+            with os.fdopen(fd, "wb") as f:
+                numpy.savez_compressed(f, **tables)
+            try:
+                os.rename(tempPath, path)
+            except OSError:
+                # another process got there first
+                os.remove(tempPath)
+        except (IOError, OSError), e:
+            log.warn(u"Could not save block conversion cache %s: %s", path, e)
+
+    return tables[name]
+
+
+def conversionTable(destMats, sourceMats):
+    """
+    Returns the table converting the blocks of sourceMats to destMats, an array of shape (id_limit, 16, 2) that
+    maps each (ID, data) pair of sourceMats to an (ID, data) pair of destMats. Tables between the standard materials
+    come from the conversion cache next to the cached block tables.
+    """
+    table = _conversionTables.get((destMats, sourceMats))
+    if table is None:
+        if destMats in allMaterials and sourceMats in allMaterials:
+            table = _loadConversionTable(destMats, sourceMats)
+        else:
+            table = _guessConversionTable(destMats, sourceMats)
+        _conversionTables[destMats, sourceMats] = table
+    return table
+
+
+def conversionFunc(destMats, sourceMats):
+    if destMats is sourceMats:
+        return nullConversion
+    func = _conversionFuncs.get((destMats, sourceMats))
+    if func is None:
+        func = _conversionFuncs[destMats, sourceMats] = filterConversion(conversionTable(destMats, sourceMats))
     return func
 
 
@@ -1085,9 +1317,16 @@ for b in alphaMaterials:
         b.stringID = "air"
     block_map[b.ID] = "minecraft:"+b.stringID
   
-fp = open(os.path.join("pymclevel","blockstate_definitions.json"))
-blockstates = json.load(fp)
-fp.close()
+_blockstates = None
+
+
+def getBlockstates():
+    """ Returns the contents of blockstate_definitions.json, which are read the first time they are needed. """
+    global _blockstates
+    if _blockstates is None:
+        _blockstates = json.loads(pkgutil.get_data(__name__, "blockstate_definitions.json"))
+    return _blockstates
+
 
 def idToBlockstate(bid, data):
     '''
@@ -1104,7 +1343,7 @@ def idToBlockstate(bid, data):
     name = block_map[bid].replace("minecraft:", "")
 
     properties = {}
-    for prop in blockstates["minecraft"][name]["properties"]: # TODO: Change this if MCEdit's mod support ever improves
+    for prop in getBlockstates()["minecraft"][name]["properties"]: # TODO: Change this if MCEdit's mod support ever improves
         if prop["<data>"] == data:
             for field in prop.keys():
                 if field == "<data>":
@@ -1127,6 +1366,7 @@ def blockstateToID(name, properties):
         prefix, name = name.split(":")
     else:
         prefix = "minecraft"
+    blockstates = getBlockstates()
     bid = blockstates[prefix][name]["id"]
     for prop in blockstates[prefix][name]["properties"]:
         correct = True
@@ -1,15 +1,19 @@
 import atexit
 import itertools
 import logging
+import multiprocessing
 import os
 from os.path import dirname, join, basename
 import random
 from pymclevel import PocketLeveldbWorld
 import re
+import Queue
 import shutil
+import socket
 import subprocess
 import sys
 import tempfile
+import threading
 import time
 import urllib
 import json
@@ -79,6 +83,8 @@ class ServerJarStorage(object):
     cacheDir = os.path.join(getCacheDir(), u"ServerJarStorage")
 
     def __init__(self, cacheDir=None):
+        if cacheDir is not None:
+            self.cacheDir = cacheDir
         if not os.path.exists(self.cacheDir):
             os.makedirs(self.cacheDir)
         readme = os.path.join(self.cacheDir, "README.TXT")
@@ -248,6 +254,60 @@ def findJava():
     return javaExe
 
 
+def findFreePort(exclude=()):
+    """ Returns a TCP port that nothing is listening on and that is not in exclude. """
+    while True:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        try:
+            s.bind(("", 0))
+            port = s.getsockname()[1]
+        finally:
+            s.close()
+        if port not in exclude:
+            return port
+
+
+def planGenerationCentres(chunks, radius):
+    """
+    Covers the (cx, cz) positions in chunks with squares of 2 * radius + 1 chunks on a side. Returns a list of
+    (center, covered) tuples, one per square, where center is the chunk the square is centered on and covered is
+    the list of positions from chunks that fall inside it.
+
+    The positions are swept in strips 2 * radius + 1 chunks wide along the x axis, lowest x first, and each strip
+    is covered from its lowest z upward. Every square starts at the first uncovered position, so the number of
+    squares in a strip is the fewest that can cover it.
+    """
+    side = 2 * radius + 1
+    remaining = sorted(set(chunks))
+    plan = []
+
+    while remaining:
+        stripcx = remaining[0][0]
+        strip = sorted((c for c in remaining if c[0] < stripcx + side), key=lambda (cx, cz): cz)
+        remaining = [c for c in remaining if c[0] >= stripcx + side]
+
+        while strip:
+            startcz = strip[0][1]
+            covered = [c for c in strip if c[1] < startcz + side]
+            strip = strip[len(covered):]
+
+            # center the square on what it covers, so chunks near its edges get the most neighbors generated
+            xs = [cx for cx, cz in covered]
+            zs = [cz for cx, cz in covered]
+            center = ((min(xs) + max(xs)) >> 1, (min(zs) + max(zs)) >> 1)
+            plan.append((center, covered))
+
+    return plan
+
+
+def defaultServerCount():
+    """ Returns how many servers to run at once. Each one needs a core and a gigabyte or so of memory. """
+    try:
+        return max(1, min(4, multiprocessing.cpu_count() // 2))
+    except NotImplementedError:
+        return 1
+
+
 class MCServerChunkGenerator(object):
     """Generates chunks using minecraft_server.jar. Uses a ServerJarStorage to
     store different versions of minecraft_server.jar in an application support
@@ -269,6 +329,8 @@ class MCServerChunkGenerator(object):
 
         gen = MCServerChunkGenerator("Beta 1.6.5")
 
+    generateChunksInLevel runs up to maxServers servers at once, each in its own
+    copy of the temporary world.
     """
     defaultJarStorage = None
 
@@ -276,6 +338,7 @@ class MCServerChunkGenerator(object):
     jarStorage = None
     tempWorldCache = {}
     processes = []
+    maxServers = defaultServerCount()
 
     def __init__(self, version=None, jarfile=None, jarStorage=None):
 
@@ -284,8 +347,12 @@ class MCServerChunkGenerator(object):
         if self.javaExe is None:
             raise JavaNotFound(
                 "Could not find java. Please check that java is installed correctly. (Could not find java in your PATH environment variable.)")
+        # the storage version the jar came from, if it came from jarStorage
+        self.storageVersion = None
         if jarfile is None:
             jarfile = self.jarStorage.getJarfile(version)
+            if jarfile is not None:
+                self.storageVersion = version or self.jarStorage.latestVersion
         if jarfile is None:
             raise VersionNotFound(
                 "Could not find minecraft_server.jar for version {0}. Please make sure that a minecraft_server.jar is placed under {1} in a subfolder named after the server's version number.".format(
@@ -323,15 +390,37 @@ class MCServerChunkGenerator(object):
 
     worldCacheDir = os.path.join(tempfile.gettempdir(), "pymclevel_MCServerChunkGenerator")
 
-    def tempWorldForLevel(self, level):
-
+    _serverChecksum = None
+
+    def serverChecksum(self):
+        """
+        Returns the checksum that names this server's folder in worldCacheDir. It is computed once per generator,
+        and by jarStorage for jars that came from it, so the folders made for those before stay in use.
+        """
+        if self._serverChecksum is None:
+            if self.storageVersion is not None:
+                self._serverChecksum = self.jarStorage.checksumForVersion(self.storageVersion)
+            else:
+                with file(self.serverJarFile, "rb") as f:
+                    import hashlib
+
+                    self._serverChecksum = hashlib.md5(f.read()).hexdigest()
+        return self._serverChecksum
+
+    def tempWorldForLevel(self, level, slot=0, port=None):
+        """
+        Returns the temporary world the server generates chunks for level in, and the folder the server runs in.
+        Servers that run at the same time need their own worlds, so each slot number gets a separate copy. The
+        server is set up to listen on port, or on any free port if port is None.
+        """
         # tempDir = tempfile.mkdtemp("mclevel_servergen")
-        tempDir = os.path.join(self.worldCacheDir, self.jarStorage.checksumForVersion(self.serverVersion),
-                               str(level.RandomSeed))
+        tempDir = os.path.join(self.worldCacheDir, self.serverChecksum(), str(level.RandomSeed))
+        if slot:
+            tempDir += "-{0}".format(slot)
         propsFile = os.path.join(tempDir, "server.properties")
         properties = readProperties(propsFile)
 
-        tempWorld = self.tempWorldCache.get((self.serverVersion, level.RandomSeed))
+        tempWorld = self.tempWorldCache.get((self.serverVersion, level.RandomSeed, slot))
 
         if tempWorld is None:
             if not os.path.exists(tempDir):
@@ -347,7 +436,7 @@ class MCServerChunkGenerator(object):
 
             tempWorldRO = infiniteworld.MCInfdevOldLevel(tempWorldDir, readonly=True)
 
-            self.tempWorldCache[self.serverVersion, level.RandomSeed] = tempWorldRO
+            self.tempWorldCache[self.serverVersion, level.RandomSeed, slot] = tempWorldRO
 
         if level.dimNo == 0:
             properties["allow-nether"] = "false"
@@ -356,7 +445,7 @@ class MCServerChunkGenerator(object):
 
             properties["allow-nether"] = "true"
 
-        properties["server-port"] = int(32767 + random.random() * 32700)
+        properties["server-port"] = port or findFreePort()
         saveProperties(propsFile, properties)
 
         return tempWorld, tempDir
@@ -429,6 +518,10 @@ class MCServerChunkGenerator(object):
 
         if level.containsChunk(cx, cz):
             return
+        self._copyChunk(tempWorld, level, cx, cz)
+        level._allChunks = None
+
+    def _copyChunk(self, tempWorld, level, cx, cz):
         try:
             tempChunkBytes = tempWorld._getChunkBytes(cx, cz)
         except ChunkNotPresent, e:
@@ -440,7 +533,6 @@ class MCServerChunkGenerator(object):
             level.saveGeneratedChunk(cx, cz, tempChunkBytes)
         else:
             level.worldFolder.saveChunk(cx, cz, tempChunkBytes)
-        level._allChunks = None
 
     def generateChunkInLevel(self, level, cx, cz):
         assert isinstance(level, infiniteworld.MCInfdevOldLevel)
@@ -486,52 +578,102 @@ class MCServerChunkGenerator(object):
         return exhaust(self.generateChunksInLevelIter(level, chunks))
 
     def generateChunksInLevelIter(self, level, chunks, simulate=False):
-        tempWorld, tempDir = self.tempWorldForLevel(level)
-
+        """
+        Generates the chunks at the (cx, cz) positions in chunks and copies them into level. Yields (done, total)
+        as chunks are copied and (done, total, line) for each line a server prints.
+
+        The chunks are covered with as few spawn points as planGenerationCentres can find, and the server is run
+        at each one, up to maxServers at a time. When all of them have stopped, the finished chunks are copied
+        from the temporary worlds in one pass. Chunks that a server left unfinished are planned again, until a
+        round finishes none of them.
+        """
         startLength = len(chunks)
-        minRadius = self.minRadius
-        maxRadius = self.maxRadius
         chunks = set(chunks)
+        chunks.difference_update(level.allChunks)
+
+        # the server is assumed to generate at least minRadius chunks around its spawn point, and a chunk can only
+        # be copied once all of its neighbors exist, since they are needed to populate it.
+        radius = self.minRadius - 1
 
         while len(chunks):
             length = len(chunks)
-            centercx, centercz = chunks.pop()
-            chunks.add((centercx, centercz))
-            # assume the generator always generates at least an 11x11 chunk square.
-            centercx += minRadius
-            centercz += minRadius
-
-            # boxedChunks = [cPos for cPos in chunks if inBox(cPos)]
+            plan = planGenerationCentres(chunks, radius)
 
-            print "Generating {0} chunks out of {1} starting from {2}".format("XXX", len(chunks), (centercx, centercz))
+            print "Generating {0} chunks from {1} spawn points".format(len(chunks), len(plan))
             yield startLength - len(chunks), startLength
 
-            # chunks = [c for c in chunks if not inBox(c)]
-
-            for p in self.generateAtPositionIter(tempWorld, tempDir, centercx, centercz, simulate):
+            tempWorlds = []
+            for p in self.generateAtPositionsIter(level, [center for center, covered in plan], tempWorlds, simulate):
                 yield startLength - len(chunks), startLength, p
 
-            i = 0
-            for cx, cz in itertools.product(
-                    xrange(centercx - maxRadius, centercx + maxRadius),
-                    xrange(centercz - maxRadius, centercz + maxRadius)):
-                if level.containsChunk(cx, cz):
-                    chunks.discard((cx, cz))
-                elif ((cx, cz) in chunks
-                      and all(tempWorld.containsChunk(ncx, ncz) for ncx, ncz in
-                              itertools.product(xrange(cx - 1, cx + 2), xrange(cz - 1, cz + 2)))
-                ):
-                    self.copyChunkAtPosition(tempWorld, level, cx, cz)
-                    i += 1
+            for tempWorld in tempWorlds:
+                tempWorld.unload()
+                present = tempWorld.worldFolder.listChunks()
+                finished = [(cx, cz) for cx, cz in chunks
+                            if all((ncx, ncz) in present for ncx, ncz in
+                                   itertools.product(xrange(cx - 1, cx + 2), xrange(cz - 1, cz + 2)))]
+                for cx, cz in finished:
+                    self._copyChunk(tempWorld, level, cx, cz)
                     chunks.discard((cx, cz))
                     yield startLength - len(chunks), startLength
 
+            level._allChunks = None
+
             if length == len(chunks):
                 print "No chunks were generated. Aborting."
                 break
 
         level.saveInPlace()
 
+    def generateAtPositionsIter(self, level, centers, tempWorlds, simulate=False):
+        """
+        Runs the server once at each (cx, cz) in centers, with up to maxServers of them running at the same time.
+        Each server gets its own temporary world and port, and every temporary world used is appended to
+        tempWorlds. Yields each line the servers print, prefixed with the number of the server that printed it.
+        """
+        results = Queue.Queue()
+        pending = list(centers)
+        slots = range(min(self.maxServers, len(pending)))
+        running = {}
+        error = None
+
+        def runServerThread(slot, tempWorld, tempDir, cx, cz):
+            try:
+                for line in self.generateAtPositionIter(tempWorld, tempDir, cx, cz, simulate):
+                    results.put((slot, line, None))
+            except Exception:
+                results.put((slot, None, sys.exc_info()))
+            else:
+                results.put((slot, None, None))
+
+        while running or (pending and error is None):
+            while slots and pending and error is None:
+                slot = slots.pop(0)
+                cx, cz = pending.pop(0)
+                port = findFreePort(set(p for _, p in running.itervalues()))
+                tempWorld, tempDir = self.tempWorldForLevel(level, slot, port)
+                if tempWorld not in tempWorlds:
+                    tempWorlds.append(tempWorld)
+                running[slot] = tempWorld, port
+
+                log.info("Generating at %s in %s", (cx, cz), tempDir)
+                thread = threading.Thread(target=runServerThread, args=(slot, tempWorld, tempDir, cx, cz))
+                thread.daemon = True
+                thread.start()
+
+            slot, line, exc_info = results.get()
+            if line is not None:
+                yield "{0}: {1}".format(slot + 1, line)
+                continue
+
+            del running[slot]
+            slots.append(slot)
+            if exc_info is not None and error is None:
+                error = exc_info
+
+        if error is not None:
+            raise error[0], error[1], error[2]
+
     def runServer(self, startingDir):
         if isinstance(startingDir, unicode):
             startingDir = startingDir.encode(sys.getfilesystemencoding())
@@ -543,13 +685,9 @@ class MCServerChunkGenerator(object):
     @classmethod
     def _runServer(cls, startingDir, jarfile):
         log.info("Starting server %s in %s", jarfile, startingDir)
-        if cls.lowMemory:
-            memflags = []
-        else:
-            memflags = ["-Xmx1024M", "-Xms1024M", ]
-
-        proc = subprocess.Popen([cls.javaExe, "-Djava.awt.headless=true"] + memflags + ["-jar", jarfile],
-                                executable=cls.javaExe,
+        command = cls._serverCommand(jarfile)
+        proc = subprocess.Popen(command,
+                                executable=command[0],
                                 cwd=startingDir,
                                 stdin=subprocess.PIPE,
                                 stdout=subprocess.PIPE,
@@ -558,11 +696,20 @@ class MCServerChunkGenerator(object):
         )
         cls.processes.append(proc)
         return proc
-    
+
+    @classmethod
+    def _serverCommand(cls, jarfile):
+        if cls.lowMemory:
+            memflags = []
+        else:
+            memflags = ["-Xmx1024M", "-Xms1024M", ]
+
+        return [cls.javaExe, "-Djava.awt.headless=true"] + memflags + ["-jar", jarfile]
+
     @classmethod
     def terminateProcesses(cls):
         for process in cls.processes:
-            if process.poll():
+            if process.poll() is None:
                 try:
                     process.terminate()
                 except:
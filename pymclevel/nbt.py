@@ -24,6 +24,7 @@ import itertools
 import logging
 import struct
 import zlib
+from copy import deepcopy
 from cStringIO import StringIO
 
 import numpy
@@ -88,14 +89,6 @@ class TAG_Value(object):
         """Change the TAG's name. Coerced to a unicode."""
         self._name = unicode(newVal)
 
-    @classmethod
-    def load_from(cls, ctx):
-        data = ctx.data[ctx.offset:]
-        (value,) = cls.fmt.unpack_from(data)
-        self = cls(value=value)
-        ctx.offset += self.fmt.size
-        return self
-
     def __repr__(self):
         return "<%s name=\"%s\" value=%r>" % (str(self.__class__.__name__), self.name, self.value)
 
@@ -174,15 +167,6 @@ class TAG_Byte_Array(TAG_Value):
 
     dtype = numpy.dtype('uint8')
 
-    @classmethod
-    def load_from(cls, ctx):
-        data = ctx.data[ctx.offset:]
-        (string_len,) = TAG_Int.fmt.unpack_from(data)
-        value = fromstring(data[4:string_len * cls.dtype.itemsize + 4], cls.dtype)
-        self = cls(value)
-        ctx.offset += string_len * cls.dtype.itemsize + 4
-        return self
-
     def write_value(self, buf):
         value_str = self.value.tostring()
         buf.write(struct.pack(">I%ds" % (len(value_str),), self.value.size, value_str))
@@ -229,26 +213,12 @@ class TAG_String(TAG_Value):
 
             return decoded
 
-    @classmethod
-    def load_from(cls, ctx):
-        value = load_string(ctx)
-        return cls(value)
-
     def write_value(self, buf):
         write_string(self._value, buf)
 
 string_len_fmt = struct.Struct(">H")
 
 
-def load_string(ctx):
-    data = ctx.data[ctx.offset:]
-    (string_len,) = string_len_fmt.unpack_from(data)
-
-    value = data[2:string_len + 2].tostring()
-    ctx.offset += string_len + 2
-    return value
-
-
 def write_string(string, buf):
     encoded = string.encode('utf-8')
     buf.write(struct.pack(">h%ds" % (len(encoded),), len(encoded), encoded))
@@ -287,24 +257,6 @@ class TAG_Compound(TAG_Value, collections.MutableMapping):
         if not val.name:
             raise ValueError("Tag needs a name to be inserted into TAG_Compound: %s" % val)
 
-    @classmethod
-    def load_from(cls, ctx):
-        self = cls()
-        while ctx.offset < len(ctx.data):
-            tag_type = ctx.data[ctx.offset]
-            ctx.offset += 1
-
-            if tag_type == 0:
-                break
-
-            tag_name = load_string(ctx)
-            tag = tag_classes[tag_type].load_from(ctx)
-            tag.name = tag_name
-
-            self._value.append(tag)
-
-        return self
-
     def save(self, filename_or_buf=None, compressed=True):
         """
         Save the TAG_Compound element to a file. Since this element is the root tag, it can be named.
@@ -412,37 +364,40 @@ class TAG_List(TAG_Value, collections.MutableSequence):
         self.list_type = list_type
         self.value = value or []
 
-    __slots__ = ('_name', '_value')
+    __slots__ = ('_name', '_value', '_version')
 
     def __repr__(self):
         return "<%s name='%s' list_type=%r length=%d>" % (self.__class__.__name__, self.name,
                                                           tag_classes[self.list_type],
                                                           len(self))
 
+    @property
+    def value(self):
+        return self._value
+
+    @value.setter
+    def value(self, newVal):
+        self._value = self.data_type(newVal)
+        self._changed()
+
+    @property
+    def version(self):
+        """Counts the changes made through the tag: setting its value, and setting, deleting or inserting items.
+        Changes made directly to the list in value are not counted."""
+        return getattr(self, '_version', 0)
+
+    def _changed(self):
+        self._version = self.version + 1
+
     def data_type(self, val):
         if val:
             self.list_type = val[0].tagID
         assert all([x.tagID == self.list_type for x in val])
         return list(val)
 
-    @classmethod
-    def load_from(cls, ctx):
-        self = cls()
-        self.list_type = ctx.data[ctx.offset]
-        ctx.offset += 1
-
-        (list_length,) = TAG_Int.fmt.unpack_from(ctx.data, ctx.offset)
-        ctx.offset += TAG_Int.fmt.size
-
-        for i in range(list_length):
-            tag = tag_classes[self.list_type].load_from(ctx)
-            self.append(tag)
-
-        return self
-
     def write_value(self, buf):
         buf.write(chr(self.list_type))
-        buf.write(TAG_Int.fmt.pack(len(self.value)))
+        buf.write(tag_classes[TAG_INT].fmt.pack(len(self.value)))
         for i in self.value:
             i.write_value(buf)
 
@@ -472,9 +427,11 @@ class TAG_List(TAG_Value, collections.MutableSequence):
             self.check_tag(value)
 
         self.value[index] = value
+        self._changed()
 
     def __delitem__(self, index):
         del self.value[index]
+        self._changed()
 
     def insert(self, index, value):
         if len(self) == 0:
@@ -484,6 +441,7 @@ class TAG_List(TAG_Value, collections.MutableSequence):
 
         value.name = ""
         self.value.insert(index, value)
+        self._changed()
 
 
 tag_classes = {}
@@ -506,11 +464,14 @@ def try_gunzip(data):
     return data
 
 
-def load(filename="", buf=None):
+def load(filename="", buf=None, lazy=False):
     """
     Unserialize data from an NBT file and return the root TAG_Compound object. If filename is passed,
     reads from the file, otherwise uses data from buf. Buf can be a buffer object with a read() method or a string
     containing NBT data.
+
+    If lazy is True, compounds and lists of compounds or lists below the root are not read until they are first
+    used, and any that are never used are saved back as their original bytes.
     """
     if filename:
         buf = file(filename, "rb")
@@ -518,39 +479,449 @@ def load(filename="", buf=None):
     if hasattr(buf, "read"):
         buf = buf.read()
 
-    return _load_buffer(try_gunzip(buf))
+    return _load_buffer(try_gunzip(buf), lazy)
 
 
-class load_ctx(object):
-    pass
+_name_cache = {}
+# Names longer than this are usually data, such as the ids or coordinates some files use as keys, and don't repeat.
+_NAME_CACHE_MAX_LENGTH = 32
+# The cache is emptied when it holds this many names, so reading many files with different names can't grow it
+# without bound.
+_NAME_CACHE_MAX_SIZE = 4096
+
+
+def _decode_name(raw):
+    """Tag names repeat constantly, so each distinct short name is decoded once and the same unicode object is
+    shared by every tag that uses it."""
+    name = _name_cache.get(raw)
+    if name is None:
+        if len(raw) > _NAME_CACHE_MAX_LENGTH:
+            return raw.decode('utf-8')
+        if len(_name_cache) >= _NAME_CACHE_MAX_SIZE:
+            _name_cache.clear()
+        name = _name_cache[raw] = intern(raw).decode('utf-8')
+    return name
 
 
-def _load_buffer(buf):
-    if isinstance(buf, str):
-        buf = fromstring(buf, 'uint8')
-    data = buf
+class _NBTFormats(object):
+    """Precompiled struct formats and array dtypes for one byte order."""
+
+    def __init__(self, byte_order):
+        self.scalars = {
+            TAG_BYTE: struct.Struct(byte_order + "b"),
+            TAG_SHORT: struct.Struct(byte_order + "h"),
+            TAG_INT: struct.Struct(byte_order + "i"),
+            TAG_LONG: struct.Struct(byte_order + "q"),
+            TAG_FLOAT: struct.Struct(byte_order + "f"),
+            TAG_DOUBLE: struct.Struct(byte_order + "d"),
+        }
+        self.arrays = {
+            TAG_BYTE_ARRAY: numpy.dtype("uint8"),
+            TAG_INT_ARRAY: numpy.dtype(byte_order + "u4"),
+            TAG_SHORT_ARRAY: numpy.dtype(byte_order + "u2"),
+        }
+        self.int = self.scalars[TAG_INT]
+        self.string_len = struct.Struct(byte_order + "H")
+
+
+_formats = {">": _NBTFormats(">"), "<": _NBTFormats("<")}
+
+# Changed by littleEndianNBT()
+_byte_order = ">"
+
+
+class _NBTReader(object):
+    """
+    Reads NBT out of a bytearray without slicing or copying the input. Numbers are unpacked with precompiled
+    struct.Struct formats straight from the buffer, and TAG_Byte_Array, TAG_Int_Array and TAG_Short_Array payloads
+    are writable numpy views into the buffer rather than copies.
+    """
+
+    def __init__(self, data, offset=0, byte_order=">", lazy=False):
+        self.data = data
+        self.offset = offset
+        self.byte_order = byte_order
+        self.lazy = lazy
+
+        formats = _formats[byte_order]
+        self.scalar_formats = formats.scalars
+        self.array_dtypes = formats.arrays
+        self.int_fmt = formats.int
+        self.string_len_fmt = formats.string_len
+
+    # Reading past the end of the buffer makes unpack_from raise struct.error and frombuffer raise ValueError;
+    # _load_buffer and iter_events turn those into NBTFormatError, so the hot paths do no bounds checks of their own.
+
+    def read_tag_id(self):
+        tagID = self.data[self.offset]
+        self.offset += 1
+        return tagID
+
+    def read_int(self):
+        (value,) = self.int_fmt.unpack_from(self.data, self.offset)
+        self.offset += 4
+        return value
+
+    def read_raw_string(self):
+        (length,) = self.string_len_fmt.unpack_from(self.data, self.offset)
+        start = self.offset + 2
+        self.offset = start + length
+        if self.offset > len(self.data):
+            raise NBTFormatError("NBT Stream too short. String of length {0:d} at offset {1:d}".format(length, start))
+        return str(self.data[start:self.offset])
+
+    def read_name(self):
+        return _decode_name(self.read_raw_string())
+
+    def read_payload(self, tagID):
+        """Reads the payload of a tag that is not a TAG_Compound or TAG_List and returns it as a plain value."""
+        fmt = self.scalar_formats.get(tagID)
+        if fmt is not None:
+            (value,) = fmt.unpack_from(self.data, self.offset)
+            self.offset += fmt.size
+            return value
+
+        if tagID == TAG_STRING:
+            return self.read_raw_string().decode('utf-8')
+
+        dtype = self.array_dtypes.get(tagID)
+        if dtype is not None:
+            length = self.read_int()
+            value = numpy.frombuffer(self.data, dtype, length, self.offset)
+            self.offset += length * dtype.itemsize
+            return value
+
+        raise NBTFormatError("Unknown tag type {0} at offset {1}".format(tagID, self.offset - 1))
+
+    def read_value(self, tagID):
+        """Reads the payload of a tag of the given type and returns it as an unnamed TAG_* object."""
+        if tagID == TAG_COMPOUND:
+            if self.lazy:
+                return self.read_lazy(_LazyTAG_Compound, tagID)
+            return self.read_compound()
+
+        if tagID == TAG_LIST:
+            # Lists of numbers are cheaper to decode than to defer
+            if self.lazy and self.data[self.offset] in (TAG_COMPOUND, TAG_LIST):
+                tag = self.read_lazy(_LazyTAG_List, tagID)
+                tag.list_type = self.data[tag._raw[1]]
+                return tag
+            return self.read_list()
+
+        return _new_tag(_py_tag_classes[tagID], self.read_payload(tagID))
+
+    def read_lazy(self, cls, tagID):
+        """Steps over a TAG_Compound or TAG_List payload and returns a tag that will read it on first use."""
+        start = self.offset
+        self.skip_value(tagID)
+        tag = cls.__new__(cls)
+        tag._name = u""
+        tag._raw = (self.data, start, self.offset, self.byte_order)
+        return tag
+
+    def read_compound(self):
+        return _new_tag(_TAG_Compound, self.read_compound_items())
+
+    def read_compound_items(self):
+        value = []
+        data = self.data
+        read_name = self.read_name
+        read_value = self.read_value
+        while True:
+            tagID = data[self.offset]
+            self.offset += 1
+            if tagID == 0:
+                break
+            name = read_name()
+            subtag = read_value(tagID)
+            subtag._name = name
+            value.append(subtag)
+
+        return value
+
+    def read_list(self):
+        list_type, value = self.read_list_items()
+        tag = _new_tag(_TAG_List, value)
+        tag.list_type = list_type
+        return tag
+
+    def read_list_items(self):
+        list_type = self.read_tag_id()
+        length = self.read_int()
+        read_value = self.read_value
+        return list_type, [read_value(list_type) for _ in xrange(length)]
+
+    def skip_value(self, tagID):
+        """Steps over the payload of a tag of the given type without creating any objects for it."""
+        fmt = self.scalar_formats.get(tagID)
+        if fmt is not None:
+            self.offset += fmt.size
+
+        elif tagID == TAG_COMPOUND:
+            while True:
+                subtagID = self.read_tag_id()
+                if subtagID == 0:
+                    break
+                self.read_raw_string()
+                self.skip_value(subtagID)
+
+        elif tagID == TAG_LIST:
+            list_type = self.read_tag_id()
+            length = self.read_int()
+            fmt = self.scalar_formats.get(list_type)
+            if fmt is not None:
+                self.offset += fmt.size * length
+            else:
+                for _ in xrange(length):
+                    self.skip_value(list_type)
+
+        elif tagID == TAG_STRING:
+            self.read_raw_string()
+
+        elif tagID in self.array_dtypes:
+            length = self.read_int()
+            self.offset += length * self.array_dtypes[tagID].itemsize
+
+        else:
+            raise NBTFormatError("Unknown tag type {0} at offset {1}".format(tagID, self.offset - 1))
+
+        if self.offset > len(self.data):
+            raise NBTFormatError("NBT Stream too short. Tag ended past the end of the data")
+
+
+class _LazyTag(object):
+    """
+    Mixin for the TAG_Compound and TAG_List objects created by load(lazy=True). The tag remembers where its payload
+    is in the loaded buffer and only reads its children the first time its value is used. Until then, saving it
+    writes the original payload bytes back out.
+    """
+    __slots__ = ()
+
+    # (buffer, start offset, end offset, byte order) until the payload is read
+    _raw = None
+    _decoded = None
+
+    def _get_value(self):
+        raw = self._raw
+        if raw is not None:
+            data, start, end, byte_order = raw
+            self._decoded = self._read_raw(_NBTReader(data, start, byte_order, lazy=True))
+            self._raw = None
+        return self._decoded
+
+    def _set_value(self, value):
+        self._raw = None
+        self._decoded = value
+
+    _value = property(_get_value, _set_value)
+
+    @property
+    def isLoaded(self):
+        """False until the tag's children have been read from the buffer."""
+        return self._raw is None
+
+    def write_value(self, buf):
+        raw = self._raw
+        if raw is not None and raw[3] == _byte_order:
+            data, start, end, byte_order = raw
+            buf.write(buffer(data, start, end - start))
+        else:
+            super(_LazyTag, self).write_value(buf)
+
+
+class _LazyTAG_Compound(_LazyTag, TAG_Compound):
+    @staticmethod
+    def _read_raw(reader):
+        return reader.read_compound_items()
+
+    def __deepcopy__(self, memo):
+        return TAG_Compound(deepcopy(self.value, memo), self.name)
+
+
+class _LazyTAG_List(_LazyTag, TAG_List):
+    @staticmethod
+    def _read_raw(reader):
+        return reader.read_list_items()[1]
+
+    def __deepcopy__(self, memo):
+        return TAG_List(deepcopy(self.value, memo), self.name, self.list_type)
+
+
+# The reader always builds the pure-python tag classes, even after the Cython module replaces the public names.
+_py_tag_classes = dict(tag_classes)
+_TAG_Compound = TAG_Compound
+_TAG_List = TAG_List
+
+
+def _new_tag(cls, value, name=u""):
+    # Bypass __init__ and the data_type coercion - values coming out of the reader already have the right type.
+    tag = cls.__new__(cls)
+    tag._value = value
+    tag._name = name
+    return tag
+
+
+def _reader_for(buf, byte_order, lazy=False):
+    if isinstance(buf, numpy.ndarray):
+        buf = buf.tostring()
+    data = bytearray(buf)
 
     if not len(data):
         raise NBTFormatError("Asked to load root tag of zero length")
 
-    tag_type = data[0]
-    if tag_type != 10:
-        magic = data[:4]
+    if data[0] != TAG_COMPOUND:
+        magic = str(data[:4]).ljust(4, '\0')
         raise NBTFormatError('Not an NBT file with a root TAG_Compound '
-                             '(file starts with "%s" (0x%08x)' % (magic.tostring(), magic.view(dtype='uint32')))
+                             '(file starts with "%s" (0x%08x)' % (magic, fromstring(magic, 'uint32')))
 
-    ctx = load_ctx()
-    ctx.offset = 1
-    ctx.data = data
+    return _NBTReader(data, 1, byte_order, lazy)
 
-    tag_name = load_string(ctx)
-    tag = TAG_Compound.load_from(ctx)
+
+def _load_buffer(buf, lazy=False):
+    reader = _reader_for(buf, _byte_order, lazy)
+    try:
+        tag_name = reader.read_name()
+        tag = reader.read_compound()
+    except (struct.error, ValueError, IndexError) as e:
+        raise NBTFormatError("NBT Stream too short or corrupt: {0}".format(e))
     tag.name = tag_name
 
     return tag
 
 
-__all__ = [a.__name__ for a in tag_classes.itervalues()] + ["load", "gunzip"]
+def _active_byte_order():
+    if _cython_nbt is not None:
+        return ">" if _cython_nbt._BIG_ENDIAN else "<"
+    return _byte_order
+
+
+def iter_events(filename="", buf=None, skip=None):
+    """
+    Walks an NBT file without building the tree, yielding one event per tag as (event, path, tagID, value):
+
+    ("start", path, tagID, None) when entering a TAG_Compound or TAG_List,
+    ("end", path, tagID, None) when leaving one,
+    ("value", path, tagID, value) for every other tag, with value already decoded.
+
+    path is a tuple of the names (inside compounds) and indexes (inside lists) leading to the tag; the root
+    compound's path is ().
+
+    If skip is given, it is called as skip(path, tagID) before each tag is read. When it returns True the tag and
+    everything under it is stepped over without being decoded and no events are yielded for it.
+
+    Respects littleEndianNBT().
+    """
+    if filename:
+        buf = file(filename, "rb")
+
+    if hasattr(buf, "read"):
+        buf = buf.read()
+
+    reader = _reader_for(try_gunzip(buf), _active_byte_order())
+    reader.read_raw_string()
+
+    try:
+        for event in _iter_value_events(reader, (), TAG_COMPOUND, skip):
+            yield event
+    except (struct.error, ValueError, IndexError) as e:
+        raise NBTFormatError("NBT Stream too short or corrupt: {0}".format(e))
+
+
+def _iter_value_events(reader, path, tagID, skip):
+    if skip is not None and skip(path, tagID):
+        reader.skip_value(tagID)
+        return
+
+    if tagID == TAG_COMPOUND:
+        yield "start", path, tagID, None
+        while True:
+            subtagID = reader.read_tag_id()
+            if subtagID == 0:
+                break
+            name = reader.read_name()
+            for event in _iter_value_events(reader, path + (name,), subtagID, skip):
+                yield event
+        yield "end", path, tagID, None
+
+    elif tagID == TAG_LIST:
+        yield "start", path, tagID, None
+        list_type = reader.read_tag_id()
+        length = reader.read_int()
+        for i in xrange(length):
+            for event in _iter_value_events(reader, path + (i,), list_type, skip):
+                yield event
+        yield "end", path, tagID, None
+
+    else:
+        yield "value", path, tagID, reader.read_payload(tagID)
+
+
+def load_root_compounds(buf):
+    """
+    Reads a run of TAG_Compounds written one after another as root tags, the way Pocket Edition stores the entities
+    and tile entities of a chunk, and returns them as a list. The data is walked once; nothing is split or copied
+    into a new string except, with the Cython backend, each compound's own bytes.
+
+    Respects littleEndianNBT().
+    """
+    if hasattr(buf, "read"):
+        buf = buf.read()
+    if not buf:
+        return []
+
+    reader = _reader_for(buf, _active_byte_order())
+    data = reader.data
+    tags = []
+    try:
+        while True:
+            start = reader.offset - 1
+            name = reader.read_name()
+            if _cython_nbt is None:
+                tag = reader.read_compound()
+                tag.name = name
+            else:
+                # The Cython reader can't start partway into a buffer, so it is given just this compound
+                reader.skip_value(TAG_COMPOUND)
+                tag = load(buf=str(data[start:reader.offset]))
+            tags.append(tag)
+
+            if reader.offset >= len(data):
+                break
+            tagID = reader.read_tag_id()
+            if tagID != TAG_COMPOUND:
+                raise NBTFormatError("Expected a root TAG_Compound at offset {0}, found tag type {1}".format(
+                    reader.offset - 1, tagID))
+    except (struct.error, ValueError, IndexError) as e:
+        raise NBTFormatError("NBT Stream too short or corrupt: {0}".format(e))
+
+    return tags
+
+
+def save_root_compounds(tags, replace=None):
+    """
+    Writes each TAG_Compound in tags as a root tag, one after another, into a single buffer and returns its contents.
+    This is the inverse of load_root_compounds().
+
+    If replace is given, it is called with each compound and returns a dict of {name: tag} giving top-level tags to
+    write in place of the compound's own tags with those names, or None. The compounds themselves are not modified.
+
+    Respects littleEndianNBT().
+    """
+    buf = StringIO()
+    for tag in tags:
+        if replace is not None:
+            replacements = replace(tag)
+            if replacements:
+                for name, subtag in replacements.iteritems():
+                    subtag.name = name
+                tag = TAG_Compound([replacements.get(subtag.name, subtag) for subtag in tag.value], tag.name or "")
+        tag.save(buf, compressed=False)
+
+    return buf.getvalue()
+
+
+__all__ = [a.__name__ for a in tag_classes.itervalues()] + ["load", "gunzip", "iter_events", "load_root_compounds",
+                                                            "save_root_compounds"]
 
 
 @contextmanager
@@ -578,8 +949,16 @@ def littleEndianNBT():
         value_str = self.value.tostring()
         buf.write(struct.pack(">I%ds" % (len(value_str),), self.value.size, value_str))
 
-    global string_len_fmt
+    # Patch the pure-python classes even after the Cython module has replaced the public names.
+    TAG_Byte, TAG_Short, TAG_Int, TAG_Long, TAG_Float, TAG_Double = [_py_tag_classes[i]
+                                                                     for i in range(TAG_BYTE, TAG_DOUBLE + 1)]
+    TAG_Byte_Array = _py_tag_classes[TAG_BYTE_ARRAY]
+    TAG_Int_Array = _py_tag_classes[TAG_INT_ARRAY]
+    TAG_Short_Array = _py_tag_classes[TAG_SHORT_ARRAY]
+
+    global string_len_fmt, _byte_order
     string_len_fmt = struct.Struct("<H")
+    _byte_order = "<"
     TAG_Byte.fmt = struct.Struct("<b")
     TAG_Short.fmt = struct.Struct("<h")
     TAG_Int.fmt = struct.Struct("<i")
@@ -593,6 +972,7 @@ def littleEndianNBT():
     TAG_Byte_Array.write_value = override_byte_array_write_value
     yield
     string_len_fmt = struct.Struct(">H")
+    _byte_order = ">"
     TAG_Byte.fmt = struct.Struct(">b")
     TAG_Short.fmt = struct.Struct(">h")
     TAG_Int.fmt = struct.Struct(">i")
@@ -630,8 +1010,15 @@ def nested_string(tag, indent_string="  ", indent=0):
     return result
 
 
+# Kept reachable for comparing the two implementations (see test/time_nbt.py)
+_py_load = load
+_py_littleEndianNBT = littleEndianNBT
+
+_cython_nbt = None
+
 try:
     # noinspection PyUnresolvedReferences
+    import _nbt as _cython_nbt
     from _nbt import (load, TAG_Byte, TAG_Short, TAG_Int, TAG_Long, TAG_Float, TAG_Double, TAG_String,
                       TAG_Byte_Array, TAG_List, TAG_Compound, TAG_Int_Array, TAG_Short_Array, NBTFormatError,
                       littleEndianNBT, nested_string, gunzip)
@@ -0,0 +1,132 @@
+"""
+Map-reduce scans over every chunk of a world.
+
+scanChunks() calls a function on each chunk of a level and combines the results. With jobs > 1 the chunks of an
+MCInfdevOldLevel are split up by region file and handed to a pool of worker processes, each of which opens its own
+read-only copy of the world, so a scan of a large world can use every core.
+
+    counts = scanChunks(level, countBlocks, jobs=8)
+
+The chunk function and its results cross process boundaries, so they must be picklable: define the function at
+module level, bind any parameters with functools.partial, and return plain data rather than chunks or tags.
+Results are combined with operator.iadd unless another reduce function is given, which suits bincount arrays,
+lists and collections.Counter.
+
+Workers read the world from disk, so levels with unsaved changes, dimensions other than the overworld and other
+kinds of level are scanned in this process instead.
+"""
+
+import logging
+import multiprocessing
+import operator
+
+from numpy import bincount, uint16, uint64
+
+from mclevelbase import ChunkMalformed, ChunkNotPresent
+
+log = logging.getLogger(__name__)
+
+
+def countBlocks(chunk):
+    """ Returns the number of blocks of each (ID, data) pair in chunk, indexed by data << 12 | ID. """
+    btypes = chunk.Data.ravel().astype(uint16)
+    btypes <<= 12
+    btypes += chunk.Blocks.ravel()
+    return bincount(btypes, minlength=65536).astype(uint64)
+
+
+def regionChunkGroups(chunkPositions):
+    """ Groups chunk positions by the region file that holds them. Returns a list of lists. """
+    groups = {}
+    for cx, cz in chunkPositions:
+        groups.setdefault((cx >> 5, cz >> 5), []).append((cx, cz))
+    return [sorted(groups[r]) for r in sorted(groups)]
+
+
+def canScanInParallel(level):
+    return (hasattr(level, "worldFolder") and level.dimNo == 0 and not level.hasUnsavedChanges)
+
+
+def _scanGroup(level, mapChunk, reduceFunc, positions):
+    total = None
+    for cx, cz in positions:
+        try:
+            chunk = level.getChunk(cx, cz)
+        except (ChunkMalformed, ChunkNotPresent), e:
+            log.warn(u"Skipping chunk {0}: {1!r}".format((cx, cz), e))
+            continue
+
+        result = mapChunk(chunk)
+        if result is None:
+            continue
+        total = result if total is None else reduceFunc(total, result)
+    return total
+
+
+_workerLevel = None
+
+
+def _openWorkerLevel(filename):
+    global _workerLevel
+    from infiniteworld import MCInfdevOldLevel
+
+    _workerLevel = MCInfdevOldLevel(filename, readonly=True)
+
+
+def _scanGroupInWorker(args):
+    mapChunk, reduceFunc, positions = args
+    try:
+        return len(positions), _scanGroup(_workerLevel, mapChunk, reduceFunc, positions)
+    finally:
+        # chunks are not revisited, so don't let them pile up in the worker
+        _workerLevel.unload()
+
+
+def scanChunks(level, mapChunk, reduceFunc=operator.iadd, initial=None, jobs=1, progress=None,
+               chunkPositions=None):
+    """
+    Calls mapChunk(chunk) for every chunk in level, or for the chunks at chunkPositions, and returns the results
+    folded together with reduceFunc, starting from initial. Results of None are ignored, and chunks that cannot be
+    read are skipped.
+
+    jobs is the number of worker processes to use, or None for one per CPU. If given, progress(chunksDone,
+    chunkCount) is called each time a region's worth of chunks has been scanned.
+    """
+    if chunkPositions is None:
+        chunkPositions = level.allChunks
+    groups = regionChunkGroups(chunkPositions)
+    chunkCount = sum(len(g) for g in groups)
+
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    jobs = min(jobs, len(groups))
+
+    if jobs > 1 and not canScanInParallel(level):
+        log.info(u"{0} can not be scanned by worker processes, scanning here instead".format(level))
+        jobs = 1
+
+    def results():
+        if jobs > 1:
+            pool = multiprocessing.Pool(jobs, _openWorkerLevel, (level.worldFolder.filename,))
+            try:
+                for result in pool.imap_unordered(_scanGroupInWorker,
+                                                  [(mapChunk, reduceFunc, g) for g in groups]):
+                    yield result
+                pool.close()
+            finally:
+                pool.terminate()
+                pool.join()
+        else:
+            for g in groups:
+                yield len(g), _scanGroup(level, mapChunk, reduceFunc, g)
+
+    total = initial
+    done = 0
+    for count, result in results():
+        done += count
+        if result is not None:
+            total = result if total is None else reduceFunc(total, result)
+        if progress:
+            progress(done, chunkCount)
+
+    return total
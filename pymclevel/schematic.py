@@ -232,7 +232,7 @@ class MCSchematic(EntityLevel):
         blockrotation.RotateLeft(self.Blocks, self.Data)
 
     def rotateLeft(self):
-        self._fakeEntities = None
+        self._entitiesMoved()
         self._Blocks = swapaxes(self._Blocks, 1, 2)[:, ::-1, :]  # x=z; z=-x
         if "Biomes" in self.root_tag:
             self.root_tag["Biomes"].value = swapaxes(self.root_tag["Biomes"].value, 0, 1)[::-1, :]
@@ -301,7 +301,7 @@ class MCSchematic(EntityLevel):
     def roll(self):
         " xxx rotate stuff - destroys biomes"
         self.root_tag.pop('Biomes', None)
-        self._fakeEntities = None
+        self._entitiesMoved()
 
         self._Blocks = swapaxes(self._Blocks, 2, 0)[:, :, ::-1]  # x=y; y=-x
         self.root_tag["Data"].value = swapaxes(self.root_tag["Data"].value, 2, 0)[:, :, ::-1]
@@ -350,7 +350,7 @@ class MCSchematic(EntityLevel):
 
     def flipVertical(self):
         " xxx delete stuff "
-        self._fakeEntities = None
+        self._entitiesMoved()
 
         blockrotation.FlipVertical(self.Blocks, self.Data)
         self._Blocks = self._Blocks[::-1, :, :]  # y=-y
@@ -403,7 +403,7 @@ class MCSchematic(EntityLevel):
         if "Biomes" in self.root_tag:
             self.root_tag["Biomes"].value = self.root_tag["Biomes"].value[::-1, :]
 
-        self._fakeEntities = None
+        self._entitiesMoved()
 
         blockrotation.FlipNorthSouth(self.Blocks, self.Data)
         self._Blocks = self._Blocks[:, :, ::-1]  # x=-x
@@ -478,7 +478,7 @@ class MCSchematic(EntityLevel):
         if "Biomes" in self.root_tag:
             self.root_tag["Biomes"].value = self.root_tag["Biomes"].value[:, ::-1]
 
-        self._fakeEntities = None
+        self._entitiesMoved()
 
         blockrotation.FlipEastWest(self.Blocks, self.Data)
         self._Blocks = self._Blocks[:, ::-1, :]  # z=-z
@@ -1,6 +1,8 @@
 """
 This file contains implementation of Tall World Level support
 """
+import collections
+from multiprocessing.pool import ThreadPool
 import subprocess
 import socket
 import logging
@@ -19,6 +21,8 @@ from infiniteworld import unpackNibbleArray, packNibbleArray
 log = logging.getLogger(__name__)
 
 port = 25666
+
+_notInMemo = object()
 map_jar = "TWMapServer-0.1.2-all.jar"
 
 class _VM(object):
@@ -123,11 +127,56 @@ class _Client(object):
             log.error("Invalid reply id %x", packet_id)
             raise IOError
 
-    def requestSaveChunk(self, chunk):
-        self._send('!biii', 0x3, *chunk.chunkPosition)
+    @staticmethod
+    def saveChunkPacket(chunk):
+        """
+        Returns the packet that saves the whole of chunk.
+        """
         data = chunk.saveTagData()
-        self._send('!i', len(data))
-        self._socket.sendall(data)
+        return struct.pack('!biiii', 0x3, chunk.cx, chunk.cy, chunk.cz, len(data)) + data
+
+    @staticmethod
+    def deltaSaveChunkPacket(chunk, maxSize):
+        """
+        Returns the packet that saves only the parts of chunk changed since it was loaded or last saved, or None if
+        chunk.saveDeltaData can't encode them in maxSize bytes. Map servers that predate packet 0x6 don't
+        understand it.
+        """
+        data = chunk.saveDeltaData(maxSize)
+        if data is None:
+            return None
+        return struct.pack('!biiii', 0x6, chunk.cx, chunk.cy, chunk.cz, len(data)) + data
+
+    def requestSaveChunk(self, chunk):
+        self._socket.sendall(self.saveChunkPacket(chunk))
+
+    saveBufferSize = 1 << 18
+
+    def requestSaveChunks(self, packets):
+        """
+        Sends each of the save packets in packets, as returned by saveChunkPacket or deltaSaveChunkPacket, and
+        yields the number of bytes sent so far once each one has been sent. The packets are gathered into writes of
+        at least saveBufferSize bytes instead of going to the socket one at a time, so the yields come in bursts.
+        """
+        buf = []
+        buffered = 0
+        sent = 0
+        for packet in packets:
+            buf.append(packet)
+            buffered += len(packet)
+            if buffered >= self.saveBufferSize:
+                self._socket.sendall(''.join(buf))
+                for packet in buf:
+                    sent += len(packet)
+                    yield sent
+                del buf[:]
+                buffered = 0
+
+        if buf:
+            self._socket.sendall(''.join(buf))
+            for packet in buf:
+                sent += len(packet)
+                yield sent
 
     def requestSaveColumn(self, column):
         self._send('!bii', 0x23, column.cx, column.cz)
@@ -148,6 +197,7 @@ class TWLevel(EntityLevel, PCMetadata):
     dimNo = 0
     parentWorld = None
     isInfinite = True
+    cubicChunks = True
     materials = materials.alphaMaterials
 
     def __init__(self, filename, readonly):
@@ -165,6 +215,14 @@ class TWLevel(EntityLevel, PCMetadata):
 
         self._allColumns = None
         self._allCubes = None
+        # the sorted y positions of the cubes in each column, see _cubesInColumn
+        self._cubeColumns = None
+
+        # most recently used cubes for the per-block accessors, see _cubeAt
+        self._cubeMemo = {}
+        self._cubeMemoOrder = collections.deque()
+        self._lastCubePos = None
+        self._lastCube = None
 
         self.Width = 0
         self.Length = 0
@@ -207,27 +265,88 @@ class TWLevel(EntityLevel, PCMetadata):
                     time.sleep(.5)
 
     def close(self):
+        self._clearCubeMemo()
         self._client.close()
         self._vm.close()
 
+    def unload(self):
+        """
+        Drops the loaded columns and cubes, unsaved changes and all, and forgets which ones exist so the map server
+        is asked again.
+        """
+        self._clearCubeMemo()
+        self._loadedColumns.clear()
+        self._allColumns = None
+        self._allCubes = None
+        self._cubeColumns = None
+
+    # number of threads that serialise cubes while saving. Only the compression of each cube runs outside the GIL,
+    # about half of its time, so more than one job only pays off on several cores and slows saving on a single one.
+    saveJobs = 1
+
+    # save only the changed parts of cubes, with delta save packets. The map server must support packet 0x6.
+    deltaSaves = False
+    # cubes whose delta would be larger than this fraction of their full block and light arrays are saved whole
+    deltaSaveThreshold = 0.25
+
+    def _cubeSavePacket(self, cube):
+        if self.deltaSaves:
+            packet = _Client.deltaSaveChunkPacket(cube, int(TWCube.arraysSize * self.deltaSaveThreshold))
+            if packet is not None:
+                return packet
+        return _Client.saveChunkPacket(cube)
+
     def saveInPlaceGen(self):
+        """
+        Sends every dirty cube to the map server, then the columns whose summaries changed, and commits them all at
+        once. The cubes are serialised while the ones already done are streamed to the server, by a pool of threads
+        if saveJobs is more than one.
+        Yields (bytesSent, bytesTotal), where the total is estimated from the average size of the cubes sent so far.
+        """
         self.saving = True
-        self.checkSessionLock()
-        for cx, cz in self._loadedColumns:
-            column = self.getChunk(cx, cz)
-            # save column data as well
-            for cy in column._loadedChunks:
-                chunk = column._loadedChunks[cy]
-                if chunk.dirty:
-                    # send the chunk to the map server
-                    self._client.requestSaveChunk(chunk)
-                    chunk.dirty = False
-                    yield
-        # commit changes to the database
-        self._client.requestSave()
-        yield
-        self.save_metadata()
-        self.saving = False
+        try:
+            self.checkSessionLock()
+            dirtyCubes = [cube for column in self._loadedColumns.itervalues()
+                          for cube in column._loadedChunks.itervalues() if cube.dirty]
+
+            sent = 0
+            if dirtyCubes:
+                jobs = min(self.saveJobs, len(dirtyCubes))
+                pool = ThreadPool(jobs) if jobs > 1 else None
+                try:
+                    if pool is None:
+                        packets = (self._cubeSavePacket(cube) for cube in dirtyCubes)
+                    else:
+                        packets = pool.imap(self._cubeSavePacket, dirtyCubes, 4)
+
+                    for i, sent in enumerate(self._client.requestSaveChunks(packets)):
+                        dirtyCubes[i].dirty = False
+                        yield sent, sent * len(dirtyCubes) // (i + 1)
+                finally:
+                    if pool is not None:
+                        pool.terminate()
+                        pool.join()
+
+                savedCubes = collections.defaultdict(list)
+                for cube in dirtyCubes:
+                    savedCubes[cube.column].append(cube)
+                for column, cubes in savedCubes.iteritems():
+                    column.cubesSaved(cubes)
+
+            # columns whose summaries were computed or brought up to date
+            changedColumns = [column for column in self._loadedColumns.itervalues() if column.summaryChanged]
+            for column in changedColumns:
+                self._client.requestSaveColumn(column)
+                column.summaryChanged = False
+
+            if dirtyCubes or changedColumns:
+                # commit changes to the database
+                self._client.requestSave()
+                yield (sent, sent) if sent else None
+
+            self.save_metadata()
+        finally:
+            self.saving = False
 
     def displayName(self):
         return os.path.basename(os.path.dirname(self.filename))
@@ -268,11 +387,145 @@ class TWLevel(EntityLevel, PCMetadata):
             self._allCubes = self._client.requestListChunks()
         return self._allCubes
 
+    def _cubesInColumn(self, cx, cz):
+        if self._cubeColumns is None:
+            cubeColumns = collections.defaultdict(list)
+            for x, y, z in self.allChunks_cc:
+                cubeColumns[x, z].append(y)
+            for cys in cubeColumns.itervalues():
+                cys.sort()
+            self._cubeColumns = dict(cubeColumns)
+        return self._cubeColumns.get((cx, cz), [])
+
+    # --- Column summaries ---
+
+    def columnSummary(self, cx, cz):
+        """
+        Returns the TWColumnSummary of the column at cx, cz, which tells its highest and lowest occupied cubes,
+        surface heights and biomes without loading its cubes.
+        """
+        return self.getChunk(cx, cz).summary
+
+    def heightMapAt(self, x, z):
+        return self.columnSummary(x >> 4, z >> 4).heightMap[z & 0xf, x & 0xf]
+
+    def biomeAt(self, x, z):
+        return self.columnSummary(x >> 4, z >> 4).biomes[(z & 0xf) * 16 + (x & 0xf)]
+
+    # --- Block accessors ---
+
+    cubeMemoSize = 16
+
+    def _cubeAt(self, x, y, z):
+        """
+        Returns the cube containing the block at x, y, z, or None if there is no cube there. Flood fills, raycasts
+        and the like visit neighbouring blocks one at a time, so the last cube is checked first and the few before it
+        are kept in a small memo instead of going through getChunk_cc and containsChunk_cc for every block.
+        """
+        cPos = (x >> 4, y >> 4, z >> 4)
+        if cPos == self._lastCubePos:
+            return self._lastCube
+
+        cube = self._cubeMemo.get(cPos, _notInMemo)
+        if cube is _notInMemo:
+            cube = self.getChunk_cc(*cPos) if self.containsChunk_cc(*cPos) else None
+            if len(self._cubeMemoOrder) >= self.cubeMemoSize:
+                del self._cubeMemo[self._cubeMemoOrder.popleft()]
+            self._cubeMemo[cPos] = cube
+            self._cubeMemoOrder.append(cPos)
+
+        self._lastCubePos = cPos
+        self._lastCube = cube
+        return cube
+
+    def _clearCubeMemo(self):
+        self._cubeMemo.clear()
+        self._cubeMemoOrder.clear()
+        self._lastCubePos = None
+        self._lastCube = None
+
+    def blockAt(self, x, y, z):
+        """returns 0 for blocks outside the existing cubes.  automatically loads cubes."""
+        cube = self._cubeAt(x, y, z)
+        if cube is None:
+            return 0
+        return cube.Blocks[x & 0xf, z & 0xf, y & 0xf]
+
+    def setBlockAt(self, x, y, z, blockID):
+        cube = self._cubeAt(x, y, z)
+        if cube is None:
+            return 0
+        cube.markDirtyBlocks((x & 0xf, z & 0xf, y & 0xf), pending=False, names=("Blocks",))
+        cube.Blocks[x & 0xf, z & 0xf, y & 0xf] = blockID
+        cube.dirty = True
+        cube.needsLighting = True
+
+    def blockDataAt(self, x, y, z):
+        cube = self._cubeAt(x, y, z)
+        if cube is None:
+            return 0
+        return cube.Data[x & 0xf, z & 0xf, y & 0xf]
+
+    def setBlockDataAt(self, x, y, z, newdata):
+        cube = self._cubeAt(x, y, z)
+        if cube is None:
+            return 0
+        cube.markDirtyBlocks((x & 0xf, z & 0xf, y & 0xf), pending=False, names=("Data",))
+        cube.Data[x & 0xf, z & 0xf, y & 0xf] = newdata
+        cube.dirty = True
+        cube.needsLighting = True
+
+    def blockLightAt(self, x, y, z):
+        cube = self._cubeAt(x, y, z)
+        if cube is None:
+            return 0
+        return cube.BlockLight[x & 0xf, z & 0xf, y & 0xf]
+
+    def setBlockLightAt(self, x, y, z, newLight):
+        cube = self._cubeAt(x, y, z)
+        if cube is None:
+            return 0
+        cube.markDirtyBlocks((x & 0xf, z & 0xf, y & 0xf), pending=False, names=("BlockLight",))
+        cube.BlockLight[x & 0xf, z & 0xf, y & 0xf] = newLight
+        cube.dirty = True
+
+    def skylightAt(self, x, y, z):
+        """returns full sky light for blocks outside the existing cubes."""
+        cube = self._cubeAt(x, y, z)
+        if cube is None:
+            return 15
+        return cube.SkyLight[x & 0xf, z & 0xf, y & 0xf]
+
+    def setSkylightAt(self, x, y, z, lightValue):
+        cube = self._cubeAt(x, y, z)
+        if cube is None:
+            return 0
+        cube.markDirtyBlocks((x & 0xf, z & 0xf, y & 0xf), pending=False, names=("SkyLight",))
+        cube.SkyLight[x & 0xf, z & 0xf, y & 0xf] = lightValue
+        cube.dirty = True
+
 
 class TWCube(ChunkBase):
     Height = 16
     saving = False
 
+    # the arrays a delta save can send, as bits of _dirtyArrays and of the first byte of saveDeltaData
+    dirtyBlocks = 1
+    dirtyData = 2
+    dirtySkyLight = 4
+    dirtyBlockLight = 8
+    deltaArrays = ((dirtyBlocks, "Blocks"), (dirtyData, "Data"), (dirtySkyLight, "SkyLight"),
+                   (dirtyBlockLight, "BlockLight"))
+
+    # bytes taken by the block and light arrays in a full save
+    arraysSize = 4096 + 3 * 2048
+
+    # True when markDirtyBlocks has been called with pending=True since the last chunkChanged
+    _blocksMarked = False
+
+    # the lists a delta save can't send; a change to any of them makes the cube be saved whole
+    entityLists = ("Entities", "TileEntities", "TileTicks")
+
     def __init__(self, column, cx, cy, cz, tag):
         self.column = column
         self.world = column.world
@@ -281,13 +534,21 @@ class TWCube(ChunkBase):
         self.cz = cz
         self.chunkPosition = (cx, cy, cz)
         self.root_tag = tag
+        # the voxels changed since the cube was loaded or saved, indexed [x, z, y], and the arrays they changed.
+        # None while the changes are unknown, in which case a dirty cube has to be saved whole.
+        self._dirtyVoxels = None
+        self._dirtyArrays = 0
+        self._savedEntityLists = self._entityListVersions()
         # blocks
         if 'Blocks' not in tag:
             # Blocks can not exist if generation phase is zero
             self.Blocks = np.zeros((16, 16, 16), 'uint16')
         else:
-            self.Blocks = tag['Blocks'].value
+            self.Blocks = np.array(tag['Blocks'].value, 'uint16')
             self.Blocks.shape = (16, 16, 16)
+            if 'Add' in tag:
+                add = unpackNibbleArray(tag['Add'].value.reshape((16, 16, 8)))
+                self.Blocks |= np.array(add, 'uint16') << 8
             self.Blocks = self.Blocks.swapaxes(0, 2)
         # data values
         if 'Data' not in tag:
@@ -315,13 +576,92 @@ class TWCube(ChunkBase):
             self.BlockLight = self.BlockLight.swapaxes(0, 2)
         self.HeightMap = computeChunkHeightMap(self.world.materials, self.Blocks)
 
+    def _entityListVersions(self):
+        tags = [self.root_tag[name] if name in self.root_tag else None for name in self.entityLists]
+        return [(tag, None if tag is None else tag.version) for tag in tags]
+
+    def _entityListsChanged(self):
+        """
+        Returns True if an entity, tile entity or tile tick list was replaced, or changed through the list tag,
+        since the cube was loaded or saved.
+        """
+        return any(tag is not savedTag or version != savedVersion
+                   for (tag, version), (savedTag, savedVersion)
+                   in zip(self._entityListVersions(), self._savedEntityLists))
+
+    def _markDirtyVoxels(self, index, arrays):
+        if self._dirtyVoxels is None:
+            if self.dirty:
+                # changed before tracking started, so the cube will be saved whole anyway
+                return
+            self._dirtyVoxels = np.zeros((16, 16, 16), bool)
+        self._dirtyVoxels[index] = True
+        self._dirtyArrays |= arrays
+
+    def markDirtyBlocks(self, slices, pending=True, names=("Blocks", "Data")):
+        self._markDirtyVoxels(slices, sum(bit for bit, name in self.deltaArrays if name in names))
+        if pending:
+            self._blocksMarked = True
+
+    def chunkChanged(self, needsLighting=True):
+        # Blocks changed by code that doesn't call markDirtyBlocks could be anywhere in the cube
+        if not self._blocksMarked:
+            self._dirtyVoxels = None
+        self._blocksMarked = False
+        super(TWCube, self).chunkChanged(needsLighting)
+
+    def saveDeltaData(self, maxSize):
+        """
+        Returns the changes made to the cube since it was loaded or saved, or None if they aren't known, would
+        take more than maxSize bytes, include a block ID above 255 or include changes to the entity lists, which
+        a delta can't send. The changed voxels are numbered in y, z, x order as in the saved arrays and
+        grouped into runs of consecutive voxels. The data is:
+
+            flags      byte            which arrays are sent, as the bits in deltaArrays
+            runCount   unsigned short
+            runs       runCount pairs of unsigned shorts: first voxel, voxel count
+            values     for each array in flags, in deltaArrays order: one byte per voxel of every run, in order
+
+        Data and light values are sent one per byte rather than packed in nibbles.
+        """
+        if self._dirtyVoxels is None or self._entityListsChanged():
+            return None
+
+        mask = self._dirtyVoxels.swapaxes(0, 2).ravel()
+        edges = np.flatnonzero(np.diff(np.concatenate(([0], mask.view('int8'), [0]))))
+        runs = np.column_stack((edges[::2], edges[1::2] - edges[::2]))
+        arrays = [name for bit, name in self.deltaArrays if self._dirtyArrays & bit]
+        if 3 + 4 * len(runs) + len(arrays) * len(mask.nonzero()[0]) > maxSize:
+            return None
+
+        values = [getattr(self, name).swapaxes(0, 2).ravel()[mask] for name in arrays]
+        if "Blocks" in arrays and values[0].max() > 0xff:
+            return None
+
+        data = [struct.pack('!BH', self._dirtyArrays, len(runs)), runs.astype('>u2').tostring()]
+        for value in values:
+            data.append(value.astype('uint8').tostring())
+
+        self._dirtyVoxels = None
+        self._dirtyArrays = 0
+        return ''.join(data)
+
     def saveTagData(self):
+        self._dirtyVoxels = None
+        self._dirtyArrays = 0
+        self._savedEntityLists = self._entityListVersions()
+
         Blocks = self.Blocks.swapaxes(0, 2)
         Data = packNibbleArray(self.Data.swapaxes(0, 2))
         SkyLight = packNibbleArray(self.SkyLight.swapaxes(0, 2))
         BlockLight = packNibbleArray(self.BlockLight.swapaxes(0, 2))
 
-        self.root_tag['Blocks'] = nbt.TAG_Byte_Array(Blocks)
+        add = Blocks >> 8
+        if add.any():
+            self.root_tag['Add'] = nbt.TAG_Byte_Array(packNibbleArray(add).astype('uint8'))
+        elif 'Add' in self.root_tag:
+            del self.root_tag['Add']
+        self.root_tag['Blocks'] = nbt.TAG_Byte_Array(np.array(Blocks, 'uint8'))
         self.root_tag['Data'] = nbt.TAG_Byte_Array(Data)
         self.root_tag['SkyLight'] = nbt.TAG_Byte_Array(SkyLight)
         self.root_tag['BlockLight'] = nbt.TAG_Byte_Array(BlockLight)
@@ -340,6 +680,43 @@ class TWCube(ChunkBase):
     def TileTicks(self):
         return self.root_tag['TileTicks']
 
+class TWColumnSummary(object):
+    """
+    Facts about a column that would otherwise take loading its cubes to learn:
+
+        topCube, bottomCube  the y positions of the highest and lowest cubes holding anything but air, or None
+        heightMap            the y of the block above the highest block that absorbs light, indexed [z, x] like the
+                             HeightMap of a chunk, or the bottom of the lowest cube where there is no such block
+        biomes               the biome of each block column, indexed z * 16 + x, or 255 where it isn't known
+
+    Summaries are kept in the column's root_tag under tagName, so the map server stores them along with the
+    column.
+    """
+    tagName = "MCEditSummary"
+
+    def __init__(self, topCube, bottomCube, heightMap, biomes):
+        self.topCube = topCube
+        self.bottomCube = bottomCube
+        self.heightMap = heightMap
+        self.biomes = biomes
+
+    @classmethod
+    def fromTag(cls, tag):
+        return cls(tag["Top"].value if "Top" in tag else None,
+                   tag["Bottom"].value if "Bottom" in tag else None,
+                   tag["HeightMap"].value.view('>i4').astype('int32').reshape(16, 16),
+                   np.array(tag["Biomes"].value))
+
+    def toTag(self):
+        tag = nbt.TAG_Compound()
+        if self.topCube is not None:
+            tag["Top"] = nbt.TAG_Int(self.topCube)
+            tag["Bottom"] = nbt.TAG_Int(self.bottomCube)
+        tag["HeightMap"] = nbt.TAG_Int_Array(self.heightMap.ravel().astype('>i4').view('>u4'))
+        tag["Biomes"] = nbt.TAG_Byte_Array(self.biomes)
+        return tag
+
+
 class TWColumn(ChunkBase):
     def __init__(self, cx, cz, world, tag):
         self.world = world
@@ -347,6 +724,9 @@ class TWColumn(ChunkBase):
         self.cx = cx
         self.cz = cz
         self._loadedChunks = {}
+        self._summary = None
+        # True when the summary has changed since the column was last sent to the map server
+        self.summaryChanged = False
 
     def getCube(self, cy):
         chunk = self._loadedChunks.get(cy)
@@ -356,3 +736,107 @@ class TWColumn(ChunkBase):
         self._loadedChunks[cy] = chunk
         return chunk
 
+    def _peekCube(self, cy):
+        # the summary scans visit cubes once, so only cubes that are already loaded are kept
+        chunk = self._loadedChunks.get(cy)
+        if chunk is not None:
+            return chunk
+        return TWCube(self, self.cx, cy, self.cz, self.world._client.requestChunk(self.cx, cy, self.cz))
+
+    # --- Summary ---
+
+    @property
+    def summary(self):
+        """
+        The column's TWColumnSummary, read from its root_tag or, the first time, computed from its cubes.
+        """
+        if self._summary is None:
+            if self.root_tag is not None and TWColumnSummary.tagName in self.root_tag:
+                self._summary = TWColumnSummary.fromTag(self.root_tag[TWColumnSummary.tagName])
+            else:
+                cys = self.world._cubesInColumn(self.cx, self.cz)
+                topCube, heightMap = self._scanSurface(cys)
+                self._summary = TWColumnSummary(topCube, self._scanBottom(cys, topCube), heightMap,
+                                                self._biomes())
+                self._summaryUpdated()
+        return self._summary
+
+    @property
+    def HeightMap(self):
+        return self.summary.heightMap
+
+    def _biomes(self):
+        tag = self.root_tag
+        if tag is not None and "Level" in tag:
+            tag = tag["Level"]
+        if tag is not None and "Biomes" in tag:
+            return np.array(tag["Biomes"].value, 'uint8')
+        return np.empty(256, 'uint8') + 255
+
+    def _scanSurface(self, cys, startCube=None):
+        """
+        Finds the highest cube in cys that holds anything but air and the surface heights, looking at cubes from
+        startCube, or the highest one, downward until both are known. Returns (topCube, heightMap).
+        """
+        topCube = None
+        heightMap = np.zeros((16, 16), 'int32')
+        heightMap[:] = (cys[0] << 4) if cys else 0
+        found = np.zeros((16, 16), bool)
+
+        for cy in reversed(cys):
+            if startCube is not None and cy > startCube:
+                continue
+            cube = self._peekCube(cy)
+            if topCube is None and cube.Blocks.any():
+                topCube = cy
+            # the cube's HeightMap isn't kept up to date as it is edited
+            heights = computeChunkHeightMap(self.world.materials, cube.Blocks)
+            surface = (heights > 0) & ~found
+            heightMap[surface] = (cy << 4) + heights[surface]
+            found |= surface
+            if topCube is not None and found.all():
+                break
+
+        return topCube, heightMap
+
+    def _scanBottom(self, cys, topCube):
+        if topCube is None:
+            return None
+        return next(cy for cy in cys if cy == topCube or self._peekCube(cy).Blocks.any())
+
+    def _summaryUpdated(self):
+        if self.root_tag is not None:
+            self.root_tag[TWColumnSummary.tagName] = self._summary.toTag()
+            self.summaryChanged = True
+
+    def cubesSaved(self, cubes):
+        """
+        Brings the summary up to date with cubes, cubes of this column that have just been saved. Only the cubes
+        between the old and new top and bottom are looked at again, and the stack below the surface isn't.
+        """
+        if self._summary is None and (self.root_tag is None or TWColumnSummary.tagName not in self.root_tag):
+            # the summary will be computed from the cubes as they are now when it is needed
+            return
+        summary = self.summary
+
+        cys = self.world._cubesInColumn(self.cx, self.cz)
+        rescanTop = rescanBottom = False
+        for cube in cubes:
+            if cube.Blocks.any():
+                if summary.topCube is None:
+                    summary.topCube = summary.bottomCube = cube.cy
+                summary.topCube = max(summary.topCube, cube.cy)
+                summary.bottomCube = min(summary.bottomCube, cube.cy)
+            else:
+                rescanTop |= cube.cy == summary.topCube
+                rescanBottom |= cube.cy == summary.bottomCube
+
+        if rescanTop or any((cube.cy + 1) << 4 > summary.heightMap.min() for cube in cubes):
+            summary.topCube, summary.heightMap = self._scanSurface(cys, summary.topCube)
+            if summary.topCube is None:
+                summary.bottomCube = None
+        if rescanBottom and summary.topCube is not None:
+            summary.bottomCube = self._scanBottom([cy for cy in cys if cy >= summary.bottomCube], summary.topCube)
+
+        self._summaryUpdated()
+
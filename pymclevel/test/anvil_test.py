@@ -1,3 +1,4 @@
+from copy import deepcopy
 import itertools
 import os
 import shutil
@@ -9,7 +10,9 @@ from pymclevel.infiniteworld import MCInfdevOldLevel
 from pymclevel import nbt
 from pymclevel.schematic import MCSchematic
 from pymclevel.box import BoundingBox
-from pymclevel import block_copy
+from pymclevel.entity import Entity, TileEntity
+from pymclevel.level import getSectionSlices
+from pymclevel import block_copy, block_fill
 from templevel import mktemp, TempLevel
 
 __author__ = 'Rio'
@@ -23,6 +26,65 @@ class TestAnvilLevelCreate(unittest.TestCase):
         shutil.rmtree(temppath)
 
 
+class TestAnvilLazyArrays(unittest.TestCase):
+    def setUp(self):
+        self.temppath = mktemp("AnvilLazy")
+        level = MCInfdevOldLevel(filename=self.temppath, create=True)
+        level.createChunk(0, 0)
+        ch = level.getChunk(0, 0)
+        ch.Blocks[:, :, 0:70] = 1
+        ch.SkyLight[:, :, 0:70] = 3
+        ch.BlockLight[4, 4, 64] = 9
+        ch.dirty = True
+        level.saveInPlace()
+        level.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.temppath)
+
+    def testLightNotDecoded(self):
+        level = MCInfdevOldLevel(filename=self.temppath)
+        ch = level.getChunk(0, 0)
+        assert (ch.Blocks[:, :, 0:70] == 1).all()
+        assert not ch.chunkData.isDecoded("SkyLight")
+        assert not ch.chunkData.isDecoded("BlockLight")
+
+        ch.Blocks[0, 0, 100] = 4
+        ch.dirty = True
+        level.saveInPlace()
+        level.close()
+
+        level = MCInfdevOldLevel(filename=self.temppath)
+        ch = level.getChunk(0, 0)
+        assert ch.Blocks[0, 0, 100] == 4
+        assert (ch.SkyLight[:, :, 0:70] == 3).all()
+        assert (ch.SkyLight[:, :, 70:] == 15).all()
+        assert ch.BlockLight[4, 4, 64] == 9
+        assert ch.BlockLight.sum() == 9
+        level.close()
+
+    def testSectionSlices(self):
+        level = MCInfdevOldLevel(filename=self.temppath)
+        ch = level.getChunk(0, 0)
+        box = BoundingBox((2, 40, 0), (4, 200, 16))
+        (chunk, slices, point), = level.getChunkSlices(box)
+
+        # blocks fill y 0 to 70, so the sections from 80 up are empty
+        sections = list(getSectionSlices(chunk, slices, point))
+        assert [(s[2].start, s[2].stop, p[1]) for s, p in sections] == [(40, 48, 0), (48, 64, 8), (64, 80, 24)]
+        assert not ch.chunkData.isDecoded("Blocks")
+
+        table = block_fill.blockReplaceTable([level.materials.Stone])
+        replaced = sum(block_fill.replaceBlocks(ch, s, (2, 40 + p[1], 0), table, level.materials.Glass)
+                       for s, p in sections)
+        assert replaced == 4 * 16 * 30
+        assert (ch.Blocks[2:6, :, 40:70] == level.materials.Glass.ID).all()
+        assert (ch.Blocks[0:2, :, 40:70] == 1).all()
+
+        ch.Blocks[0, 0, 100] = 4
+        assert [s[2].start for s, p in getSectionSlices(chunk, slices, point)] == [40, 48, 64, 96]
+        level.close()
+
 class TestAnvilLevel(unittest.TestCase):
     def setUp(self):
         self.indevLevel = TempLevel("hell.mclevel")
@@ -179,3 +241,254 @@ class TestAnvilLevel(unittest.TestCase):
 
         eq = (changedChunk["Level"]["HeightMap"].value == oldhm)
         assert eq.all()
+
+
+class TestAnvilRawCopy(unittest.TestCase):
+    def setUp(self):
+        self.sourcePath = mktemp("AnvilRawCopySource")
+        self.destPath = mktemp("AnvilRawCopyDest")
+        self.source = MCInfdevOldLevel(filename=self.sourcePath, create=True)
+        self.dest = MCInfdevOldLevel(filename=self.destPath, create=True)
+
+        self.source.createChunks([(0, 0), (1, 0)])
+        for cx in range(2):
+            chunk = self.source.getChunk(cx, 0)
+            chunk.Blocks[:, :, 0:70] = (1, 4)[cx]
+            chunk.Biomes[:] = 7
+            chunk.chunkChanged()
+        self.source.addTileEntity(TileEntity.Create("Chest", (20, 70, 3)))
+        self.source.addEntity(Entity.Create("Pig"))
+        Entity.setpos(self.source.getChunk(0, 0).Entities[0], (1.5, 70, 2.5))
+        self.source.saveInPlace()
+
+    def tearDown(self):
+        self.source.close()
+        self.dest.close()
+        shutil.rmtree(self.sourcePath)
+        shutil.rmtree(self.destPath)
+
+    def testOffsetCopy(self):
+        box = BoundingBox((0, 0, 0), (32, self.source.Height, 16))
+        self.dest.copyBlocksFrom(self.source, box, (32, 0, -16), create=True, biomes=True)
+
+        # copied as stored, so nothing was decoded into the destination
+        assert not self.dest._loadedChunkData
+        assert sorted(self.dest.allChunks) == [(2, -1), (3, -1)]
+
+        chunk = self.dest.getChunk(3, -1)
+        assert chunk.root_tag["Level"]["xPos"].value == 3
+        assert (chunk.Blocks[:, :, 0:70] == 4).all()
+        assert (chunk.Biomes == 7).all()
+        assert self.dest.tileEntityAt(52, 70, -13) is not None
+        assert Entity.pos(self.dest.getChunk(2, -1).Entities[0]) == [33.5, 70, -13.5]
+
+    def testAlignedCopy(self):
+        box = BoundingBox((0, 0, 0), (32, self.source.Height, 16))
+        self.dest.copyBlocksFrom(self.source, box, (0, 0, 0), create=True, biomes=True)
+        assert not self.dest._loadedChunkData
+        assert self.dest.blockAt(20, 10, 3) == 4
+        assert self.dest.tileEntityAt(20, 70, 3) is not None
+
+        # partial chunks still go through the block copy
+        self.dest.copyBlocksFrom(self.source, BoundingBox((0, 0, 0), (32, 100, 16)), (64, 0, 0), create=True,
+                                 biomes=True)
+        assert self.dest.blockAt(84, 10, 3) == 4
+        assert self.dest.blockAt(84, 100, 3) == 0
+
+    def testUndoRawCopy(self):
+        self.dest.createChunks([(0, 0), (1, 0), (2, -1)])
+        for cPos in (0, 0), (1, 0), (2, -1):
+            chunk = self.dest.getChunk(*cPos)
+            chunk.Blocks[:, :, 0:10] = 3
+            chunk.chunkChanged()
+        self.dest.saveInPlace()
+        self.dest.close()
+        self.dest = MCInfdevOldLevel(filename=self.destPath)
+
+        box = BoundingBox((0, 0, 0), (32, self.source.Height, 16))
+        changeset = self.dest.undoJournal.begin()
+        self.dest.copyBlocksFrom(self.source, box, (0, 0, 0), biomes=True)
+        self.dest.copyBlocksFrom(self.source, box, (32, 0, -16), biomes=True)
+        # copied as stored
+        assert not self.dest._loadedChunkData
+        changeset.commit()
+        assert self.dest.blockAt(20, 60, 3) == 4
+        assert self.dest.blockAt(33, 60, -15) == 1
+
+        changeset.undo()
+        for cPos in (0, 0), (1, 0), (2, -1):
+            chunk = self.dest.getChunk(*cPos)
+            assert (chunk.Blocks[:, :, 0:10] == 3).all()
+            assert not chunk.Blocks[:, :, 10:].any()
+            assert not len(chunk.TileEntities) and not len(chunk.Entities)
+
+        changeset.redo()
+        assert self.dest.blockAt(20, 60, 3) == 4
+        assert self.dest.tileEntityAt(20, 70, 3) is not None
+        assert self.dest.blockAt(33, 60, -15) == 1
+        # without create, chunks missing from the destination are left out
+        assert not self.dest.containsChunk(3, -1)
+
+
+class TestAnvilBlocksAt(unittest.TestCase):
+    def setUp(self):
+        self.temppath = mktemp("AnvilBlocksAt")
+        self.level = MCInfdevOldLevel(filename=self.temppath, create=True)
+        self.level.createChunks([(0, 0), (1, 0), (-1, 2)])
+
+    def tearDown(self):
+        self.level.close()
+        shutil.rmtree(self.temppath)
+
+    def testBlocksAt(self):
+        level = self.level
+        x = numpy.array([0, 17, 31, -5, 40, 3, 3])
+        y = numpy.array([5, 64, 255, 10, 10, -1, 256])
+        z = numpy.array([0, 3, 15, 40, 40, 0, 0])
+        level.setBlocksAt(x, y, z, numpy.array([1, 2, 3, 4, 5, 6, 7]))
+        level.setBlocksDataAt(x, y, z, 9)
+
+        assert level.blockAt(0, 5, 0) == 1
+        assert level.blockAt(17, 64, 3) == 2
+        assert level.blockAt(31, 255, 15) == 3
+        assert level.blockAt(-5, 10, 40) == 4
+        assert level.blockDataAt(17, 64, 3) == 9
+
+        # (40, 10, 40) is in a chunk that does not exist, the last two are outside the level's height
+        assert list(level.blocksAt(x, y, z, fill=99)) == [1, 2, 3, 4, 99, 99, 99]
+
+        xs, zs = numpy.mgrid[0:32, 0:16]
+        level.setBlocksAt(xs, 100, zs, xs + zs)
+        assert (level.blocksAt(xs, 100, zs) == xs + zs).all()
+        assert level.blockAt(20, 100, 7) == 27
+
+    def testSchematicBlocksAt(self):
+        sch = MCSchematic(shape=(20, 10, 20))
+        sch.setBlocksAt([1, 19, 25], [2, 9, 3], [3, 19, 4], 4)
+        assert sch.blockAt(1, 2, 3) == 4
+        assert sch.blockAt(19, 9, 19) == 4
+        assert list(sch.blocksAt([1, 19, 25], [2, 9, 3], [3, 19, 4])) == [4, 4, 0]
+
+    def testBlockArray(self):
+        level = self.level
+        box = BoundingBox((-4, 60, 2), (24, 10, 36))
+        arr = numpy.arange(box.volume).reshape(box.size[0], box.size[2], box.size[1]) % 200 + 1
+        level.setBlockArray(box, arr)
+
+        assert level.blockAt(-4, 60, 32) == arr[0, 30, 0]
+        assert level.blockAt(19, 69, 15) == arr[23, 13, 9]
+        assert level.getChunk(1, 0).dirty
+
+        # the box covers parts of three chunks; the rest reads as fill
+        result = level.getBlockArray(box, fill=255)
+        assert result.shape == (24, 36, 10)
+        assert (result[4:24, 0:14] == arr[4:24, 0:14]).all()
+        assert (result[0:4, 0:14] == 255).all()
+        assert (result[:, 14:30] == 255).all()
+        assert (result[0:4, 30:36] == arr[0:4, 30:36]).all()
+
+        mapped = level.getBlockArray(box, fill=255, mmap=True)
+        assert (mapped == result).all()
+        assert not mapped.flags.writeable
+
+        level.setBlockArray(box, 0, "Data")
+        assert not level.getBlockArray(box, "Data").any()
+
+    def testSchematicBlockArray(self):
+        sch = MCSchematic(shape=(20, 10, 20))
+        box = BoundingBox((15, 0, 15), (10, 10, 10))
+        sch.setBlockArray(box, 7)
+        assert sch.blockAt(19, 9, 19) == 7
+        result = sch.getBlockArray(box)
+        assert (result[0:5, 0:5] == 7).all()
+        assert not result[5:].any()
+
+    def testEntityQueries(self):
+        level = self.level
+        for entityID, pos in [("Pig", (1.5, 64, 1.5)), ("Pig", (20.5, 64, 3.5)), ("Cow", (2.5, 70, 14.5)),
+                              ("Pig", (-3.5, 64, 40.5))]:
+            ent = Entity.Create(entityID)
+            Entity.setpos(ent, pos)
+            level.addEntity(ent)
+
+        box = BoundingBox((0, 60, 0), (32, 20, 16))
+        assert len(level.queryEntities(box)) == 3
+        assert [Entity.pos(e) for e in level.queryEntities(box, ids=["Pig"])] == [[1.5, 64, 1.5], [20.5, 64, 3.5]]
+
+        chunk = level.getChunk(0, 0)
+        assert chunk.entityPositions().tolist() == [[1.5, 64, 1.5], [2.5, 70, 14.5]]
+        assert level.removeEntitiesInBox(BoundingBox((0, 68, 0), (32, 4, 16))) == 1
+        assert chunk.entityPositions().tolist() == [[1.5, 64, 1.5]]
+
+        ent = Entity.Create("Cow")
+        Entity.setpos(ent, (3.5, 64, 3.5))
+        chunk.addEntity(ent)
+        assert chunk.entityPositions().tolist() == [[1.5, 64, 1.5], [3.5, 64, 3.5]]
+        assert chunk.removeEntities(lambda p: p[0] < 2) == 1
+        assert chunk.getEntitiesInBox(box) == [ent]
+
+        # changes made through the list tag are picked up, entities moved in place once _entitiesMoved is called
+        chunk.Entities.pop()
+        pig = Entity.Create("Pig")
+        Entity.setpos(pig, (10.5, 10, 10.5))
+        chunk.Entities.append(pig)
+        assert chunk.getEntitiesInBox(BoundingBox((10, 10, 10), (1, 1, 1))) == [pig]
+        pig["Pos"][1].value = 64.0
+        chunk._entitiesMoved()
+        assert chunk.getEntitiesInBox(BoundingBox((10, 10, 10), (1, 1, 1))) == []
+        assert chunk.entityPositions().tolist() == [[10.5, 64, 10.5]]
+
+    def testTileEntityIndex(self):
+        level = self.level
+        chunk = level.getChunk(0, 0)
+        for i in range(200):
+            level.addTileEntity(TileEntity.Create("Chest", (i % 16, i // 16, 3)))
+        assert len(chunk.TileEntities) == 200
+
+        replacement = TileEntity.Create("Furnace", (5, 2, 3))
+        level.addTileEntity(replacement)
+        assert len(chunk.TileEntities) == 200
+        assert level.tileEntityAt(5, 2, 3) is replacement
+        assert level.tileEntityAt(5, 2, 4) is None
+
+        # changes made to the list directly are picked up
+        chunk.TileEntities.append(TileEntity.Create("Chest", (5, 2, 4)))
+        assert level.tileEntityAt(5, 2, 4)["id"].value == "Chest"
+
+        # moving a tag and adding it again leaves one copy of it
+        TileEntity.setpos(replacement, (6, 20, 3))
+        level.addTileEntity(replacement)
+        assert len(chunk.TileEntities) == 201
+        assert level.tileEntityAt(5, 2, 3) is None
+        assert level.tileEntityAt(6, 20, 3) is replacement
+
+        chunk.removeTileEntitiesInBox(BoundingBox((0, 0, 0), (16, 1, 16)))
+        assert level.tileEntityAt(3, 0, 3) is None
+        assert level.tileEntityAt(3, 1, 3) is not None
+
+        tick = nbt.TAG_Compound([nbt.TAG_Int(1, "x"), nbt.TAG_Int(2, "y"), nbt.TAG_Int(3, "z")])
+        level.addTileTick(tick)
+        level.addTileTick(deepcopy(tick))
+        assert len(chunk.TileTicks) == 1
+        assert level.tileTickAt(1, 2, 3) is not tick
+
+        # removing one tag and appending another keeps the length the same
+        chunk.TileEntities.remove(level.tileEntityAt(3, 1, 3))
+        chunk.TileEntities.append(TileEntity.Create("Furnace", (9, 9, 9)))
+        assert level.tileEntityAt(9, 9, 9)["id"].value == "Furnace"
+        count = len(chunk.TileEntities)
+        level.addTileEntity(TileEntity.Create("Chest", (9, 9, 9)))
+        assert len(chunk.TileEntities) == count
+        assert level.tileEntityAt(9, 9, 9)["id"].value == "Chest"
+
+    def testCreateTileEntities(self):
+        chunk = self.level.getChunk(1, 0)
+        mask = numpy.zeros((4, 16, 8), bool)
+        mask[1, 2, 3] = mask[3, 15, 7] = True
+        block_fill.createTileEntities(chunk, "Chest", mask, mask.shape, (18, 60, 0))
+        assert len(chunk.TileEntities) == 2
+        assert chunk.tileEntityAt(19, 63, 2)["id"].value == "Chest"
+        assert chunk.tileEntityAt(21, 67, 15) is not None
+
+        block_fill.createTileEntities(chunk, "Chest", slice(None), mask.shape, (18, 60, 0))
+        assert len(chunk.TileEntities) == mask.size
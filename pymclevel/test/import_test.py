@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+import unittest
+
+import pymclevel
+
+__author__ = 'Rio'
+
+
+def modulesLoadedBy(statement):
+    """ Runs statement in a fresh interpreter and returns the pymclevel modules it loaded. """
+    root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    code = statement + "\nimport sys\nprint sorted(m for m in sys.modules " \
+                       "if m.startswith('pymclevel') and sys.modules[m] is not None)"
+    with open(os.devnull, "w") as devnull:
+        output = subprocess.check_output([sys.executable, "-c", code], cwd=root, stderr=devnull)
+    return eval(output.splitlines()[-1])
+
+
+# modules that take long to import, none of which should load until one of their names is used
+heavyModules = ["pymclevel.materials", "pymclevel.infiniteworld", "pymclevel.leveldbpocket", "pymclevel.items"]
+
+
+class TestLazyImports(unittest.TestCase):
+    def testNBTOnly(self):
+        # pymclevel.nbt imports the compiled _nbt in its place when it is built
+        loaded = modulesLoadedBy("import pymclevel.nbt")
+        assert "pymclevel.nbt" in loaded
+        assert set(loaded) <= set(["pymclevel", "pymclevel.nbt", "pymclevel._nbt"])
+
+        loaded = modulesLoadedBy("from pymclevel import BoundingBox")
+        assert "pymclevel.box" in loaded
+        assert not set(loaded) & set(heavyModules)
+
+    def testLazyNames(self):
+        from pymclevel.infiniteworld import MCInfdevOldLevel
+        from pymclevel.faces import FaceXIncreasing
+
+        assert pymclevel.MCInfdevOldLevel is MCInfdevOldLevel
+        assert pymclevel.FaceXIncreasing == FaceXIncreasing
+        assert pymclevel.items is sys.modules["pymclevel.items"]
+        assert pymclevel.scan is sys.modules["pymclevel.scan"]
+        assert "fromFile" in dir(pymclevel)
+        assert not hasattr(pymclevel, "noSuchModule")
+
+    def testImportStar(self):
+        namespace = {}
+        exec "from pymclevel import *" in namespace
+        for name in pymclevel.__all__:
+            assert namespace[name] is getattr(pymclevel, name)
@@ -0,0 +1,135 @@
+import bisect
+import itertools
+import struct
+import unittest
+import numpy
+from templevel import TempLevel
+from pymclevel import leveldbpocket
+from pymclevel.box import BoundingBox
+from pymclevel.materials import pocketMaterials
+
+__author__ = 'Rio'
+
+
+@unittest.skipUnless(leveldbpocket.leveldb_available, "leveldb_mcpe is not available")
+class TestPocketLeveldb(unittest.TestCase):
+    def setUp(self):
+        self.level = TempLevel("PocketLeveldbWorld")
+
+    def testChunkReads(self):
+        level = self.level.level
+        allChunks = level.allChunks
+        assert len(allChunks)
+
+        scanned = dict(((cx, cz), data) for cx, cz, data in level.worldFile.iterChunkData())
+        assert sorted(scanned) == sorted(allChunks)
+        for cx, cz in allChunks:
+            assert level.worldFile._readChunk(cx, cz) == scanned[cx, cz]
+
+        cx, cz = allChunks[0]
+        box = BoundingBox((cx << 4, 0, cz << 4), (32, level.Height, 32))
+        inBox = [c.chunkPosition for c in level.getChunksInBox(box)]
+        assert sorted(inBox) == sorted(p for p in allChunks if p in set(box.chunkPositions))
+
+        # chunks that are already loaded are returned as they are
+        chunk = level.getChunk(cx, cz)
+        assert any(c is chunk for c in level.getChunks())
+
+
+class TestPocketChunkScan(unittest.TestCase):
+    class Iterator(object):
+        def __init__(self, records, valuesRead):
+            self.keys = sorted(records)
+            self.records = records
+            self.valuesRead = valuesRead
+            self.i = 0
+
+        def Seek(self, key):
+            self.i = bisect.bisect_left(self.keys, key)
+
+        def SeekToFirst(self):
+            self.i = 0
+
+        def Valid(self):
+            return self.i < len(self.keys)
+
+        def Next(self):
+            self.i += 1
+
+        def key(self):
+            return self.keys[self.i]
+
+        def value(self):
+            self.valuesRead.append(self.keys[self.i][:8])
+            return self.records[self.keys[self.i]]
+
+        def status(self):
+            pass
+
+    def testBoxSkipsValues(self):
+        records = {}
+        for cx, cz in itertools.product(range(-2, 2), range(-3, 3)):
+            for tag in "012":
+                records[struct.pack('<ii', cx, cz) + tag] = "t" * 83200 if tag == "0" else tag
+
+        valuesRead = []
+        world = object.__new__(leveldbpocket.PocketLeveldbDatabase)
+        world.readOptions = None
+        world._world_db = type("DB", (object,), {"NewIterator": lambda db, rop: self.Iterator(records, valuesRead)})()
+
+        box = BoundingBox((-16, 0, -16), (32, 128, 32))
+        scanned = [(cx, cz) for cx, cz, data in world.iterChunkData(box)]
+        assert sorted(scanned) == sorted(box.chunkPositions)
+        assert sorted(set(valuesRead)) == sorted(struct.pack('<ii', cx, cz) for cx, cz in box.chunkPositions)
+        assert len(list(world.iterChunkData())) == 24
+
+
+class TestPocketDirtyColumns(unittest.TestCase):
+    class World(object):
+        Height = 128
+        dimNo = 0
+        materials = pocketMaterials
+
+    def testPartialRelight(self):
+        chunk = leveldbpocket.PocketLeveldbChunk(0, 0, self.World(), create=True)
+        chunk.Blocks[:, :, :60] = chunk.materials.Stone.ID
+        chunk.chunkChanged()
+        chunk.savedData()
+        assert (chunk.DirtyColumns == 255).all()
+        chunk.DirtyColumns[:] = 0
+
+        chunk.Blocks[3:6, 2:5, 50:70] = chunk.materials.Air.ID
+        chunk.markDirtyBlocks((slice(3, 6), slice(2, 5), slice(50, 70)))
+        chunk.Blocks[9, 9, 90] = chunk.materials.Glass.ID
+        chunk.markDirtyBlocks((9, 9, 90))
+        chunk.chunkChanged()
+        skyLight = numpy.array(chunk.SkyLight)
+
+        segments = chunk._dirtySegments
+        chunk._dirtySegments = None
+        chunk.genFastLights()
+        assert (chunk.SkyLight == skyLight).all()
+
+        chunk._dirtySegments = segments
+        chunk.savedData()
+        assert chunk.DirtyColumns[4, 3] == 0b11000
+        assert chunk.DirtyColumns[9, 9] == 0b100000
+        assert chunk.DirtyColumns.sum() == 9 * 0b11000 + 0b100000
+
+    def testUnpendingMarks(self):
+        chunk = leveldbpocket.PocketLeveldbChunk(0, 0, self.World(), create=True)
+        chunk.Blocks[:, :, :60] = chunk.materials.Stone.ID
+        chunk.chunkChanged()
+        chunk.savedData()
+        chunk.DirtyColumns[:] = 0
+
+        # marked by a per-block setter, which doesn't call chunkChanged
+        chunk.Blocks[1, 1, 5] = chunk.materials.Air.ID
+        chunk.markDirtyBlocks((1, 1, 5), pending=False)
+        # changed without saying where
+        chunk.Blocks[10, 10, 40:60] = chunk.materials.Air.ID
+        chunk.chunkChanged()
+
+        assert chunk.SkyLight[10, 10, 50] == 15
+        chunk.savedData()
+        assert chunk.DirtyColumns[10, 10] != 0
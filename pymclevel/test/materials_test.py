@@ -0,0 +1,91 @@
+import os
+import shutil
+import unittest
+import numpy
+
+from pymclevel import materials
+from pymclevel.materials import MCMaterials
+from templevel import mktemp
+
+__author__ = 'Rio'
+
+
+class TestMaterialsCache(unittest.TestCase):
+    def setUp(self):
+        self.cacheDir = mktemp("MaterialsCache")
+
+    def tearDown(self):
+        shutil.rmtree(self.cacheDir, ignore_errors=True)
+
+    def load(self, filename):
+        mats = MCMaterials(defaultName="Not present in Classic")
+        mats.cacheDir = self.cacheDir
+        mats.addYamlBlocksFromFile(filename)
+        return mats
+
+    def testCachedTables(self):
+        parsed = self.load("classic.yaml")
+        cached = self.load("classic.yaml")
+        assert cached._yamlCache is not None
+
+        for name in MCMaterials.cacheArrays:
+            assert (getattr(parsed, name) == getattr(cached, name)).all()
+        for name in MCMaterials.cacheLists + MCMaterials.cacheRows:
+            assert getattr(parsed, name) == getattr(cached, name)
+
+        key = lambda b: (b.ID, b.blockData, b.stringID, b.name, b.type)
+        assert map(key, parsed.allBlocks) == map(key, cached.allBlocks)
+        assert cached[0] is cached.Air
+        assert cached.blockWithID(1).name == parsed.blockWithID(1).name
+        assert cached.color is cached.flatColors
+
+        # the parsed yaml is only read when asked for
+        assert cached._yamlCache is not None
+        assert cached.blockWithID(1).yaml == parsed.blockWithID(1).yaml
+        assert cached._yamlCache is None
+        assert cached.yamlDatas == parsed.yamlDatas
+
+    def testNoCache(self):
+        mats = MCMaterials()
+        mats.cacheDir = None
+        mats.addYamlBlocksFromFile("indev.yaml")
+        assert len(mats.yamlDatas) == 1
+        assert mats._yamlCache is None
+
+
+class TestConversionCache(unittest.TestCase):
+    def setUp(self):
+        self.cacheDir = MCMaterials.cacheDir
+        self.allMaterials = materials.allMaterials
+        MCMaterials.cacheDir = mktemp("ConversionCache")
+        # guessing the tables between the larger materials takes a while
+        materials.allMaterials = (materials.classicMaterials, materials.indevMaterials)
+        materials._conversionTables.clear()
+
+    def tearDown(self):
+        shutil.rmtree(MCMaterials.cacheDir, ignore_errors=True)
+        MCMaterials.cacheDir = self.cacheDir
+        materials.allMaterials = self.allMaterials
+        materials._conversionTables.clear()
+
+    def testCachedTables(self):
+        classic, indev = materials.classicMaterials, materials.indevMaterials
+        guessed = materials.conversionTable(indev, classic)
+        assert len(materials._conversionTables) == 2
+        assert os.path.exists(materials._conversionCachePath())
+
+        materials._conversionTables.clear()
+        guessFilterTable = materials.guessFilterTable
+        materials.guessFilterTable = None  # the cached tables must not need the name search
+        try:
+            assert (materials.conversionTable(indev, classic) == guessed).all()
+            assert materials.conversionTable(classic, indev).shape == (materials.id_limit, 16, 2)
+        finally:
+            materials.guessFilterTable = guessFilterTable
+
+        blocks, data = materials.convertBlocks(classic, classic, guessed, None)
+        assert blocks is guessed
+
+        # IDs above 255 convert to themselves unless the table says otherwise
+        blocks, data = materials.convertBlocks(indev, classic, numpy.array([1, 300]), numpy.array([0, 2]))
+        assert blocks[1] == 300 and data[1] == 2
@@ -150,6 +150,31 @@ class TestNBT():
         tag.append(nbt.TAG_Int(258))
         del tag[0]
 
+    def testListVersion(self):
+        tag = nbt.TAG_List([nbt.TAG_Int(1)])
+        versions = [tag.version]
+        for change in (lambda: tag.append(nbt.TAG_Int(2)), lambda: tag.__setitem__(0, nbt.TAG_Int(3)),
+                       lambda: tag.__delitem__(1), lambda: setattr(tag, "value", [])):
+            change()
+            assert tag.version > versions[-1]
+            versions.append(tag.version)
+
+        data = self.testCreate().save(compressed=False)
+        entities = nbt.load(buf=data, lazy=True)["Entities"]
+        version = entities.version
+        entities.append(nbt.TAG_Compound())
+        assert entities.version > version
+
+    def testNameCacheBounded(self):
+        longName = u"player-" + u"\xe9" * 40
+        tag = nbt.TAG_Compound([nbt.TAG_Int(i, u"key%d" % i) for i in range(nbt._NAME_CACHE_MAX_SIZE + 10)])
+        tag[longName] = nbt.TAG_Byte(1)
+        loaded = nbt.load(buf=tag.save())
+        assert len(loaded) == len(tag)
+        assert loaded[u"key5"].value == 5 and loaded[longName].value == 1
+        assert len(nbt._name_cache) <= nbt._NAME_CACHE_MAX_SIZE
+        assert longName.encode('utf-8') not in nbt._name_cache
+
     def testErrors(self):
         """
         attempt to name elements of a TAG_List
@@ -186,3 +211,87 @@ class TestNBT():
         duration = time.time() - startTime
 
         assert duration < 1.0  # Will fail when not using _nbt.pyx
+
+    def testRoundTrip(self):
+        level = self.testCreate()
+        data = level.save(compressed=False)
+        newlevel = nbt.load(buf=data)
+
+        assert newlevel.save(compressed=False) == data
+        assert newlevel["Map"]["Blocks"].value.reshape((128, 128, 128))[0, 5, 5] == 5
+
+        # loaded arrays must stay writable
+        newlevel["Map"]["Blocks"].value[0] = 41
+        assert newlevel["Map"]["Data"].value[0] == 0
+
+    def testLittleEndianRoundTrip(self):
+        level = self.testCreate()
+        with nbt.littleEndianNBT():
+            data = level.save(compressed=False)
+            newlevel = nbt.load(buf=data)
+            assert newlevel.save(compressed=False) == data
+        assert newlevel["Environment"]["FogColor"].value == 0xcccccc
+
+    def testLazyLoad(self):
+        level = self.testCreate()
+        level["Entities"] = nbt.TAG_List([nbt.TAG_Compound([nbt.TAG_Int(i, "x")]) for i in range(10)])
+        data = level.save(compressed=False)
+
+        lazylevel = nbt.load(buf=data, lazy=True)
+        assert not lazylevel["Map"].isLoaded
+        assert lazylevel.save(compressed=False) == data
+        assert not lazylevel["Map"].isLoaded
+
+        lazylevel["Entities"][3]["x"].value = 42
+        assert lazylevel["Entities"].isLoaded
+        assert not lazylevel["Environment"].isLoaded
+        newlevel = nbt.load(buf=lazylevel.save(compressed=False))
+        assert newlevel["Entities"][3]["x"].value == 42
+        assert newlevel["Environment"]["FogColor"].value == 0xcccccc
+
+        # untouched subtrees saved with the other byte order must be decoded, not copied
+        with nbt.littleEndianNBT():
+            lazylevel = nbt.load(buf=level.save(compressed=False), lazy=True)
+        assert lazylevel.save(compressed=False) == data
+
+    def testIterEvents(self):
+        data = self.testCreate().save()
+
+        skipped = lambda path, tagID: path == (u"Map",)
+        events = list(nbt.iter_events(buf=data, skip=skipped))
+
+        assert events[0] == ("start", (), nbt.TAG_COMPOUND, None)
+        assert events[-1] == ("end", (), nbt.TAG_COMPOUND, None)
+        assert ("value", (u"Environment", u"FogColor"), nbt.TAG_INT, 0xcccccc) in events
+        assert not any(path[:1] == (u"Map",) for event, path, tagID, value in events)
+
+    def testRootCompounds(self):
+        entities = []
+        for i in range(20):
+            ent = nbt.TAG_Compound()
+            ent["id"] = nbt.TAG_String(u"Zombie")
+            ent["Pos"] = nbt.TAG_List([nbt.TAG_Double(i), nbt.TAG_Double(64.0), nbt.TAG_Double(-i)])
+            ent["Health"] = nbt.TAG_Short(20)
+            entities.append(ent)
+
+        with nbt.littleEndianNBT():
+            data = nbt.save_root_compounds(entities)
+            assert data == "".join(ent.save(compressed=False) for ent in entities)
+            loaded = nbt.load_root_compounds(data)
+            assert [ent.save(compressed=False) for ent in loaded] == [ent.save(compressed=False) for ent in entities]
+
+            data = nbt.save_root_compounds(entities, lambda ent: {"id": nbt.TAG_Int(32)})
+            loaded = nbt.load_root_compounds(data)
+        assert loaded[5]["id"].value == 32 and loaded[5].keys() == entities[5].keys()
+        assert entities[5]["id"].value == u"Zombie"
+        assert loaded[5]["Pos"][2].value == -5
+
+        assert nbt.load_root_compounds("") == []
+        with nbt.littleEndianNBT():
+            data = nbt.save_root_compounds(entities[:2])
+            try:
+                nbt.load_root_compounds(data + "\x01\x00")
+            except nbt.NBTFormatError:
+                pass
+            else:
+                assert False, "Expected NBTFormatError for trailing data"
@@ -0,0 +1,53 @@
+import shutil
+import unittest
+
+from pymclevel.infiniteworld import MCInfdevOldLevel
+from pymclevel.scan import countBlocks, regionChunkGroups, scanChunks
+from templevel import mktemp
+
+__author__ = 'Rio'
+
+
+def chunkPositionList(chunk):
+    return [chunk.chunkPosition]
+
+
+class TestScanChunks(unittest.TestCase):
+    def setUp(self):
+        self.temppath = mktemp("ScanChunks")
+        self.level = MCInfdevOldLevel(filename=self.temppath, create=True)
+        # chunks in three region files
+        self.positions = [(0, 0), (1, 0), (31, 31), (32, 0), (-1, -40)]
+        self.level.createChunks(self.positions)
+        for i, cPos in enumerate(self.positions):
+            chunk = self.level.getChunk(*cPos)
+            chunk.Blocks[:, :, 0:i + 1] = 1
+            chunk.Data[:, :, 0] = 3
+            chunk.chunkChanged()
+        self.level.saveInPlace()
+
+    def tearDown(self):
+        self.level.close()
+        shutil.rmtree(self.temppath)
+
+    def testRegionGroups(self):
+        groups = regionChunkGroups(self.positions)
+        assert groups == [[(-1, -40)], [(0, 0), (1, 0), (31, 31)], [(32, 0)]]
+
+    def testParallelScan(self):
+        progress = []
+        counts = scanChunks(self.level, countBlocks, jobs=2, progress=lambda done, total: progress.append(done))
+        assert counts[3 << 12 | 1] == 5 * 256
+        assert counts[1] == (1 + 2 + 3 + 4 + 5 - 5) * 256
+        assert progress[-1] == 5
+
+        positions = scanChunks(self.level, chunkPositionList, jobs=3)
+        assert sorted(positions) == sorted(self.positions)
+
+    def testUnsavedChangesScannedHere(self):
+        self.level.getChunk(0, 0).Blocks[:] = 4
+        self.level.getChunk(0, 0).chunkChanged()
+        assert self.level.hasUnsavedChanges
+
+        counts = scanChunks(self.level, countBlocks, jobs=2)
+        assert counts[4] + counts[3 << 12 | 4] == 16 * 16 * 256
@@ -5,6 +5,7 @@ from pymclevel import mclevel
 from templevel import TempLevel, mktemp
 from pymclevel.schematic import MCSchematic
 from pymclevel.box import BoundingBox
+from pymclevel.entity import Entity, TileEntity
 
 __author__ = 'Rio'
 
@@ -78,3 +79,20 @@ class TestSchematics(unittest.TestCase):
         assert len(invFile.Entities) == 0
         assert len(invFile.TileEntities) == 1
         # raise SystemExit
+
+
+class TestSchematicEntities(unittest.TestCase):
+    def testFlipMovesEntities(self):
+        schematic = MCSchematic(shape=(16, 8, 10))
+        pig = Entity.Create("Pig")
+        Entity.setpos(pig, (1.5, 2, 1.5))
+        schematic.addEntity(pig)
+        schematic.addTileEntity(TileEntity.Create("Chest", (1, 2, 1)))
+        assert schematic.getEntitiesInBox(BoundingBox((1, 2, 1), (1, 1, 1))) == [pig]
+        assert schematic.tileEntityAt(1, 2, 1) is not None
+
+        schematic.flipEastWest()
+        assert schematic.getEntitiesInBox(BoundingBox((1, 2, 1), (1, 1, 1))) == []
+        assert schematic.getEntitiesInBox(BoundingBox((1, 2, 8), (1, 1, 1))) == [pig]
+        assert schematic.tileEntityAt(1, 2, 1) is None
+        assert schematic.tileEntityAt(1, 2, 8) is not None
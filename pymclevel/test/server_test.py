@@ -1,5 +1,12 @@
+import hashlib
+import itertools
+import os
+import shutil
+import sys
+import tempfile
 import unittest
-from pymclevel.minecraft_server import MCServerChunkGenerator
+from pymclevel.minecraft_server import MCServerChunkGenerator, ServerJarStorage, planGenerationCentres, readProperties
+from pymclevel.infiniteworld import MCInfdevOldLevel
 from templevel import TempLevel
 from pymclevel.box import BoundingBox
 
@@ -31,3 +38,95 @@ class TestServerGen(unittest.TestCase):
                                   [(120, 50), (121, 50), (122, 50), (123, 50), (244, 244), (244, 245), (244, 246)])
         c = level.getChunk(50, 50)
         assert c.Blocks.any()
+
+
+class StandInServerGenerator(MCServerChunkGenerator):
+    """ Runs standin_server.py instead of java. """
+    javaExe = sys.executable
+    processes = []
+    tempWorldCache = {}
+    minRadius = 3
+    maxServers = 2
+
+    @classmethod
+    def _serverCommand(cls, jarfile):
+        return [sys.executable, jarfile, str(cls.minRadius)]
+
+
+class TestParallelServerGen(unittest.TestCase):
+    def setUp(self):
+        self.cacheDir = tempfile.mkdtemp("mclevel_servergen")
+        StandInServerGenerator.worldCacheDir = self.cacheDir
+        StandInServerGenerator.processes = []
+        StandInServerGenerator.tempWorldCache = {}
+
+        self.gen = StandInServerGenerator(version="Stand-in",
+                                          jarfile=os.path.join(os.path.dirname(__file__), "standin_server.py"),
+                                          jarStorage=ServerJarStorage(os.path.join(self.cacheDir, "jars")))
+
+    def tearDown(self):
+        for tempWorld in StandInServerGenerator.tempWorldCache.values():
+            tempWorld.close()
+        shutil.rmtree(self.cacheDir)
+
+    def testPlan(self):
+        chunks = list(itertools.product(range(0, 12), range(-3, 2))) + [(40, 40)]
+        plan = planGenerationCentres(chunks, 2)
+
+        assert len(plan) == 4
+        assert sorted(c for center, covered in plan for c in covered) == sorted(chunks)
+        for (centercx, centercz), covered in plan:
+            for cx, cz in covered:
+                assert abs(cx - centercx) <= 2 and abs(cz - centercz) <= 2
+
+    def testServerChecksum(self):
+        jarfile = os.path.join(os.path.dirname(__file__), "standin_server.py")
+        with open(jarfile, "rb") as f:
+            checksum = hashlib.md5(f.read()).hexdigest()
+
+        # computed once per generator
+        gen = self.gen
+        assert gen.serverChecksum() == checksum
+        gen.serverJarFile = os.path.join(self.cacheDir, "missing.jar")
+        assert gen.serverChecksum() == checksum
+
+        # jars from storage use the storage's checksum
+        storage = self.gen.jarStorage
+        os.mkdir(os.path.join(storage.cacheDir, "Stand-in"))
+        shutil.copy(jarfile, storage.jarfileForVersion("Stand-in"))
+        storage.reloadVersions()
+        versions = []
+        checksumForVersion = storage.checksumForVersion
+
+        def countingChecksum(v):
+            versions.append(v)
+            return checksumForVersion(v)
+
+        storage.checksumForVersion = countingChecksum
+        gen = StandInServerGenerator(version="Stand-in", jarStorage=storage)
+        assert gen.serverJarFile == storage.jarfileForVersion("Stand-in")
+        assert gen.serverChecksum() == gen.serverChecksum() == checksum
+        assert versions == ["Stand-in"]
+
+    def testGenerateChunks(self):
+        def _create(filename):
+            MCInfdevOldLevel(filename, create=True, random_seed=1234).close()
+
+        self.templevel = TempLevel("StandInServerGen", createFunc=_create)
+        level = self.templevel.level
+        level.createChunk(2, 2)
+        chunks = list(itertools.product(range(0, 8), range(0, 3))) + [(30, -30), (31, -30)]
+
+        gen = self.gen
+        gen.generateChunksInLevel(level, chunks)
+
+        assert set(chunks) <= set(level.allChunks)
+        assert len(gen.processes) == len(planGenerationCentres(set(chunks) - {(2, 2)}, gen.minRadius - 1))
+        assert not level.getChunk(2, 2).Blocks.any()
+        assert (level.getChunk(30, -30).Blocks[:, :, 0] == level.materials.Bedrock.ID).all()
+
+        tempWorlds = StandInServerGenerator.tempWorldCache.values()
+        assert len(tempWorlds) == gen.maxServers
+        ports = [readProperties(os.path.join(os.path.dirname(os.path.dirname(w.filename)), "server.properties"))
+                 ["server-port"] for w in tempWorlds]
+        assert len(set(ports)) == len(ports)
@@ -0,0 +1,62 @@
+"""
+A stand-in for minecraft_server.jar that server_test.py runs in place of java, so MCServerChunkGenerator can be
+tested without a real server.
+
+Like the real server it reads server.properties from the folder it is started in, listens on server-port, creates
+the chunks within RADIUS chunks of the world's spawn point, prints "Done" and exits when "stop" is written to its
+stdin. The chunks are created empty, apart from a layer of bedrock at y=0.
+
+    python standin_server.py RADIUS
+"""
+import os
+import socket
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from pymclevel import infiniteworld
+from pymclevel.minecraft_server import readProperties
+
+__author__ = 'Rio'
+
+
+def main(radius):
+    properties = readProperties("server.properties")
+
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        listener.bind(("", int(properties["server-port"])))
+        listener.listen(1)
+    except socket.error:
+        print "[Server thread/WARN]: **** FAILED TO BIND TO PORT!"
+        return 1
+
+    level = infiniteworld.MCInfdevOldLevel(properties.get("level-name", "world"))
+    x, y, z = level.playerSpawnPosition()
+    spawncx, spawncz = x >> 4, z >> 4
+    print "[Server thread/INFO]: Preparing start region for level 0"
+
+    for cx in range(spawncx - radius, spawncx + radius + 1):
+        for cz in range(spawncz - radius, spawncz + radius + 1):
+            if not level.containsChunk(cx, cz):
+                level.createChunk(cx, cz)
+                chunk = level.getChunk(cx, cz)
+                chunk.Blocks[:, :, 0] = level.materials.Bedrock.ID
+                chunk.chunkChanged(False)
+
+    level.saveInPlace()
+    level.close()
+
+    print "[Server thread/INFO]: Done (0.1s)! For help, type \"help\" or \"?\""
+    sys.stdout.flush()
+
+    for line in iter(sys.stdin.readline, ""):
+        if line.strip() == "stop":
+            break
+
+    listener.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1])))
@@ -0,0 +1,627 @@
+import os
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import unittest
+
+import numpy
+
+from pymclevel import nbt
+from pymclevel import tall_worlds
+from pymclevel.block_copy import copyCubesFromIter
+from pymclevel.box import BoundingBox
+from pymclevel.entity import Entity, TileEntity
+from pymclevel.schematic import MCSchematic
+
+__author__ = 'Rio'
+
+
+class FakeMapServer(object):
+    """ Holds the map server's end of a socket pair and reads whatever the client sends to it on a thread. """
+
+    def __init__(self):
+        clientSocket, self.socket = socket.socketpair()
+        self.client = tall_worlds._Client.__new__(tall_worlds._Client)
+        self.client._socket = clientSocket
+        self.received = []
+        self.thread = threading.Thread(target=self._read)
+        # don't keep the test run alive if a test fails before reading the packets
+        self.thread.daemon = True
+        self.thread.start()
+
+    def _read(self):
+        while True:
+            data = self.socket.recv(65536)
+            if not data:
+                break
+            self.received.append(data)
+
+    def packets(self):
+        """ Closes the connection and returns the packets received, as (packetID, position, payload) tuples. """
+        self.client._socket.close()
+        self.thread.join()
+        data = ''.join(self.received)
+
+        packets = []
+        offset = 0
+        while offset < len(data):
+            packetID, = struct.unpack_from('!b', data, offset)
+            offset += 1
+            if packetID in (0x3, 0x6):
+                x, y, z, size = struct.unpack_from('!iiii', data, offset)
+                offset += 16
+                packets.append((packetID, (x, y, z), data[offset:offset + size]))
+                offset += size
+            elif packetID == 0x23:
+                x, z, size = struct.unpack_from('!iii', data, offset)
+                offset += 12
+                packets.append((packetID, (x, z), data[offset:offset + size]))
+                offset += size
+            else:
+                packets.append((packetID, None, None))
+        return packets
+
+
+class CountingSocket(object):
+    """ Wraps a socket, counting the bytes passed to sendall. """
+
+    def __init__(self, socket):
+        self.socket = socket
+        self.sent = 0
+
+    def sendall(self, data):
+        self.socket.sendall(data)
+        self.sent += len(data)
+
+    def __getattr__(self, name):
+        return getattr(self.socket, name)
+
+
+def applyDelta(cube, data):
+    """ Applies the changes in data, from TWCube.saveDeltaData, to the arrays of cube. """
+    flags, runCount = struct.unpack_from('!BH', data)
+    runs = numpy.frombuffer(data, '>u2', runCount * 2, 3).reshape(runCount, 2)
+    mask = numpy.zeros(4096, bool)
+    for start, length in runs:
+        mask[start:start + length] = True
+
+    offset = 3 + runCount * 4
+    for bit, name in tall_worlds.TWCube.deltaArrays:
+        if flags & bit:
+            values = numpy.frombuffer(data, 'uint8', mask.sum(), offset)
+            array = getattr(cube, name)
+            saved = array.swapaxes(0, 2).ravel()
+            saved[mask] = values
+            array[:] = saved.reshape(16, 16, 16).swapaxes(0, 2)
+            offset += len(values)
+    assert offset == len(data)
+
+
+def createTallWorld():
+    folder = tempfile.mkdtemp("tallworld")
+    root_tag = nbt.TAG_Compound()
+    root_tag["Data"] = nbt.TAG_Compound()
+    root_tag.save(os.path.join(folder, "level.dat"))
+    with open(os.path.join(folder, "cubes.dim0.db"), "wb"):
+        pass
+    return folder
+
+
+class FakeVM(object):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class TallWorldTestCase(unittest.TestCase):
+    def setUp(self):
+        self.folder = createTallWorld()
+        self.level = tall_worlds.TWLevel(self.folder, readonly=False)
+        self.server = FakeMapServer()
+        self.level._client = self.server.client
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def addCubes(self, cx, cz, cys, tag=None, entityLists=False):
+        column = tall_worlds.TWColumn(cx, cz, self.level, tag if tag is not None else nbt.TAG_Compound())
+        for cy in cys:
+            cubeTag = nbt.TAG_Compound()
+            if entityLists:
+                for name in tall_worlds.TWCube.entityLists:
+                    cubeTag[name] = nbt.TAG_List()
+            column._loadedChunks[cy] = tall_worlds.TWCube(column, cx, cy, cz, cubeTag)
+        self.level._loadedColumns[cx, cz] = column
+        return column
+
+
+class TestTallWorldSave(TallWorldTestCase):
+    def testStreamedSave(self):
+        self.level.saveJobs = 3
+        self.server.client.saveBufferSize = 4096
+        columns = [self.addCubes(cx, 0, range(-2, 6)) for cx in range(4)]
+        for column in columns:
+            for cube in column._loadedChunks.itervalues():
+                cube.Blocks[:] = cube.cy + 2
+                cube.dirty = cube.cy != 0
+
+        counter = self.server.client._socket = CountingSocket(self.server.client._socket)
+        progress = []
+        for sent, total in self.level.saveInPlaceGen():
+            # only bytes that reached the socket are reported
+            assert sent <= counter.sent
+            progress.append((sent, total))
+        packets = self.server.packets()
+
+        saved = [p for p in packets if p[0] == 0x3]
+        assert [p[0] for p in packets] == [0x3] * len(saved) + [0x5]
+        assert len(saved) == 4 * 7
+        for packetID, (cx, cy, cz), data in saved:
+            assert cy != 0
+            cube = tall_worlds.TWCube(columns[cx], cx, cy, cz, nbt.load(buf=data))
+            assert (cube.Blocks == cy + 2).all()
+
+        assert not any(cube.dirty for column in columns for cube in column._loadedChunks.itervalues())
+        sent = sum(17 + len(data) for packetID, position, data in saved)
+        assert progress[-1] == (sent, sent)
+        assert numpy.diff([p[0] for p in progress[:-1]]).min() > 0
+
+    def testHighBlockIDs(self):
+        level = self.level
+        level.deltaSaves = True
+        column = self.addCubes(0, 0, [0, 1])
+        level._allCubes = set([(0, 0, 0), (0, 1, 0)])
+        cubes = column._loadedChunks
+        cubes[0].Blocks[:] = 1
+        cubes[0].Blocks[1, 2, 3] = 0x123
+        cubes[0].chunkChanged()
+        level.setBlockAt(4, 20, 4, 0x234)
+
+        list(level.saveInPlaceGen())
+        packets = dict((position, (packetID, data)) for packetID, position, data in self.server.packets() if data)
+        assert packets[0, 1, 0][0] == 0x3
+        for cy in (0, 1):
+            tag = nbt.load(buf=packets[0, cy, 0][1])
+            assert len(tag["Blocks"].value) == 4096
+            saved = tall_worlds.TWCube(column, 0, cy, 0, tag)
+            assert (saved.Blocks == cubes[cy].Blocks).all()
+
+        # an ID that fits in a byte again drops the Add array
+        cubes[0].Blocks[1, 2, 3] = 1
+        cubes[0].chunkChanged()
+        cubes[0].saveTagData()
+        assert "Add" not in cubes[0].root_tag
+
+    def testSavingFlagReset(self):
+        self.addCubes(0, 0, [0])._loadedChunks[0].dirty = True
+
+        def failingSave(packets):
+            raise socket.error("map server went away")
+            yield
+
+        self.level._client.requestSaveChunks = failingSave
+        self.assertRaises(socket.error, list, self.level.saveInPlaceGen())
+        assert not self.level.saving
+        self.server.packets()
+
+    def testNothingToSave(self):
+        self.addCubes(0, 0, [0])
+        assert list(self.level.saveInPlaceGen()) == []
+        assert self.server.packets() == []
+
+    def testDeltaSave(self):
+        level = self.level
+        level.deltaSaves = True
+        column = self.addCubes(0, 0, range(4))
+        level._allCubes = set((0, cy, 0) for cy in range(4))
+        cubes = column._loadedChunks
+
+        # single blocks set through the level
+        level.setBlockAt(1, 2, 3, 20)
+        level.setBlockAt(2, 2, 3, 20)
+        level.setBlockDataAt(9, 9, 9, 5)
+        # a box filled and marked, as block_fill does
+        cubes[1].Blocks[4:8, 0:2, 10:12] = 7
+        cubes[1].markDirtyBlocks((slice(4, 8), slice(0, 2), slice(10, 12)))
+        cubes[1].chunkChanged()
+        # changed without saying where, so the whole cube is sent
+        cubes[2].Blocks[0, 0, 0] = 1
+        cubes[2].chunkChanged()
+        # changed too much for a delta
+        cubes[3].Blocks[:8] = 3
+        cubes[3].markDirtyBlocks((slice(0, 8), slice(None), slice(None)))
+        cubes[3].chunkChanged()
+
+        list(level.saveInPlaceGen())
+        packets = dict((position, (packetID, data)) for packetID, position, data in self.server.packets() if data)
+
+        assert [packets[0, cy, 0][0] for cy in range(4)] == [0x6, 0x6, 0x3, 0x3]
+        flags, runCount = struct.unpack_from('!BH', packets[0, 0, 0][1])
+        assert flags == tall_worlds.TWCube.dirtyBlocks | tall_worlds.TWCube.dirtyData
+        assert runCount == 2
+
+        for cy in (0, 1):
+            saved = tall_worlds.TWCube(column, 0, cy, 0, nbt.TAG_Compound())
+            applyDelta(saved, packets[0, cy, 0][1])
+            for name in ("Blocks", "Data", "SkyLight", "BlockLight"):
+                assert (getattr(saved, name) == getattr(cubes[cy], name)).all()
+
+        # once saved, only later changes are sent
+        level.setSkylightAt(0, 0, 0, 15)
+        self.server = FakeMapServer()
+        level._client = self.server.client
+        list(level.saveInPlaceGen())
+        packetID, position, data = self.server.packets()[0]
+        assert (packetID, position) == (0x6, (0, 0, 0))
+        assert struct.unpack_from('!BHHH', data) == (tall_worlds.TWCube.dirtySkyLight, 1, 0, 1)
+
+    def testColumnSummary(self):
+        level = self.level
+        stone = level.materials.Stone.ID
+        tag = nbt.TAG_Compound()
+        tag["Level"] = nbt.TAG_Compound()
+        tag["Level"]["Biomes"] = nbt.TAG_Byte_Array(numpy.zeros(256, 'uint8') + 4)
+        column = self.addCubes(0, 0, range(-1, 4), tag)
+        emptyColumn = self.addCubes(1, 0, [])
+        level._allCubes = set((0, cy, 0) for cy in range(-1, 4))
+        cubes = column._loadedChunks
+        cubes[-1].Blocks[:] = stone
+        cubes[1].Blocks[2, 3, 0:5] = stone
+
+        summary = level.columnSummary(0, 0)
+        assert (summary.topCube, summary.bottomCube) == (1, -1)
+        assert level.heightMapAt(2, 3) == 21
+        assert level.heightMapAt(0, 0) == 0
+        assert level.biomeAt(7, 7) == 4
+        assert level.columnSummary(1, 0).topCube is None
+        assert (emptyColumn.HeightMap == 0).all()
+
+        list(level.saveInPlaceGen())
+        packets = self.server.packets()
+        assert sorted(p[:2] for p in packets) == [(0x5, None), (0x23, (0, 0)), (0x23, (1, 0))]
+        saved = dict((position, nbt.load(buf=data)) for packetID, position, data in packets if data)
+        loaded = tall_worlds.TWColumn(0, 0, level, saved[0, 0]).summary
+        assert (loaded.topCube, loaded.bottomCube) == (1, -1)
+        assert (loaded.heightMap == summary.heightMap).all()
+        assert (loaded.biomes == 4).all()
+
+        # saving cubes keeps the summary up to date
+        self.server = FakeMapServer()
+        level._client = self.server.client
+        level.setBlockAt(5, 40, 5, stone)
+        cubes[1].Blocks[:] = 0
+        cubes[1].chunkChanged()
+        cubes[-1].Blocks[:] = 0
+        cubes[-1].chunkChanged()
+
+        list(level.saveInPlaceGen())
+        assert (summary.topCube, summary.bottomCube) == (2, 2)
+        assert level.heightMapAt(5, 5) == 41
+        assert level.heightMapAt(2, 3) == -16
+        assert [p[:2] for p in self.server.packets() if p[0] != 0x3] == [(0x23, (0, 0)), (0x5, None)]
+
+    def testUnpendingMarks(self):
+        level = self.level
+        level.deltaSaves = True
+        column = self.addCubes(0, 0, [0])
+        level._allCubes = set([(0, 0, 0)])
+        cube = column._loadedChunks[0]
+
+        # _scatter marks the blocks it sets without calling chunkChanged
+        level.setBlocksAt(numpy.array([1, 2]), 3, 4, 7)
+        # changed without saying where
+        cube.Blocks[10, 10, 10] = 5
+        cube.chunkChanged()
+
+        list(level.saveInPlaceGen())
+        packetID, position, data = self.server.packets()[0]
+        assert packetID == 0x3
+        saved = tall_worlds.TWCube(column, 0, 0, 0, nbt.load(buf=data))
+        assert saved.Blocks[10, 10, 10] == 5
+        assert (saved.Blocks[1:3, 4, 3] == 7).all()
+
+    def testLightOnlyDelta(self):
+        level = self.level
+        level.deltaSaves = True
+        column = self.addCubes(0, 0, [0, 1])
+        level._allCubes = set([(0, 0, 0), (0, 1, 0)])
+        cubes = column._loadedChunks
+
+        level.setSkylightsAt(numpy.array([1, 2]), 3, 4, 9)
+        level.setBlockArray(BoundingBox((5, 20, 5), (2, 2, 2)), 6, name="BlockLight")
+
+        list(level.saveInPlaceGen())
+        packets = dict((position, (packetID, data)) for packetID, position, data in self.server.packets() if data)
+        assert struct.unpack_from('!B', packets[0, 0, 0][1]) == (tall_worlds.TWCube.dirtySkyLight,)
+        assert struct.unpack_from('!B', packets[0, 1, 0][1]) == (tall_worlds.TWCube.dirtyBlockLight,)
+
+        for cy in (0, 1):
+            packetID, data = packets[0, cy, 0]
+            assert packetID == 0x6
+            saved = tall_worlds.TWCube(column, 0, cy, 0, nbt.TAG_Compound())
+            applyDelta(saved, data)
+            for name in ("Blocks", "Data", "SkyLight", "BlockLight"):
+                assert (getattr(saved, name) == getattr(cubes[cy], name)).all()
+        assert (cubes[0].SkyLight[1:3, 4, 3] == 9).all()
+
+
+class TestTallWorldBlockAccess(TallWorldTestCase):
+    def setUp(self):
+        super(TestTallWorldBlockAccess, self).setUp()
+        self.column = self.addCubes(0, 0, range(4))
+        self.level._allCubes = set((0, cy, 0) for cy in range(4))
+        for cy, cube in self.column._loadedChunks.iteritems():
+            cube.Blocks[:] = cy + 1
+
+        self.lookups = []
+        getChunk_cc = self.level.getChunk_cc
+
+        def countingGetChunk(cx, cy, cz):
+            self.lookups.append((cx, cy, cz))
+            return getChunk_cc(cx, cy, cz)
+
+        self.level.getChunk_cc = countingGetChunk
+
+    def tearDown(self):
+        self.server.packets()
+        super(TestTallWorldBlockAccess, self).tearDown()
+
+    def testMemoHit(self):
+        level = self.level
+        assert level.blockAt(1, 2, 3) == 1
+        assert level.blockAt(4, 5, 6) == 1
+        assert level.blockAt(1, 20, 3) == 2
+        assert level.blockAt(15, 15, 15) == 1
+        level.setBlockAt(2, 21, 2, 9)
+        level.setBlockDataAt(2, 21, 2, 3)
+        assert (level.blockAt(2, 21, 2), level.blockDataAt(2, 21, 2)) == (9, 3)
+        assert self.column._loadedChunks[1].Blocks[2, 2, 5] == 9
+        assert self.lookups == [(0, 0, 0), (0, 1, 0)]
+
+    def testMemoEviction(self):
+        level = self.level
+        level.cubeMemoSize = 2
+        for y in (0, 16, 32, 16, 0):
+            level.blockAt(0, y, 0)
+        # the cube at y=0 was evicted when the one at y=32 was memoised
+        assert self.lookups == [(0, 0, 0), (0, 1, 0), (0, 2, 0), (0, 0, 0)]
+        assert len(level._cubeMemo) == len(level._cubeMemoOrder) == 2
+
+    def testMissingCube(self):
+        level = self.level
+        assert level.blockAt(0, 80, 0) == 0
+        assert level.skylightAt(0, 80, 0) == 15
+        assert level.setBlockAt(0, 80, 0, 1) == 0
+
+        # a cube created afterwards is not seen until the memo is cleared
+        cube = self.column._loadedChunks[5] = tall_worlds.TWCube(self.column, 0, 5, 0, nbt.TAG_Compound())
+        cube.Blocks[:] = 6
+        level._allCubes.add((0, 5, 0))
+        assert level.blockAt(0, 80, 0) == 0
+        level._clearCubeMemo()
+        assert level.blockAt(0, 80, 0) == 6
+        assert self.lookups == [(0, 5, 0)]
+
+    def testClearedOnUnload(self):
+        level = self.level
+        level.blockAt(0, 0, 0)
+        level.unload()
+        assert not level._cubeMemo and level._lastCube is None
+        assert level._loadedColumns == {} and level._allCubes is None
+
+    def testClearedOnClose(self):
+        level = self.level
+        level.blockAt(0, 0, 0)
+        level._vm = FakeVM()
+        level.close()
+        assert level._vm.closed
+        assert not level._cubeMemo and not level._cubeMemoOrder and level._lastCube is None
+
+
+class TestTallWorldCopy(TallWorldTestCase):
+    def setUp(self):
+        super(TestTallWorldCopy, self).setUp()
+        self.stone = self.level.materials.Stone.ID
+        column = self.addCubes(0, 0, [0, 1], entityLists=True)
+        self.level._allCubes = set([(0, 0, 0), (0, 1, 0)])
+        self.cubes = column._loadedChunks
+
+        self.loaded = []
+        getChunk_cc = self.level.getChunk_cc
+
+        def countingGetChunk(cx, cy, cz):
+            self.loaded.append((cx, cy, cz))
+            return getChunk_cc(cx, cy, cz)
+
+        self.level.getChunk_cc = countingGetChunk
+
+    def tearDown(self):
+        self.server.packets()
+        super(TestTallWorldCopy, self).tearDown()
+
+    def testSchematicToTallWorld(self):
+        sch = MCSchematic(shape=(4, 20, 4))
+        sch.Blocks[:] = self.stone
+        pig = Entity.Create("Pig")
+        Entity.setpos(pig, (1.5, 18, 1.5))
+        sch.addEntity(pig)
+        sch.addTileEntity(TileEntity.Create("Chest", (2, 17, 2)))
+
+        list(copyCubesFromIter(self.level, sch, sch.bounds, (4, 4, 4)))
+        assert (self.cubes[0].Blocks[4:8, 4:8, 4:16] == self.stone).all()
+        assert (self.cubes[1].Blocks[4:8, 4:8, 0:8] == self.stone).all()
+        assert not self.cubes[1].Blocks[4:8, 4:8, 8:].any()
+        assert self.cubes[0].dirty and self.cubes[1].dirty
+
+        # entities and tile entities go into the cube that holds them
+        assert len(self.cubes[0].Entities) == len(self.cubes[0].TileEntities) == 0
+        assert [Entity.pos(e) for e in self.cubes[1].Entities] == [[5.5, 22, 5.5]]
+        assert self.cubes[1].tileEntityAt(6, 21, 6)["id"].value == "Chest"
+
+    def testTallWorldToSchematic(self):
+        self.cubes[0].Blocks[:] = self.stone
+        self.cubes[1].Blocks[0:2, 0:2, 0:2] = self.level.materials.Dirt.ID
+        pig = Entity.Create("Pig")
+        Entity.setpos(pig, (8.5, 20, 8.5))
+        self.cubes[1].addEntity(pig)
+        self.cubes[1].addTileEntity(TileEntity.Create("Chest", (1, 17, 1)))
+
+        sch = MCSchematic(shape=(16, 24, 16))
+        list(copyCubesFromIter(sch, self.level, BoundingBox((0, 8, 0), (16, 24, 16)), (0, 0, 0)))
+        assert (sch.Blocks[:, :, 0:8] == self.stone).all()
+        assert (sch.Blocks[0:2, 0:2, 8:10] == self.level.materials.Dirt.ID).all()
+        assert not sch.Blocks[2:, 2:, 8:].any()
+        assert [Entity.pos(e) for e in sch.Entities] == [[8.5, 12, 8.5]]
+        assert sch.tileEntityAt(1, 9, 1)["id"].value == "Chest"
+
+    def testSkipsUnselectedCubes(self):
+        sch = MCSchematic(shape=(4, 20, 4))
+        sch.Blocks[:, :, 0:4] = self.stone
+
+        # nothing the schematic has above y=4 is selected, so the cube at cy=1 is not loaded
+        list(copyCubesFromIter(self.level, sch, sch.bounds, (4, 4, 4), blocksToCopy=[self.stone]))
+        assert self.loaded == [(0, 0, 0)]
+        assert (self.cubes[0].Blocks[4:8, 4:8, 4:8] == self.stone).all()
+        assert not self.cubes[1].dirty
+
+        # the same for a tall world source: the schematic's chunk is only fetched once a cube has dirt in it
+        dirt = self.level.materials.Dirt.ID
+        box = BoundingBox((0, 0, 0), (16, 32, 16))
+        sch = MCSchematic(shape=(16, 32, 16))
+        fetched = []
+        getChunk = sch.getChunk
+
+        def countingGetChunk(cx, cz):
+            fetched.append((cx, cz))
+            return getChunk(cx, cz)
+
+        sch.getChunk = countingGetChunk
+        self.cubes[0].Blocks[:] = self.stone
+        list(copyCubesFromIter(sch, self.level, box, (0, 0, 0), blocksToCopy=[dirt], entities=False))
+        assert fetched == []
+
+        self.cubes[1].Blocks[3, 3, 3] = dirt
+        list(copyCubesFromIter(sch, self.level, box, (0, 0, 0), blocksToCopy=[dirt], entities=False))
+        assert fetched == [(0, 0)]
+        assert sch.Blocks[3, 3, 19] == dirt
+        assert (sch.Blocks != 0).sum() == 1
+
+    def testEntityChangesSavedWhole(self):
+        level = self.level
+        level.deltaSaves = True
+        chest = level.materials.Chest.ID
+
+        def savedPackets():
+            self.server = FakeMapServer()
+            level._client = self.server.client
+            list(level.saveInPlaceGen())
+            return [p[:2] for p in self.server.packets()]
+
+        # a block set together with its tile entity
+        sch = MCSchematic(shape=(1, 1, 1))
+        sch.Blocks[0, 0, 0] = chest
+        sch.addTileEntity(TileEntity.Create("Chest", (0, 0, 0)))
+        list(copyCubesFromIter(level, sch, sch.bounds, (2, 2, 2)))
+        assert savedPackets() == [(0x3, (0, 0, 0)), (0x5, None)]
+        assert self.cubes[0].tileEntityAt(2, 2, 2)["id"].value == "Chest"
+
+        # a block only: the tile entity list is unchanged since the save
+        level.setBlockAt(3, 3, 3, self.stone)
+        self.cubes[0].chunkChanged()
+        assert savedPackets() == [(0x3, (0, 0, 0)), (0x5, None)]
+        level.setBlocksAt(numpy.array([4]), 4, 4, self.stone)
+        assert savedPackets() == [(0x6, (0, 0, 0)), (0x5, None)]
+
+        # tile entities removed along with their blocks
+        list(level.fillBlocksIter(BoundingBox((2, 2, 2), (1, 1, 1)), level.materials.Air))
+        assert self.cubes[0].tileEntityAt(2, 2, 2) is None
+        assert savedPackets() == [(0x3, (0, 0, 0)), (0x5, None)]
+
+        # an entity added on its own
+        pig = Entity.Create("Pig")
+        Entity.setpos(pig, (1.5, 20, 1.5))
+        self.cubes[1].markDirtyBlocks((0, 0, 0), pending=False)
+        self.cubes[1].addEntity(pig)
+        self.cubes[1].dirty = True
+        assert savedPackets() == [(0x3, (0, 1, 0)), (0x5, None)]
+
+    def testCreateIgnored(self):
+        sch = MCSchematic(shape=(4, 4, 4))
+        sch.Blocks[:] = self.stone
+
+        list(copyCubesFromIter(self.level, sch, sch.bounds, (0, 40, 0), create=True))
+        assert self.level._allCubes == set([(0, 0, 0), (0, 1, 0)])
+        assert self.loaded == []
+        assert not any(cube.dirty for cube in self.cubes.itervalues())
+
+
+class TestTallWorldBlocksAt(TallWorldTestCase):
+    def setUp(self):
+        super(TestTallWorldBlocksAt, self).setUp()
+        self.addCubes(0, 0, [-1, 0, 1])
+        self.addCubes(-1, 0, [0])
+        self.level._allCubes = set([(0, -1, 0), (0, 0, 0), (0, 1, 0), (-1, 0, 0)])
+
+    def tearDown(self):
+        self.server.packets()
+        super(TestTallWorldBlocksAt, self).tearDown()
+
+    def cube(self, cx, cy, cz):
+        return self.level._loadedColumns[cx, cz]._loadedChunks[cy]
+
+    def testBlocksAt(self):
+        level = self.level
+        x = numpy.array([1, 2, 3, -4, 4, 5, 1])
+        y = numpy.array([-3, 5, 20, 7, 40, 5, -3])
+        z = numpy.array([1, 2, 3, 4, 4, 20, 1])
+        # (4, 40, 4) and (5, 5, 20) are in cubes that do not exist; (1, -3, 1) is given twice and the last value wins
+        level.setBlocksAt(x, y, z, numpy.array([1, 2, 3, 4, 5, 6, 7]))
+        level.setBlocksDataAt(x, y, z, 9)
+
+        assert self.cube(0, -1, 0).Blocks[1, 1, 13] == 7
+        assert self.cube(0, 0, 0).Blocks[2, 2, 5] == 2
+        assert self.cube(0, 1, 0).Blocks[3, 3, 4] == 3
+        assert self.cube(-1, 0, 0).Blocks[12, 4, 7] == 4
+        assert list(level.blocksAt(x, y, z, fill=99)) == [7, 2, 3, 4, 99, 99, 7]
+        assert list(level.blocksDataAt(x, y, z)) == [9, 9, 9, 9, 0, 0, 9]
+        assert all(c.dirty and c.needsLighting for c in (self.cube(0, -1, 0), self.cube(-1, 0, 0)))
+
+        level.setSkylightsAt(x, y, z, 12)
+        assert list(level.skylightsAt(x, y, z, fill=15)) == [12, 12, 12, 12, 15, 15, 12]
+
+        xs, zs = numpy.mgrid[-16:16, 0:16]
+        level.setBlocksAt(xs, 10, zs, xs + zs + 16)
+        assert (level.blocksAt(xs, 10, zs) == xs + zs + 16).all()
+        assert self.cube(-1, 0, 0).Blocks[0, 5, 10] == 5
+
+    def testBlockArray(self):
+        level = self.level
+        box = BoundingBox((-4, -8, 2), (12, 40, 20))
+        arr = numpy.arange(box.volume).reshape(box.size[0], box.size[2], box.size[1]) % 200 + 1
+        level.setBlockArray(box, arr)
+
+        assert level.blockAt(-4, 0, 2) == arr[0, 0, 8]
+        assert level.blockAt(0, -8, 2) == arr[4, 0, 0]
+        assert level.blockAt(7, 31, 15) == arr[11, 13, 39]
+        assert self.cube(0, -1, 0).dirty and self.cube(0, -1, 0).needsLighting
+
+        # column -1 only has the cube at cy=0, and there are no cubes at cz=1; those parts read as fill
+        result = level.getBlockArray(box, fill=255)
+        assert result.shape == (12, 20, 40)
+        assert (result[4:12, 0:14] == arr[4:12, 0:14]).all()
+        assert (result[0:4, 0:14, 8:24] == arr[0:4, 0:14, 8:24]).all()
+        assert (result[0:4, 0:14, 0:8] == 255).all()
+        assert (result[0:4, 0:14, 24:40] == 255).all()
+        assert (result[:, 14:20] == 255).all()
+
+        mapped = level.getBlockArray(box, fill=255, mmap=True)
+        assert (mapped == result).all()
+        assert not mapped.flags.writeable
+
+        level.setBlockArray(box, 3, "Data")
+        data = level.getBlockArray(BoundingBox((0, -16, 0), (16, 48, 16)), "Data")
+        assert (data[0:8, 2:16, 8:48] == 3).all()
+        assert not data[:, :, 0:8].any() and not data[8:].any()
@@ -0,0 +1,157 @@
+"""
+Benchmarks for how long it takes a fresh interpreter to import pymclevel.
+
+Each target is imported in a new python process, so nothing is shared between runs, and the best wall time of
+several runs is printed along with the number of pymclevel modules the import loaded. With --verbose the slowest
+modules of one extra run are listed too, with the time each took to import including the modules it imported,
+like the cumulative column of python 3's -X importtime.
+
+Results can be written to a JSON baseline with --save and compared against one with --baseline; the script exits
+with status 1 if any import gets slower by more than --threshold, or loads more pymclevel modules than before.
+
+    python pymclevel/test/time_import.py --save import_baseline.json
+    python pymclevel/test/time_import.py --baseline import_baseline.json --threshold 0.2
+
+Run from the repository root so mce.py can be found.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+__author__ = 'Rio'
+
+TARGETS = ["pymclevel", "pymclevel.nbt", "pymclevel.box", "pymclevel.materials", "pymclevel.mclevel", "mce"]
+
+REPEAT = 5
+SLOWEST = 15
+
+# Runs in the child process. Prints a JSON object with the wall time of the import in ms, the pymclevel modules it
+# loaded and, if asked for, the time spent importing each module in ms, including the modules it imported.
+CHILD = r"""
+import imp, sys, time, json
+
+target, profile = sys.argv[1], sys.argv[2] == "1"
+times = {}
+
+
+class TimedLoader(object):
+    def __init__(self, found):
+        self.found = found
+
+    def load_module(self, fullname):
+        f = self.found[0]
+        start = time.time()
+        try:
+            return imp.load_module(fullname, *self.found)
+        finally:
+            times[fullname] = (time.time() - start) * 1000
+            if f:
+                f.close()
+
+
+class TimedFinder(object):
+    def find_module(self, fullname, path=None):
+        try:
+            return TimedLoader(imp.find_module(fullname.rpartition(".")[2], path))
+        except ImportError:
+            return None
+
+if profile:
+    sys.meta_path.append(TimedFinder())
+
+start = time.time()
+__import__(target)
+total = (time.time() - start) * 1000
+
+modules = sorted(m for m in sys.modules if m.startswith("pymclevel") and sys.modules[m] is not None)
+sys.stdout.write("\n" + json.dumps({"total": total, "modules": modules, "times": times}))
+"""
+
+
+def importOnce(target, profile=False):
+    root = os.getcwd()
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([root] + filter(None, [env.get("PYTHONPATH")]))
+    with open(os.devnull, "w") as devnull:
+        output = subprocess.check_output([sys.executable, "-c", CHILD, target, "1" if profile else "0"],
+                                         cwd=root, env=env, stderr=devnull)
+    # modules may print while they are imported, so the results are on the last line
+    return json.loads(output.splitlines()[-1])
+
+
+def bench_target(target, verbose=False):
+    importOnce(target)  # let the .pyc files and the materials cache be written first
+    runs = [importOnce(target) for _ in range(REPEAT)]
+    result = {
+        "ms": min(run["total"] for run in runs),
+        "modules": len(runs[0]["modules"]),
+    }
+    if verbose:
+        times = importOnce(target, profile=True)["times"]
+        result["slowest"] = sorted(times.iteritems(), key=lambda (name, ms): -ms)[:SLOWEST]
+    return result
+
+
+def run(targets, verbose=False):
+    results = {}
+    print "%-24s %10s %18s" % ("", "ms", "pymclevel modules")
+    for target in targets:
+        result = bench_target(target, verbose)
+        print "%-24s %10.1f %18d" % (target, result["ms"], result["modules"])
+        for name, ms in result.pop("slowest", ()):
+            print "    %-36s %10.1f" % (name, ms)
+        results[target] = result
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns a list of descriptions of results that are worse than the baseline by more than threshold.
+    """
+    regressions = []
+    for target, result in sorted(results.iteritems()):
+        base = baseline.get(target)
+        if base is None:
+            continue
+        if result["ms"] > base["ms"] * (1 + threshold):
+            regressions.append("%s: %.1f ms, baseline %.1f ms" % (target, result["ms"], base["ms"]))
+        if result["modules"] > base["modules"]:
+            regressions.append("%s: loads %d pymclevel modules, baseline %d" % (target, result["modules"],
+                                                                              base["modules"]))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark importing pymclevel in a fresh interpreter.")
+    parser.add_argument("targets", nargs="*", help="Modules to import instead of the default set")
+    parser.add_argument("--verbose", "-v", action="store_true", help="List the slowest modules of each import")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed fractional slowdown before a result counts as a regression")
+    args = parser.parse_args(argv)
+
+    results = run(args.targets or TARGETS, args.verbose)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        print
+        if regressions:
+            print "Regressions against %s:" % args.baseline
+            for r in regressions:
+                print "  " + r
+            return 1
+        print "No regressions against %s" % args.baseline
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
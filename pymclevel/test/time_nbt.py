@@ -1,34 +1,322 @@
-from StringIO import StringIO
+"""
+Benchmarks for the NBT reader and writer.
+
+Runs the Cython (_nbt) and pure-python (nbt) backends over a corpus of chunks, level.dat files, schematics and
+little-endian Pocket NBT and prints MB/s for each load and save variant, plus the number of GC-tracked objects
+allocated per tag by a full load.
+
+Results can be written to a JSON baseline with --save and compared against one with --baseline; the script exits
+with status 1 if any throughput drops, or any allocation count rises, by more than --threshold. Each result is the
+best of --passes runs over the whole corpus, so that a pass slowed down by the rest of the machine doesn't show up as
+a regression.
+
+    python pymclevel/test/time_nbt.py --save nbt_baseline.json
+    python pymclevel/test/time_nbt.py --baseline nbt_baseline.json --threshold 0.1 --passes 5
+
+Run from the repository root so the testfiles directory can be found. Missing corpus files are skipped, and a
+synthetic chunk in each byte order is always included.
+"""
+import argparse
+from contextlib import contextmanager
+import gc
+import glob
+import gzip
+import json
+import os
+import sys
+from cStringIO import StringIO
+from timeit import Timer
+import zlib
+
+import numpy
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from pymclevel import nbt
+from pymclevel.regionfile import MCRegionFile
 
 __author__ = 'Rio'
 
-import pymclevel.nbt as nbt
+# name, path, little endian, header bytes to strip
+CORPUS = [
+    ("AnvilChunk.dat", "testfiles/AnvilChunk.dat", False, 0),
+    ("TileTicks.nbt", "testfiles/TileTicks.nbt", False, 0),
+    ("level.dat", "testfiles/AnvilWorld/level.dat", False, 0),
+    ("station.schematic", "testfiles/station.schematic", False, 0),
+    ("Commandblock.schematic", "testfiles/Commandblock.schematic", False, 0),
+    ("pocket level.dat", "testfiles/PocketLeveldbWorld/level.dat", True, 8),
+]
 
-from timeit import timeit
+REGION_GLOB = "testfiles/AnvilWorld/region/*.mca"
+REGION_CHUNKS = 32
 
-path = "testfiles/TileTicks.nbt"
-test_data = file(path, "rb").read()
+MIN_TIME = 0.1
+REPEAT = 3
 
-test_file = None
-resaved_test_file = None
+OPERATIONS = ["load", "load lazy", "load gzip", "load deflate", "save", "save gzip", "save deflate"]
 
 
-def load_file():
-    global test_file
-    test_file = nbt.load(buf=test_data)
+class Backend(object):
+    def __init__(self, name, load, littleEndianNBT):
+        self.name = name
+        self.load = load
+        self.littleEndianNBT = littleEndianNBT
 
+    @contextmanager
+    def byteOrder(self, littleEndian):
+        if littleEndian:
+            with self.littleEndianNBT():
+                yield
+        else:
+            yield
 
-def save_file():
-    global resaved_test_file
-    resaved_test_file = test_file.save(compressed=False)
-    # resaved_test_file = test_file.save(buf=s)
-    # resaved_test_file = s.getvalue()
 
+def backends():
+    found = []
+    if nbt._cython_nbt is not None:
+        found.append(Backend("cython", nbt._cython_nbt.load, nbt._cython_nbt.littleEndianNBT))
+    found.append(Backend("python", nbt._py_load, nbt._py_littleEndianNBT))
+    return found
 
-print "File: ", path
-print "Load: %0.1f ms" % (timeit(load_file, number=1) * 1000)
-print "Save: %0.1f ms" % (timeit(save_file, number=1) * 1000)
-print "Length: ", len(resaved_test_file)
 
-assert test_data == resaved_test_file
-__author__ = 'Rio'
+def synthetic_chunk():
+    """
+    A chunk shaped like a populated Anvil chunk, for when the testfiles directory is not available.
+    """
+    level = nbt.TAG_Compound()
+    level["xPos"] = nbt.TAG_Int(3)
+    level["zPos"] = nbt.TAG_Int(-7)
+    level["LastUpdate"] = nbt.TAG_Long(123456789)
+    level["HeightMap"] = nbt.TAG_Int_Array(numpy.arange(256, dtype='uint32'))
+    level["Biomes"] = nbt.TAG_Byte_Array(numpy.zeros(256, dtype='uint8'))
+
+    sections = nbt.TAG_List()
+    for y in range(8):
+        section = nbt.TAG_Compound()
+        section["Y"] = nbt.TAG_Byte(y)
+        section["Blocks"] = nbt.TAG_Byte_Array(numpy.random.randint(0, 255, 4096).astype('uint8'))
+        for name in ("Data", "SkyLight", "BlockLight"):
+            section[name] = nbt.TAG_Byte_Array(numpy.random.randint(0, 255, 2048).astype('uint8'))
+        sections.append(section)
+    level["Sections"] = sections
+
+    entities = nbt.TAG_List()
+    for i in range(40):
+        entity = nbt.TAG_Compound()
+        entity["id"] = nbt.TAG_String(u"Zombie")
+        entity["Pos"] = nbt.TAG_List([nbt.TAG_Double(i + 0.5), nbt.TAG_Double(64.0), nbt.TAG_Double(-i - 0.5)])
+        entity["Motion"] = nbt.TAG_List([nbt.TAG_Double(0.0)] * 3)
+        entity["Rotation"] = nbt.TAG_List([nbt.TAG_Float(90.0), nbt.TAG_Float(0.0)])
+        entity["Health"] = nbt.TAG_Short(20)
+        entity["OnGround"] = nbt.TAG_Byte(1)
+        entities.append(entity)
+    level["Entities"] = entities
+
+    tileEntities = nbt.TAG_List()
+    for i in range(40):
+        chest = nbt.TAG_Compound()
+        chest["id"] = nbt.TAG_String(u"Chest")
+        chest["x"] = nbt.TAG_Int(i)
+        chest["y"] = nbt.TAG_Int(64)
+        chest["z"] = nbt.TAG_Int(i)
+        items = nbt.TAG_List()
+        for slot in range(27):
+            item = nbt.TAG_Compound()
+            item["id"] = nbt.TAG_Short(slot + 1)
+            item["Damage"] = nbt.TAG_Short(0)
+            item["Count"] = nbt.TAG_Byte(64)
+            item["Slot"] = nbt.TAG_Byte(slot)
+            items.append(item)
+        chest["Items"] = items
+        tileEntities.append(chest)
+    level["TileEntities"] = tileEntities
+
+    root = nbt.TAG_Compound()
+    root["Level"] = level
+    return root
+
+
+def load_corpus(paths=()):
+    """
+    Returns a list of (name, [uncompressed NBT bytes], little endian).
+    """
+    corpus = []
+    for name, path, littleEndian, header in CORPUS:
+        if os.path.exists(path):
+            corpus.append((name, [nbt.try_gunzip(file(path, "rb").read())[header:]], littleEndian))
+        else:
+            print "Skipping %s: %s not found" % (name, path)
+
+    regions = sorted(glob.glob(REGION_GLOB))
+    if regions:
+        region = MCRegionFile(regions[0], (0, 0))
+        chunks = []
+        for cx in range(32):
+            for cz in range(32):
+                if len(chunks) < REGION_CHUNKS and region.containsChunk(cx, cz):
+                    chunks.append(region.readChunk(cx, cz))
+        region.close()
+        corpus.append(("%d region chunks" % len(chunks), chunks, False))
+    else:
+        print "Skipping region chunks: %s not found" % REGION_GLOB
+
+    for path in paths:
+        corpus.append((os.path.basename(path), [nbt.try_gunzip(file(path, "rb").read())], False))
+
+    random_state = numpy.random.get_state()
+    numpy.random.seed(0)
+    tag = synthetic_chunk()
+    numpy.random.set_state(random_state)
+    corpus.append(("synthetic chunk", [tag.save(compressed=False)], False))
+    with nbt.littleEndianNBT():
+        corpus.append(("synthetic pocket chunk", [tag.save(compressed=False)], True))
+
+    return corpus
+
+
+def gzipped(data):
+    gzio = StringIO()
+    gz = gzip.GzipFile(fileobj=gzio, mode='wb')
+    gz.write(data)
+    gz.close()
+    return gzio.getvalue()
+
+
+def count_tags(tag):
+    if tag.tagID in (nbt.TAG_COMPOUND, nbt.TAG_LIST):
+        return 1 + sum(count_tags(t) for t in tag.value)
+    return 1
+
+
+def objects_per_tag(load, blobs):
+    gc.collect()
+    gc.disable()
+    try:
+        before = len(gc.get_objects())
+        tags = [load(buf=data) for data in blobs]
+        allocated = len(gc.get_objects()) - before
+    finally:
+        gc.enable()
+    return float(allocated) / sum(count_tags(t) for t in tags)
+
+
+def throughput(func, size):
+    timer = Timer(func)
+    number = 1
+    while timer.timeit(number) < MIN_TIME / 10 and number < 100000:
+        number *= 10
+    number = max(1, int(number * MIN_TIME / max(timer.timeit(number), 1e-9)))
+    best = min(timer.repeat(REPEAT, number)) / number
+    return size / best / 1e6
+
+
+def bench_item(backend, blobs, littleEndian):
+    size = sum(len(data) for data in blobs)
+    gzip_blobs = [gzipped(data) for data in blobs]
+    deflate_blobs = [zlib.compress(data) for data in blobs]
+    load = backend.load
+
+    with backend.byteOrder(littleEndian):
+        tags = [load(buf=data) for data in blobs]
+        result = {
+            "load": throughput(lambda: [load(buf=data) for data in blobs], size),
+            "load lazy": throughput(lambda: [load(buf=data, lazy=True) for data in blobs], size),
+            "load gzip": throughput(lambda: [load(buf=data) for data in gzip_blobs], size),
+            "load deflate": throughput(lambda: [load(buf=zlib.decompress(data)) for data in deflate_blobs], size),
+            "save": throughput(lambda: [tag.save(compressed=False) for tag in tags], size),
+            "save gzip": throughput(lambda: [tag.save(compressed=True) for tag in tags], size),
+            "save deflate": throughput(lambda: [zlib.compress(tag.save(compressed=False)) for tag in tags], size),
+            "objects/tag": objects_per_tag(load, blobs),
+            "roundtrip": all(tag.save(compressed=False) == data for tag, data in zip(tags, blobs)),
+        }
+    return result
+
+
+def best(results):
+    """
+    Combines the results of several passes over the same item, keeping the highest throughput and the lowest
+    allocation count seen.
+    """
+    result = dict(results[0])
+    for other in results[1:]:
+        for op in OPERATIONS:
+            result[op] = max(result[op], other[op])
+        result["objects/tag"] = min(result["objects/tag"], other["objects/tag"])
+        result["roundtrip"] = result["roundtrip"] and other["roundtrip"]
+    return result
+
+
+def run(corpus, backendNames=None, passes=1):
+    results = {}
+    for backend in backends():
+        if backendNames and backend.name not in backendNames:
+            continue
+        passResults = [[bench_item(backend, blobs, littleEndian) for name, blobs, littleEndian in corpus]
+                       for i in range(passes)]
+        print
+        print "Backend: %s" % backend.name
+        print "%-28s %8s " % ("", "KB") + " ".join("%12s" % op for op in OPERATIONS) + " %11s" % "objects/tag"
+        for (name, blobs, littleEndian), itemResults in zip(corpus, zip(*passResults)):
+            result = best(itemResults)
+            results["%s/%s" % (backend.name, name)] = result
+            print "%-28s %8.1f " % (name[:28], sum(len(data) for data in blobs) / 1024.) + \
+                  " ".join("%7.1f MB/s" % result[op] for op in OPERATIONS) + \
+                  " %11.2f" % result["objects/tag"] + ("" if result["roundtrip"] else "  (did not round-trip)")
+    return results
+
+
+def compare(results, baseline, threshold):
+    """
+    Returns a list of descriptions of results that are worse than the baseline by more than threshold.
+    """
+    regressions = []
+    for key, result in sorted(results.iteritems()):
+        base = baseline.get(key)
+        if base is None:
+            continue
+        for op in OPERATIONS:
+            if op in base and result[op] < base[op] * (1 - threshold):
+                regressions.append("%s %s: %.1f MB/s, baseline %.1f MB/s" % (key, op, result[op], base[op]))
+        if "objects/tag" in base and result["objects/tag"] > base["objects/tag"] * (1 + threshold):
+            regressions.append("%s objects/tag: %.2f, baseline %.2f" % (key, result["objects/tag"],
+                                                                        base["objects/tag"]))
+        if base.get("roundtrip") and not result["roundtrip"]:
+            regressions.append("%s no longer round-trips" % key)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark NBT loading and saving.")
+    parser.add_argument("files", nargs="*", help="Extra big-endian NBT files to add to the corpus")
+    parser.add_argument("--backend", action="append", choices=["cython", "python"],
+                        help="Only run this backend (may be repeated)")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument("--save", help="Write the results to this JSON file")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed fractional slowdown before a result counts as a regression")
+    parser.add_argument("--passes", type=int, default=3,
+                        help="Number of runs over the corpus to take the best result of")
+    args = parser.parse_args(argv)
+
+    results = run(load_corpus(args.files), args.backend, args.passes)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        print
+        if regressions:
+            print "Regressions against %s:" % args.baseline
+            for r in regressions:
+                print "  " + r
+            return 1
+        print "No regressions against %s" % args.baseline
+
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,208 @@
+import imp
+import os
+import shutil
+import unittest
+
+from pymclevel.box import BoundingBox
+from pymclevel.infiniteworld import MCInfdevOldLevel
+from pymclevel.mclevelbase import exhaust
+from pymclevel import nbt
+from templevel import mktemp
+
+try:
+    from editortools.operation import Operation
+except ImportError:
+    # the editor's modules need pygame and PyOpenGL
+    Operation = None
+
+__author__ = 'Rio'
+
+root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class TestUndoJournal(unittest.TestCase):
+    def setUp(self):
+        self.temppath = mktemp("UndoJournal")
+        self.level = MCInfdevOldLevel(filename=self.temppath, create=True)
+        for cx in range(2):
+            for cz in range(2):
+                self.level.createChunk(cx, cz)
+                ch = self.level.getChunk(cx, cz)
+                ch.Blocks[:, :, 0:64] = 1
+                ch.dirty = True
+        self.level.saveInPlace()
+
+    def tearDown(self):
+        self.level.close()
+        shutil.rmtree(self.temppath)
+
+    def testUndoRedo(self):
+        changeset = self.level.undoJournal.begin()
+        for cx in range(2):
+            self.level.getChunk(cx, 0).Blocks[:, 0:4, 60:68] = self.level.materials.Glass.ID
+        self.level.getChunk(1, 1)  # read but not changed
+        self.level.getChunk(0, 0).Entities.append(nbt.TAG_Compound([nbt.TAG_String(u"Pig", "id")]))
+        changeset.commit()
+
+        assert sorted(changeset.chunkPositions) == [(0, 0), (1, 0)]
+        # only the sections at y=48 and y=64 changed, and the entities of chunk (0, 0)
+        assert sorted(changeset._changed[0, 0]) == [("Blocks", 48), ("Blocks", 64), ("Entities", None)]
+
+        changeset.undo()
+        ch = self.level.getChunk(0, 0)
+        assert (ch.Blocks[:, :, 0:64] == 1).all()
+        assert not ch.Blocks[:, :, 64:].any()
+        assert len(ch.Entities) == 0
+
+        changeset.redo()
+        ch = self.level.getChunk(1, 0)
+        assert (ch.Blocks[0:4, 0:4, 60:68] == self.level.materials.Glass.ID).all()
+        assert len(self.level.getChunk(0, 0).Entities) == 1
+
+    def testNewChunk(self):
+        changeset = self.level.undoJournal.begin()
+        self.level.createChunk(5, 5)
+        self.level.getChunk(5, 5).Blocks[0, 0, 10] = 7
+        changeset.commit()
+
+        changeset.undo()
+        assert not self.level.getChunk(5, 5).Blocks.any()
+        changeset.redo()
+        assert self.level.getChunk(5, 5).Blocks[0, 0, 10] == 7
+
+    def sourceLevel(self):
+        self.sourcePath = mktemp("UndoJournalSource")
+        source = MCInfdevOldLevel(filename=self.sourcePath, create=True)
+        for cx in range(2):
+            source.createChunk(cx, 0)
+            ch = source.getChunk(cx, 0)
+            ch.Blocks[:, :, 0:100] = 5
+            ch.Entities.append(nbt.TAG_Compound([nbt.TAG_String(u"Pig", "id")]))
+            ch.dirty = True
+        source.saveInPlace()
+        return source
+
+    def testCopiedChunk(self):
+        source = self.sourceLevel()
+        try:
+            # chunks replaced whole, without their arrays ever being decoded
+            self.level.close()
+            self.level = MCInfdevOldLevel(filename=self.temppath)
+            changeset = self.level.undoJournal.begin()
+            self.level.copyChunkFrom(source, 0, 0)
+            self.level.copyChunkFromOffset(source, 1, 0, 1, 1, lambda levelTag: None)
+            changeset.commit()
+            assert self.level.getChunk(0, 0).Blocks[0, 0, 0] == 5
+            assert sorted(changeset.chunkPositions) == [(0, 0), (1, 1)]
+
+            changeset.undo()
+            for cPos in (0, 0), (1, 1):
+                ch = self.level.getChunk(*cPos)
+                assert (ch.Blocks[:, :, 0:64] == 1).all()
+                assert not ch.Blocks[:, :, 64:].any()
+                assert len(ch.Entities) == 0
+
+            changeset.redo()
+            assert (self.level.getChunk(1, 1).Blocks[:, :, 0:100] == 5).all()
+            assert len(self.level.getChunk(0, 0).Entities) == 1
+        finally:
+            source.close()
+            shutil.rmtree(self.sourcePath)
+
+    def testSpill(self):
+        self.level.undoJournal.memoryLimit = 0
+        changeset = self.level.undoJournal.begin()
+        for x in range(32):
+            for z in range(32):
+                self.level.setBlockAt(x, 5, z, self.level.materials.Glass.ID)
+        changeset.commit()
+        assert changeset.memoryUsed == 0
+
+        changeset.undo()
+        assert (self.level.getChunk(1, 1).Blocks[:, :, 0:16] == 1).all()
+        changeset.redo()
+        assert (self.level.getChunk(1, 1).Blocks[:, :, 5] == self.level.materials.Glass.ID).all()
+
+
+class FakeEditor(object):
+    def __init__(self, level):
+        self.level = level
+        self.invalidated = set()
+
+    def invalidateChunks(self, chunks):
+        self.invalidated.update(chunks)
+
+
+def loadFloodFill():
+    brush = imp.load_source("floodfill_brush", os.path.join(root, "stock-brushes", "Flood Fill.py"))
+    brush.showProgress = lambda title, progressIter, cancel=False: exhaust(progressIter)
+    return brush
+
+
+@unittest.skipIf(Operation is None, "the editor's modules can't be imported")
+class TestOperationUndo(unittest.TestCase):
+    def setUp(self):
+        self.temppath = mktemp("OperationUndo")
+        self.level = MCInfdevOldLevel(filename=self.temppath, create=True)
+        self.stone = self.level.materials.Stone.ID
+        self.glass = self.level.materials.Glass
+        for cx in range(2):
+            for cz in range(2):
+                self.level.createChunk(cx, cz)
+                self.level.getChunk(cx, cz).Blocks[:, :, 0:4] = self.stone
+                self.level.getChunk(cx, cz).dirty = True
+        self.level.saveInPlace()
+        self.editor = FakeEditor(self.level)
+
+    def tearDown(self):
+        self.level.close()
+        shutil.rmtree(self.temppath)
+
+    def perform(self, op):
+        # as LevelEditor.addOperation does
+        try:
+            op.perform()
+        finally:
+            op.commitUndo()
+
+    def testFloodFillUndoRedo(self):
+        level = self.level
+        brush = loadFloodFill()
+        glass = self.glass
+
+        class FloodFillOperation(Operation):
+            """ Creates a chunk of stone next to the others, then floods all of the stone with glass. """
+            options = {'Block': glass, 'Indiscriminate': False}
+
+            def perform(self, recordUndo=True):
+                if recordUndo:
+                    self.undoLevel = self.extractUndo(self.level, BoundingBox((0, 0, 0), (1, 1, 1)))
+                self.level.createChunk(2, 0)
+                self.level.getChunk(2, 0).Blocks[:, :, 0:4] = level.materials.Stone.ID
+                brush.apply(brush, self, (0, 0, 0))
+
+        op = FloodFillOperation(self.editor, level)
+        self.perform(op)
+        assert not level.undoJournal.recording
+        for cx, cz in [(0, 0), (1, 1), (2, 0)]:
+            assert (level.getChunk(cx, cz).Blocks[:, :, 0:4] == glass.ID).all()
+        assert sorted(op.undoLevel.chunkPositions) == [(0, 0), (0, 1), (1, 0), (1, 1), (2, 0)]
+
+        op.undo()
+        for cx, cz in [(0, 0), (1, 1)]:
+            assert (level.getChunk(cx, cz).Blocks[:, :, 0:4] == self.stone).all()
+        assert not level.getChunk(2, 0).Blocks.any()
+        assert self.editor.invalidated >= set([(0, 0), (1, 1), (2, 0)])
+
+        op.redo()
+        for cx, cz in [(0, 0), (1, 1), (2, 0)]:
+            assert (level.getChunk(cx, cz).Blocks[:, :, 0:4] == glass.ID).all()
+        assert not level.getChunk(2, 0).Blocks[:, :, 4:].any()
+
+        # a second round trip, after the level has been saved
+        level.saveInPlace()
+        op.undo()
+        assert (level.getChunk(0, 1).Blocks[:, :, 0:4] == self.stone).all()
+        assert not level.getChunk(2, 0).Blocks.any()
+        op.redo()
+        assert (level.getChunk(2, 0).Blocks[:, :, 0:4] == glass.ID).all()
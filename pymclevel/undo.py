@@ -0,0 +1,341 @@
+"""
+Undo journal for chunked worlds.
+
+Rather than copying every chunk an operation might touch into a temporary world before it runs, the journal takes a
+compressed snapshot of each chunk the first time the level hands it out while recording. When the operation is
+committed, only the 16-block-high sections, biome and height maps and entity lists that actually changed are kept,
+as compressed before and after copies. Undo and redo write those copies back, so their cost follows what the
+operation changed rather than the size of its bounding box.
+
+Snapshots and changesets are kept in memory until the journal holds more than UndoJournal.memoryLimit bytes, after
+which the oldest are moved to temporary files.
+"""
+
+import logging
+import tempfile
+import weakref
+import zlib
+
+from numpy import array_equal, fromstring, zeros
+
+import nbt
+
+log = logging.getLogger(__name__)
+
+SECTION_ARRAYS = ("Blocks", "Data", "SkyLight", "BlockLight")
+MAP_ARRAYS = ("Biomes", "HeightMap")
+TAG_LISTS = ("Entities", "TileEntities", "TileTicks")
+
+
+class _SpillStore(object):
+    """
+    Maps keys to strings, keeping them in memory until spill() appends them all to a temporary file.
+    """
+
+    def __init__(self, folder=None):
+        self.folder = folder
+        self.memoryUsed = 0
+        self._values = {}
+        self._offsets = {}
+        self._file = None
+
+    def __setitem__(self, key, value):
+        self._values[key] = value
+        self.memoryUsed += len(value)
+
+    def __getitem__(self, key):
+        value = self._values.get(key)
+        if value is None:
+            offset, length = self._offsets[key]
+            self._file.seek(offset)
+            value = self._file.read(length)
+        return value
+
+    def __contains__(self, key):
+        return key in self._values or key in self._offsets
+
+    def spill(self):
+        if not self._values:
+            return
+        if self._file is None:
+            self._file = tempfile.TemporaryFile(prefix="mceditundo", dir=self.folder)
+
+        self._file.seek(0, 2)
+        offset = self._file.tell()
+        for key, value in self._values.iteritems():
+            self._file.write(value)
+            self._offsets[key] = (offset, len(value))
+            offset += len(value)
+
+        self._values = {}
+        self.memoryUsed = 0
+
+    def close(self):
+        self._values = {}
+        self._offsets = {}
+        self.memoryUsed = 0
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def _listBytes(levelTag, name):
+    root = nbt.TAG_Compound()
+    root[name] = levelTag[name] if name in levelTag else nbt.TAG_List()
+    return root.save(compressed=False)
+
+
+def _freshArray(name, shape):
+    if name == "Blocks":
+        return zeros(shape, 'uint16')
+    arr = zeros(shape, 'uint8')
+    if name == "SkyLight":
+        arr[:] = 15
+    return arr
+
+
+class UndoJournal(object):
+    """
+    Records changes made to an MCInfdevOldLevel's chunks. Call begin() before an operation changes the level and
+    commit() once it is done; begin() returns the UndoChangeset that will hold the changes.
+
+    The level calls recordChunk() whenever it hands out a chunk and recordArray() when a chunk decodes one of its
+    section arrays, so a snapshot is always taken before the caller can change anything.
+    """
+
+    memoryLimit = 64 * 1024 * 1024
+
+    def __init__(self, level, folder=None):
+        self.level = level
+        self.folder = folder
+        self._recording = None
+        # committed changesets, oldest first
+        self._changesets = []
+
+    @property
+    def recording(self):
+        return self._recording is not None
+
+    def begin(self):
+        self.commit()
+        self._recording = UndoChangeset(self)
+        return self._recording
+
+    def commit(self):
+        changeset, self._recording = self._recording, None
+        if changeset is not None:
+            changeset._finish()
+            self._changesets.append(weakref.ref(changeset))
+            self._checkMemory()
+
+    def recordChunk(self, chunkData):
+        changeset = self._recording
+        if changeset is not None and chunkData.chunkPosition not in changeset._recorded:
+            changeset._snapshotChunk(chunkData)
+            self._checkMemory()
+
+    def recordReplacedChunk(self, chunkData):
+        """
+        Record a chunk that is about to be replaced as a whole, such as by copyChunkFrom. Its arrays are decoded so
+        all of them are snapshotted, since whatever replaces it can differ in any section.
+        """
+        changeset = self._recording
+        if changeset is None:
+            return
+        self.recordChunk(chunkData)
+        names = changeset._recorded.get(chunkData.chunkPosition)
+        if names is not None:
+            for name in SECTION_ARRAYS:
+                if name not in names:
+                    # decoding the array has the chunk call recordArray
+                    getattr(chunkData, name)
+
+    def recordNewChunk(self, cx, cz):
+        """ Record that the chunk at cx, cz did not exist before it was created or copied in. """
+        changeset = self._recording
+        if changeset is not None and (cx, cz) not in changeset._recorded:
+            changeset._recorded[cx, cz] = None
+
+    def recordArray(self, chunkData, name, arr):
+        changeset = self._recording
+        if changeset is not None:
+            names = changeset._recorded.get(chunkData.chunkPosition)
+            if names is not None and name not in names:
+                changeset._snapshotArray(chunkData.chunkPosition, name, arr)
+                self._checkMemory()
+
+    def _checkMemory(self):
+        changesets = [c for c in (ref() for ref in self._changesets) if c is not None]
+        self._changesets = [weakref.ref(c) for c in changesets]
+        if self._recording is not None:
+            changesets.append(self._recording)
+
+        used = sum(c.memoryUsed for c in changesets)
+        for changeset in changesets:
+            if used <= self.memoryLimit:
+                break
+            used -= changeset.memoryUsed
+            changeset._spill()
+
+
+class UndoChangeset(object):
+    """
+    The changes made to a level between UndoJournal.begin() and commit(). undo() puts back the sections as they
+    were before, redo() puts back the sections as they were after.
+    """
+
+    def __init__(self, journal):
+        self.journal = journal
+        self.level = journal.level
+
+        # maps chunk position to the set of names snapshotted so far, or None for chunks that did not exist
+        self._recorded = {}
+        self._snapshots = _SpillStore(journal.folder)
+
+        # maps chunk position to a list of (name, y) that changed. y is None for the maps and entity lists.
+        self._changed = {}
+        self._changes = _SpillStore(journal.folder)
+
+    @property
+    def recording(self):
+        return self._snapshots is not None
+
+    @property
+    def memoryUsed(self):
+        used = self._changes.memoryUsed
+        if self._snapshots is not None:
+            used += self._snapshots.memoryUsed
+        return used
+
+    @property
+    def chunkPositions(self):
+        return self._changed.keys()
+
+    @property
+    def chunkCount(self):
+        return len(self._changed)
+
+    def commit(self):
+        if self.journal._recording is self:
+            self.journal.commit()
+
+    # --- Recording ---
+
+    def _snapshotChunk(self, chunkData):
+        cPos = chunkData.chunkPosition
+        self._recorded[cPos] = set()
+        for name in SECTION_ARRAYS:
+            if chunkData.isDecoded(name):
+                self._snapshotArray(cPos, name, getattr(chunkData, name))
+
+        levelTag = chunkData.root_tag["Level"]
+        for name in MAP_ARRAYS:
+            if name in levelTag:
+                self._snapshots[cPos + (name,)] = zlib.compress(levelTag[name].value.tostring(), 1)
+        for name in TAG_LISTS:
+            self._snapshots[cPos + (name,)] = zlib.compress(_listBytes(levelTag, name), 1)
+
+    def _snapshotArray(self, cPos, name, arr):
+        self._recorded[cPos].add(name)
+        self._snapshots[cPos + (name,)] = zlib.compress(arr.tostring(), 1)
+
+    def _before(self, cPos, name, after):
+        key = cPos + (name,)
+        if key in self._snapshots:
+            return fromstring(zlib.decompress(self._snapshots[key]), after.dtype).reshape(after.shape)
+        return None
+
+    def _addChange(self, cPos, name, y, before, after):
+        self._changed.setdefault(cPos, []).append((name, y))
+        self._changes[cPos + (name, y, 0)] = zlib.compress(before, 1)
+        self._changes[cPos + (name, y, 1)] = zlib.compress(after, 1)
+
+    def _finish(self):
+        level = self.level
+        for cPos, names in self._recorded.iteritems():
+            if not level.containsChunk(*cPos):
+                continue
+            chunkData = level._getChunkData(*cPos)
+            levelTag = chunkData.root_tag["Level"]
+
+            for name in SECTION_ARRAYS:
+                if names is not None and name not in names:
+                    # never decoded, so never changed
+                    continue
+                after = getattr(chunkData, name)
+                before = self._before(cPos, name, after)
+                if before is None:
+                    before = _freshArray(name, after.shape)
+                for y in range(0, after.shape[2], 16):
+                    if not array_equal(before[..., y:y + 16], after[..., y:y + 16]):
+                        self._addChange(cPos, name, y, before[..., y:y + 16].tostring(), after[..., y:y + 16].tostring())
+
+            for name in MAP_ARRAYS:
+                if name not in levelTag:
+                    continue
+                after = levelTag[name].value
+                before = self._before(cPos, name, after)
+                if before is None:
+                    before = zeros(after.shape, after.dtype)
+                    if name == "Biomes":
+                        before[:] = -1
+                if not array_equal(before, after):
+                    self._addChange(cPos, name, None, before.tostring(), after.tostring())
+
+            for name in TAG_LISTS:
+                key = cPos + (name,)
+                before = zlib.decompress(self._snapshots[key]) if key in self._snapshots else _listBytes({}, name)
+                after = _listBytes(levelTag, name)
+                if before != after:
+                    self._addChange(cPos, name, None, before, after)
+
+        self._snapshots.close()
+        self._snapshots = None
+        self._recorded = None
+        log.debug(u"Undo journal: %d chunks changed, %d bytes", len(self._changed), self.memoryUsed)
+
+    def _spill(self):
+        self._changes.spill()
+        if self._snapshots is not None:
+            self._snapshots.spill()
+
+    # --- Undo and redo ---
+
+    def undo(self):
+        for _ in self.undoIter():
+            pass
+
+    def redo(self):
+        for _ in self.redoIter():
+            pass
+
+    def undoIter(self):
+        return self._applyIter(0, "Undoing...")
+
+    def redoIter(self):
+        return self._applyIter(1, "Redoing...")
+
+    def _applyIter(self, which, status):
+        # writing the changes back must not be recorded into an open changeset
+        self.journal.commit()
+        level = self.level
+        count = len(self._changed)
+        for i, (cPos, changes) in enumerate(self._changed.iteritems()):
+            if not level.containsChunk(*cPos):
+                level.createChunk(*cPos)
+            chunk = level.getChunk(*cPos)
+            levelTag = chunk.root_tag["Level"]
+
+            for name, y in changes:
+                data = zlib.decompress(self._changes[cPos + (name, y, which)])
+                if name in TAG_LISTS:
+                    levelTag[name] = nbt.load(buf=data)[name]
+                elif name in MAP_ARRAYS:
+                    arr = levelTag[name].value
+                    arr[:] = fromstring(data, arr.dtype).reshape(arr.shape)
+                else:
+                    arr = getattr(chunk, name)[..., y:y + 16]
+                    arr[:] = fromstring(data, arr.dtype).reshape(arr.shape)
+
+            chunk.dirty = True
+            yield i, count, status
@@ -2,7 +2,6 @@ from pymclevel.materials import Block
 from pymclevel.entity import TileEntity
 from editortools.brush import createBrushMask
 import numpy
-from editortools.operation import mkundotemp
 from albow import showProgress
 import pymclevel
 import datetime
@@ -29,19 +28,16 @@ def createTileEntities(tileEntityTag, level):
     except (pymclevel.ChunkNotPresent, pymclevel.ChunkMalformed):
         return
 
-    chunk.TileEntities.append(tileEntityTag)
-    chunk._fakeEntities = None
+    chunk.addTileEntity(tileEntityTag)
 
 def apply(self, op, point):
 
-    undoLevel = pymclevel.MCInfdevOldLevel(mkundotemp(), create=True)
+    # The fill can spread outside the brush's dirty box. The level's undo journal records every chunk it touches,
+    # so only the chunks that need redrawing are tracked here.
     dirtyChunks = set()
 
     def saveUndoChunk(cx, cz):
-        if (cx, cz) in dirtyChunks:
-            return
         dirtyChunks.add((cx, cz))
-        undoLevel.copyChunkFrom(op.level, cx, cz)
 
     doomedBlock = op.level.blockAt(*point)
     doomedBlockData = op.level.blockDataAt(*point)
@@ -112,4 +108,3 @@ def apply(self, op, point):
 
     showProgress("Flood fill...", spread([point]), cancel=True)
     op.editor.invalidateChunks(dirtyChunks)
-    op.undoLevel = undoLevel